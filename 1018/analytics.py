@@ -0,0 +1,286 @@
+"""
+Coverage analytics over incidents, defenses and MITRE domains.
+
+Every question is answered with sparse indicator matrices instead of splitting
+matched_defense_ids strings per question:
+
+    X  incidents x defenses    from mapping_matrix.npz (or built from the mapping CSV)
+    D  incidents x domains     from mitre_classification ("Domain: Subdomain | ...")
+    P  incidents x deployers   from deployer (JSON list)
+    T  defenses  x tactics     from the catalog's Tactic column
+
+    co-occurrence            X.T @ X   (pair counts, Jaccard, lift)
+    MITRE coverage           D.T @ (X.sum(1) > 0), D.T @ X for the top defenses per domain
+    top defenses / deployer  P.T @ X
+    tactic representation    X.sum(0) @ T vs the catalog's share of techniques per tactic
+
+Output is one JSON report (coverage_report.json); a short summary is printed.
+
+Usage:
+  python analytics.py
+  python analytics.py --incidents merged_incident_data.csv --mapping llm_defense_mapping.csv --top 15
+  python analytics.py --matrix site/mapping_matrix.npz --out site/coverage_report.json
+"""
+
+import argparse
+import json
+import os
+import time
+from contextlib import nullcontext
+from typing import List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from instrumentation import start_run
+from mapping_matrix import DEFENSES_CSV, MAPPING_CSV, MATRIX_FILE, MappingMatrix, build_matrix, load_matrix
+
+INCIDENTS_CSV = 'merged_incident_data.csv'
+REPORT_JSON = 'coverage_report.json'
+REPORT_VERSION = 1
+TOP_N = 10              # Pairs / defenses listed per section
+TOP_DEPLOYERS = 20      # Deployers with the most incidents get a top-defenses list
+SKEW = 1.25             # Tactic share / expected share above SKEW (or below 1/SKEW) is flagged
+CLASS_SEP = ' | '       # combine.py joins an incident's MITRE classifications with this
+
+
+def indicator(codes: np.ndarray, rows: np.ndarray, n_rows: int, n_cols: int) -> sparse.csr_matrix:
+    """0/1 matrix with a one at (rows[k], codes[k]); duplicate pairs count once."""
+    m = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, codes)), shape=(n_rows, n_cols))
+    m.data[:] = 1
+    return m
+
+
+def explode_codes(values: pd.Series, split) -> tuple:
+    """(row positions, category codes, category names) for a column holding several labels per row."""
+    exploded = values.map(split).explode().dropna()
+    exploded = exploded[exploded != '']
+    codes, names = pd.factorize(exploded, sort=True)
+    return exploded.index.to_numpy(), codes, [str(n) for n in names]
+
+
+def split_classes(value) -> List[str]:
+    return [c.strip() for c in str(value or '').split(CLASS_SEP) if c.strip()]
+
+
+def split_domain(value) -> List[str]:
+    """Top-level domain of each classification ("Privacy & Security: ..." -> "Privacy & Security")."""
+    return list(dict.fromkeys(c.split(':', 1)[0].strip() for c in split_classes(value)))
+
+
+def split_deployers(value) -> List[str]:
+    """deployer as exported by combine.py: a JSON list string, or a bare name."""
+    value = str(value or '').strip()
+    if not value:
+        return []
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        return [value]
+    items = parsed if isinstance(parsed, list) else [parsed]
+    return [str(v).strip() for v in items if str(v).strip()]
+
+
+def top_per_row(counts: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k largest entries per row (ties keep column order)."""
+    if counts.shape[1] == 0:
+        return np.empty((counts.shape[0], 0), dtype=np.int64)
+    return np.argsort(-counts, axis=1, kind='stable')[:, :k]
+
+
+def catalog_frame(path: str) -> pd.DataFrame:
+    """defense_id / name / tactic from AI_Defense_Techniques.csv or defenses.json-style columns."""
+    df = pd.read_csv(path).rename(columns={'Technique ID': 'defense_id', 'Technique Name': 'name', 'Tactic': 'tactic'})
+    for column in ('name', 'tactic'):
+        if column not in df.columns:
+            df[column] = ''
+    df = df[['defense_id', 'name', 'tactic']].fillna('')
+    df['defense_id'] = df['defense_id'].astype(str).str.strip()
+    return df[df['defense_id'] != ''].drop_duplicates('defense_id').reset_index(drop=True)
+
+
+class Coverage:
+    """Aligned matrices for one (incidents, mapping, catalog) snapshot."""
+
+    def __init__(self, incidents: pd.DataFrame, matrix: MappingMatrix, catalog: pd.DataFrame):
+        self.catalog = catalog
+        self.defense_ids = catalog['defense_id'].tolist()
+        self.names = catalog['name'].tolist()
+
+        # Mapping restricted to catalog columns (error markers and made-up IDs drop out), in catalog order
+        position = {d: j for j, d in enumerate(self.defense_ids)}
+        column_pos = np.array([position.get(str(d), -1) for d in matrix.defense_ids], dtype=np.int64)
+        keep = np.flatnonzero(column_pos >= 0)
+        select = indicator(column_pos[keep], keep, len(column_pos), len(self.defense_ids))
+        self.mapping_X = (matrix.to_csr() @ select).tocsr()          # mapping rows x catalog
+        self.mapping_ids = np.asarray(matrix.incident_ids)
+
+        # The same rows aligned to the incident table (incidents without a mapping row stay empty)
+        self.incidents = incidents.reset_index(drop=True)
+        ids = self.incidents['incident_id'].to_numpy(dtype=np.int64)
+        pos = np.searchsorted(self.mapping_ids, ids)
+        pos[pos == len(self.mapping_ids)] = 0
+        found = np.flatnonzero((len(self.mapping_ids) > 0) & (self.mapping_ids[pos] == ids))
+        rows = indicator(pos[found], found, len(ids), len(self.mapping_ids))
+        self.X = (rows @ self.mapping_X).tocsr()                       # incidents x catalog
+        self.covered = np.asarray(self.X.sum(axis=1)).ravel() > 0
+
+    def cooccurrence(self, top: int = TOP_N) -> List[dict]:
+        """Defense pairs recommended together for the most incidents."""
+        X = self.mapping_X
+        n = X.shape[0]
+        freq = np.asarray(X.sum(axis=0)).ravel()
+        C = sparse.triu(X.T @ X, k=1).tocoo()
+        if C.nnz == 0:
+            return []
+        union = freq[C.row] + freq[C.col] - C.data
+        jaccard = C.data / union
+        order = np.lexsort((-jaccard, -C.data))[:top]
+        return [{'defense_ids': [self.defense_ids[C.row[k]], self.defense_ids[C.col[k]]],
+                 'names': [self.names[C.row[k]], self.names[C.col[k]]],
+                 'incidents': int(C.data[k]), 'jaccard': round(float(jaccard[k]), 4),
+                 'lift': round(float(C.data[k] * n / (freq[C.row[k]] * freq[C.col[k]])), 3)} for k in order]
+
+    def _top_defenses(self, counts: np.ndarray, top: int) -> List[List[dict]]:
+        out = []
+        for row, picks in zip(counts, top_per_row(counts, top)):
+            out.append([{'defense_id': self.defense_ids[j], 'name': self.names[j], 'incidents': int(row[j])}
+                        for j in picks if row[j] > 0])
+        return out
+
+    def by_label(self, column: str, split, top: int = TOP_N, limit: int = 0) -> List[dict]:
+        """Incidents, covered incidents and top defenses per label of a multi-valued incident column."""
+        if column not in self.incidents.columns:
+            return []
+        rows, codes, names = explode_codes(self.incidents[column], split)
+        L = indicator(codes, rows, len(self.incidents), len(names))
+        incidents = np.asarray(L.sum(axis=0)).ravel()
+        covered = L.T @ self.covered.astype(np.int32)
+        picked = np.argsort(-incidents, kind='stable')[:limit] if limit else np.arange(len(names))
+        counts = (L[:, picked].T @ self.X).toarray()                  # labels x defenses: incidents per pair
+        return [{'label': names[g], 'incidents': int(incidents[g]), 'covered': int(covered[g]),
+                 'coverage': round(float(covered[g] / incidents[g]), 4) if incidents[g] else 0.0,
+                 'top_defenses': defenses}
+                for g, defenses in zip(picked.tolist(), self._top_defenses(counts, top))]
+
+    def tactics(self, skew: float = SKEW) -> List[dict]:
+        """Share of recommendations per tactic vs the tactic's share of catalog techniques."""
+        codes, names = pd.factorize(self.catalog['tactic'].replace('', 'Unknown'), sort=True)
+        T = indicator(codes, np.arange(len(codes)), len(codes), len(names))
+        techniques = np.asarray(T.sum(axis=0)).ravel()
+        mappings = np.asarray(self.mapping_X.sum(axis=0)).ravel() @ T
+        used = (np.asarray(self.mapping_X.sum(axis=0)).ravel() > 0).astype(np.int32) @ T
+        incidents = np.asarray(((self.mapping_X @ T) > 0).sum(axis=0)).ravel()
+        share = mappings / max(mappings.sum(), 1)
+        expected = techniques / max(techniques.sum(), 1)
+        ratio = np.divide(share, expected, out=np.zeros_like(share), where=expected > 0)
+        status = np.where(ratio > skew, 'over', np.where(ratio < 1 / skew, 'under', 'balanced'))
+        return [{'tactic': str(names[t]), 'techniques': int(techniques[t]), 'techniques_used': int(used[t]),
+                 'mappings': int(mappings[t]), 'incidents': int(incidents[t]),
+                 'share': round(float(share[t]), 4), 'expected_share': round(float(expected[t]), 4),
+                 'ratio': round(float(ratio[t]), 3), 'status': str(status[t])}
+                for t in np.argsort(-ratio, kind='stable')]
+
+    def report(self, top: int = TOP_N, deployers: int = TOP_DEPLOYERS, skew: float = SKEW, metrics=None) -> dict:
+        phase = metrics.phase if metrics is not None else (lambda name: nullcontext())
+        with phase('cooccurrence'):
+            pairs = self.cooccurrence(top)
+        with phase('mitre'):
+            domains = self.by_label('mitre_classification', split_domain, top)
+            subdomains = self.by_label('mitre_classification', split_classes, min(top, 3))
+        with phase('deployers'):
+            by_deployer = self.by_label('deployer', split_deployers, top, deployers)
+        with phase('tactics'):
+            tactics = self.tactics(skew)
+        classified = self.incidents['mitre_classification'].map(split_classes).map(bool) \
+            if 'mitre_classification' in self.incidents.columns else pd.Series(False, index=self.incidents.index)
+        return {
+            'version': REPORT_VERSION,
+            'incidents': len(self.incidents),
+            'mapped_incidents': int(self.covered.sum()),
+            'unclassified_incidents': int((~classified).sum()),
+            'unclassified_unmapped': int((~classified.to_numpy() & ~self.covered).sum()),
+            'defenses': len(self.defense_ids),
+            'defenses_used': int((np.asarray(self.mapping_X.sum(axis=0)).ravel() > 0).sum()),
+            'cooccurrence': pairs,
+            'uncovered_domains': [d['label'] for d in domains if d['covered'] == 0],
+            'uncovered_subdomains': [d['label'] for d in subdomains if d['covered'] == 0],
+            'mitre_domains': domains,
+            'mitre_subdomains': subdomains,
+            'deployers': by_deployer,
+            'tactics': tactics,
+        }
+
+
+def load_inputs(incidents_path: str, mapping_path: str, matrix_path: str, defenses_path: str):
+    """(incidents, matrix, catalog); the matrix file is preferred when present, else built from the CSV."""
+    incidents = pd.read_csv(incidents_path, usecols=lambda c: c in ('incident_id', 'deployer', 'mitre_classification'))
+    incidents = incidents.fillna('').drop_duplicates('incident_id')
+    catalog = catalog_frame(defenses_path)
+    if matrix_path and os.path.exists(matrix_path):
+        matrix, source = load_matrix(matrix_path), matrix_path
+    else:
+        mapping = pd.read_csv(mapping_path).fillna('')
+        matrix = MappingMatrix(build_matrix(mapping.to_dict(orient='records'), catalog['defense_id']))
+        source = mapping_path
+    return incidents, matrix, catalog, source
+
+
+def print_summary(report: dict) -> None:
+    print(f"✅ {report['mapped_incidents']}/{report['incidents']} incidents have recommendations; "
+          f"{report['defenses_used']}/{report['defenses']} defenses recommended at least once")
+    if report['cooccurrence']:
+        print("🔗 Most frequent defense pairs:")
+        for p in report['cooccurrence'][:5]:
+            print(f"   {' + '.join(p['defense_ids']):<32} {p['incidents']:>5} incidents  "
+                  f"jaccard {p['jaccard']:.2f}  lift {p['lift']:.1f}")
+    if report['uncovered_domains'] or report['uncovered_subdomains']:
+        print(f"⚠️  MITRE domains without recommendations: {', '.join(report['uncovered_domains']) or '-'}")
+        print(f"⚠️  MITRE subdomains without recommendations: {len(report['uncovered_subdomains'])}")
+    else:
+        print("✅ Every MITRE domain has at least one recommended defense")
+    for d in report['mitre_domains']:
+        print(f"   {d['label'][:48]:<50}{d['covered']:>5}/{d['incidents']:<5} covered ({d['coverage']:.0%})")
+    print("📊 Tactics (share of recommendations vs share of catalog techniques):")
+    for t in report['tactics']:
+        flag = {'over': '▲ over', 'under': '▼ under'}.get(t['status'], '')
+        print(f"   {t['tactic']:<20}{t['share']:>7.1%} vs {t['expected_share']:>6.1%}  x{t['ratio']:<6} {flag}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--incidents", default=INCIDENTS_CSV)
+    ap.add_argument("--mapping", default=MAPPING_CSV, help="used when the matrix file does not exist")
+    ap.add_argument("--matrix", default=MATRIX_FILE, help="mapping_matrix.npz from mapping_matrix.py / tojson.py --matrix")
+    ap.add_argument("--defenses", default=DEFENSES_CSV)
+    ap.add_argument("--out", default=REPORT_JSON)
+    ap.add_argument("--top", type=int, default=TOP_N, help="pairs / defenses listed per section")
+    ap.add_argument("--deployers", type=int, default=TOP_DEPLOYERS, help="deployers to report (by incident count)")
+    ap.add_argument("--skew", type=float, default=SKEW, help="tactic share ratio flagged as over/under-represented")
+    args = ap.parse_args()
+
+    metrics = start_run('analytics')
+    start = time.perf_counter()
+    with metrics.phase('load'):
+        incidents, matrix, catalog, source = load_inputs(args.incidents, args.mapping, args.matrix, args.defenses)
+    with metrics.phase('align'):
+        coverage = Coverage(incidents, matrix, catalog)
+    report = coverage.report(args.top, args.deployers, args.skew, metrics)
+    report['mapping_source'] = source
+    report['seconds'] = round(time.perf_counter() - start, 4)
+    report['phases_ms'] = {k: round(v['wall_s'] * 1000, 2) for k, v in metrics.phases.items()}
+
+    tmp = args.out + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, args.out)
+
+    print_summary(report)
+    print(f"⏱️ Report built in {report['seconds'] * 1000:.0f} ms (mapping from {source}) -> {args.out}")
+    metrics.add_rows(len(incidents))
+    metrics.finish(success=True)
+
+
+if __name__ == "__main__":
+    main()
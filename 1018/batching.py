@@ -0,0 +1,169 @@
+"""
+Multi-incident batching for generate_mapping.py (--batch-tokens).
+
+Several incidents are packed into one request under a token budget, with the
+defense catalog sent once per batch. The model answers with an array of
+{incident_id, matched_defense_ids}, which is demultiplexed back into
+per-incident rows. A batch that comes back malformed or missing incidents is
+split in half and retried until single incidents remain.
+"""
+
+import json
+from typing import Callable, List, Sequence
+
+# Upper bound on incidents per request (keeps each answer array short)
+MAX_BATCH_SIZE = 20
+
+BATCH_PROMPT_TEMPLATE = """
+    You are a top-tier AI security analyst. Your task is to analyze each AI incident below and, for EACH incident, select 3 to 5 AIDEFEND defense technique IDs that are most relevant and effective at mitigating it.
+
+    【Available AIDEFEND Defense List】
+    You MUST strictly choose only from the IDs in this list. **Do NOT fabricate IDs**:
+    {defense_list}
+
+    【AI Incidents】
+    {incident_blocks}
+
+    【Task Requirements】
+    1. For each incident, identify the core attack mechanism and affected AI components.
+    2. For each incident, select 3 to 5 defense technique IDs from the list that best mitigate or prevent it.
+    3. Output MUST be a pure JSON array with exactly one {{"incident_id", "matched_defense_ids"}} object per incident above.
+    """
+
+INCIDENT_BLOCK_TEMPLATE = """
+    ===== Incident ID: {incident_id} =====
+    Title: {incident_title}
+    Deployer / Developer: {deployer} / {developer}
+    MITRE Risk Classification (reference only): {mitre_classification}
+    Detailed Report:
+    ---
+    {full_report_text}
+    ---
+"""
+
+BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "incident_id": {"type": "INTEGER"},
+            "matched_defense_ids": {
+                "type": "ARRAY",
+                "description": "List of 3 to 5 matching AIDEFEND Technique IDs.",
+                "items": {"type": "STRING"},
+            },
+        },
+        "required": ["incident_id", "matched_defense_ids"],
+    },
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough 4-characters-per-token estimate (good enough for packing decisions)."""
+    return len(text) // 4 + 1
+
+
+def incident_block(incident_data: dict) -> str:
+    return INCIDENT_BLOCK_TEMPLATE.format(
+        incident_id=incident_data['incident_id'],
+        incident_title=incident_data['incident_title'],
+        deployer=incident_data['deployer'],
+        developer=incident_data['developer'],
+        mitre_classification=incident_data.get('mitre_classification', 'N/A'),
+        full_report_text=incident_data['full_report_text'],
+    )
+
+
+def generate_batch_prompt(incidents: Sequence[dict], defense_list: str) -> str:
+    return BATCH_PROMPT_TEMPLATE.format(
+        defense_list=defense_list,
+        incident_blocks="".join(incident_block(i) for i in incidents),
+    )
+
+
+def pack_batches(sizes: Sequence[int], budget: int, fixed_tokens: int,
+                 max_batch: int = MAX_BATCH_SIZE) -> List[List[int]]:
+    """
+    Greedy in-order packing: returns lists of item indices whose sizes plus the
+    per-request fixed cost (instructions + catalog) fit in `budget`.
+    An item that alone exceeds the budget still gets its own batch.
+    """
+    batches, current, used = [], [], fixed_tokens
+    for i, size in enumerate(sizes):
+        if current and (used + size > budget or len(current) >= max_batch):
+            batches.append(current)
+            current, used = [], fixed_tokens
+        current.append(i)
+        used += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchMapper:
+    """Sends packed batches through a MappingEngine and tracks calls/tokens for the savings report."""
+
+    def __init__(self, engine, defense_list: str, on_incident: Callable[[dict, dict], None] = None):
+        self.engine = engine
+        self.defense_list = defense_list
+        self.on_incident = on_incident
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.splits = 0
+
+    async def map_batch(self, incidents: List[dict]) -> List[dict]:
+        """Map one batch; splits and retries on partial or malformed answers."""
+        prompt = generate_batch_prompt(incidents, self.defense_list)
+        self.calls += 1
+        self.prompt_tokens += estimate_tokens(prompt)
+        try:
+            reply = await self.engine.generate(prompt, BATCH_RESPONSE_SCHEMA)
+        except Exception as e:
+            if len(incidents) > 1:
+                return await self._split(incidents, f"request failed: {e}")
+            print(f"   ❌ Failed to process incident {incidents[0]['incident_id']}: {e}")
+            return self._emit(incidents, {}, "LLM_ERROR")
+
+        by_id = {}
+        try:
+            for item in json.loads(reply.text):
+                if isinstance(item.get("matched_defense_ids"), list):
+                    by_id[str(item["incident_id"])] = item["matched_defense_ids"]
+        except (ValueError, KeyError, TypeError, AttributeError):
+            by_id = {}
+
+        missing = [i for i in incidents if str(i['incident_id']) not in by_id]
+        if missing and len(incidents) > 1:
+            # Keep what came back, retry only the incidents that are missing
+            done = self._emit([i for i in incidents if str(i['incident_id']) in by_id], by_id, None)
+            return done + await self._split(missing, f"{len(missing)}/{len(incidents)} incidents missing")
+        return self._emit(incidents, by_id, "JSON_PARSE_ERROR")
+
+    async def _split(self, incidents: List[dict], reason: str) -> List[dict]:
+        self.splits += 1
+        if len(incidents) == 1:
+            return await self.map_batch(incidents)
+        mid = len(incidents) // 2
+        print(f"   ✂️  Splitting batch of {len(incidents)} ({reason})")
+        return await self.map_batch(incidents[:mid]) + await self.map_batch(incidents[mid:])
+
+    def _emit(self, incidents: List[dict], by_id: dict, error: str) -> List[dict]:
+        out = []
+        for incident in incidents:
+            ids = by_id.get(str(incident['incident_id']))
+            result = {"incident_id": incident['incident_id'],
+                      "matched_defense_ids": ids if ids is not None else [error]}
+            if self.on_incident is not None:
+                self.on_incident(incident, result)
+            out.append(result)
+        return out
+
+
+def savings_report(mapper: BatchMapper, single_prompt_tokens: int, n_incidents: int) -> str:
+    calls_saved = n_incidents - mapper.calls
+    tokens_saved = single_prompt_tokens - mapper.prompt_tokens
+    return (f"calls: {mapper.calls} batched vs {n_incidents} single "
+            f"(saved {calls_saved}, {calls_saved / max(n_incidents, 1):.0%}); "
+            f"prompt tokens (est.): {mapper.prompt_tokens:,} vs {single_prompt_tokens:,} "
+            f"(saved {tokens_saved:,}, {tokens_saved / max(single_prompt_tokens, 1):.0%}); "
+            f"splits: {mapper.splits}")
@@ -0,0 +1,165 @@
+"""
+Benchmark harness for the pipeline stages on synthetic data.
+
+Generates (or reuses) a synth_data.py dataset for the chosen scale, runs each
+stage as a subprocess in a scratch directory and records wall time, CPU time
+and peak RSS of that process (os.wait4 rusage). The LLM step uses the
+in-process fake client, so no API key is needed. Results are compared with a
+stored baseline and regressions beyond --tolerance are flagged (exit code 1).
+
+Usage:
+  python bench.py --scale small --save-baseline     # record this machine's numbers
+  python bench.py --scale small                     # compare against them
+  python bench.py --scale large --stages combine "combine --streaming"
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SCALES = {                       # incidents, reports
+    'small': (2000, 10000),
+    'medium': (20000, 100000),
+    'large': (100000, 1000000),
+}
+DATA_DIR = '../bench_data'       # Generated datasets, reused across runs
+BASELINE_FILE = 'bench_baseline.json'
+RESULTS_FILE = 'bench_results.json'
+TOLERANCE = 0.25                 # Allowed slowdown / memory growth vs baseline
+MIN_SECONDS = 0.5                # Wall-time differences below this are noise
+STAGES = [
+    ('defendlist', ['defendlist.py', '--tactics-dir', '{tactics}', '--no-cache']),
+    ('combine', ['combine.py', '--snapshot', '{snapshot}']),
+    ('combine --streaming', ['combine.py', '--snapshot', '{snapshot}', '--streaming']),
+    ('generate_mapping', ['generate_mapping.py', '--fake', '--fake-latency', '0.05', '--concurrency', '64',
+                          '--rpm', '0', '--no-cache']),
+    ('tojson', ['tojson.py', '--sharded', '--out-dir', 'site']),
+]
+
+
+def ensure_dataset(data_dir, scale, seed):
+    """synth_data.py output for this scale, generated once and marked complete."""
+    n_incidents, n_reports = SCALES[scale]
+    out = os.path.join(data_dir, f"{scale}-seed{seed}")
+    if not os.path.exists(os.path.join(out, '.complete')):
+        shutil.rmtree(out, ignore_errors=True)
+        print(f"🔁 Generating {scale} dataset ({n_incidents:,} incidents, {n_reports:,} reports) in {out}")
+        subprocess.run([sys.executable, os.path.join(HERE, 'synth_data.py'), '--out', out,
+                        '--incidents', str(n_incidents), '--reports', str(n_reports), '--seed', str(seed)],
+                       check=True)
+        open(os.path.join(out, '.complete'), 'w').close()
+    return out
+
+
+def run_stage(cmd, cwd, log_path):
+    """Run one stage; (exit code, wall s, cpu s, peak RSS MB or None)."""
+    start = time.perf_counter()
+    with open(log_path, 'wb') as log:
+        proc = subprocess.Popen([sys.executable, os.path.join(HERE, cmd[0])] + cmd[1:],
+                                cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, 'wait4'):
+            _, status, usage = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+        else:  # Windows: no per-child rusage
+            proc.wait()
+            usage = None
+    wall = time.perf_counter() - start
+    if usage is None:
+        return proc.returncode, wall, None, None
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return proc.returncode, wall, usage.ru_utime + usage.ru_stime, rss
+
+
+def compare(result, base, tolerance):
+    """Regression notes for one stage ('' when within tolerance)."""
+    if not base:
+        return 'no baseline'
+    notes = []
+    if result['wall_s'] > base['wall_s'] * (1 + tolerance) and result['wall_s'] - base['wall_s'] > MIN_SECONDS:
+        notes.append(f"wall +{(result['wall_s'] / base['wall_s'] - 1) * 100:.0f}%")
+    if result.get('rss_mb') and base.get('rss_mb') and result['rss_mb'] > base['rss_mb'] * (1 + tolerance):
+        notes.append(f"rss +{(result['rss_mb'] / base['rss_mb'] - 1) * 100:.0f}%")
+    return 'REGRESSION: ' + ', '.join(notes) if notes else ''
+
+
+def load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Time every pipeline stage on synthetic data and check for regressions.")
+    ap.add_argument("--scale", choices=list(SCALES), default='small')
+    ap.add_argument("--stages", nargs="*", default=None,
+                    help="subset of stage names (default: all; later stages read earlier stages' outputs)")
+    ap.add_argument("--data-dir", default=DATA_DIR, help="where generated datasets are kept")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--save-baseline", action="store_true", help="store this run as the baseline for --scale")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = ap.parse_args()
+
+    stages = [s for s in STAGES if args.stages is None or s[0] in args.stages]
+    dataset = ensure_dataset(args.data_dir, args.scale, args.seed)
+    paths = {'snapshot': os.path.abspath(os.path.join(dataset, 'snapshot')),
+             'tactics': os.path.abspath(os.path.join(dataset, 'tactics'))}
+    baseline = load_json(args.baseline)
+    base = baseline.get(args.scale, {}).get('stages', {})
+
+    results, failed, regressions = {}, [], []
+    with tempfile.TemporaryDirectory(prefix='bench-') as work:
+        print(f"\n--- Benchmark: {args.scale} ({SCALES[args.scale][0]:,} incidents, "
+              f"{SCALES[args.scale][1]:,} reports) ---")
+        print(f"{'stage':<22}{'wall s':>9}{'cpu s':>9}{'peak MB':>10}{'base s':>9}{'base MB':>10}  status")
+        for name, template in stages:
+            cmd = [part.format(**paths) for part in template]
+            log_path = os.path.join(work, name.replace(' ', '_') + '.log')
+            code, wall, cpu, rss = run_stage(cmd, work, log_path)
+            if code != 0:
+                failed.append(name)
+                with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                    tail = ''.join(f.readlines()[-10:])
+                print(f"{name:<22}❌ exit code {code}\n{tail}")
+                continue
+            result = {'wall_s': round(wall, 3), 'cpu_s': round(cpu, 3) if cpu is not None else None,
+                      'rss_mb': round(rss, 1) if rss is not None else None}
+            results[name] = result
+            b = base.get(name, {})
+            status = compare(result, b, args.tolerance)
+            if status.startswith('REGRESSION'):
+                regressions.append(name)
+            fmt = lambda v, width, digits: f"{v:>{width}.{digits}f}" if v is not None else f"{'-':>{width}}"
+            print(f"{name:<22}{wall:>9.2f}{fmt(cpu, 9, 2)}{fmt(rss, 10, 1)}"
+                  f"{fmt(b.get('wall_s'), 9, 2)}{fmt(b.get('rss_mb'), 10, 1)}  {status or 'ok'}")
+
+    run = {'scale': args.scale, 'dataset': dataset, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'machine': f"{platform.node()} {platform.machine()} Python {platform.python_version()}",
+           'stages': results}
+    with open(RESULTS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(run, f, indent=2)
+
+    if args.save_baseline and not failed:
+        baseline[args.scale] = run
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\n✅ Baseline for '{args.scale}' saved to {args.baseline}")
+    if failed:
+        sys.exit(f"\n❌ Failed stages: {', '.join(failed)}")
+    if regressions:
+        sys.exit(f"\n❌ Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)} (details in {RESULTS_FILE})")
+    print(f"\nResults written to {RESULTS_FILE}.")
+
+
+if __name__ == "__main__":
+    main()
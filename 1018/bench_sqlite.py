@@ -0,0 +1,138 @@
+"""
+Benchmark: the three JSON files vs the SQLite artifact (tojson.py --sqlite) at
+10x AIID scale.
+
+The CSVs in the current directory are replicated (fresh incident ids, same
+text) up to --incidents rows, both artifacts are built in a temp directory,
+and then the script times loading and queries on each:
+
+  JSON    json.load of incidents/defenses/mapping, then dict/linear-scan queries
+  SQLite  open the file, then primary-key, FTS5 and join-index queries
+
+Usage: python bench_sqlite.py [--incidents 12000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import pandas as pd
+
+from defense_index import split_ids
+from sqlite_export import build_sqlite, connect, get_incident, incidents_for_defense, search
+from tojson import (DEFENSES_CSV, DEFENSES_JSON, INCIDENTS_CSV, INCIDENTS_JSON, MAPPING_CSV,
+                    MAPPING_JSON, SQLITE_DB, dump_json)
+
+AIID_INCIDENTS = 1200     # Roughly the public AIID snapshot
+SCALE = 10
+QUERIES = ['privacy', 'facial recognition', 'deepfake', 'autonomous vehicle crash', 'chatbot']
+DEFENSE_COLUMNS = {'Technique ID': 'defense_id', 'Technique Name': 'name', 'Description': 'description',
+                   'Tactic': 'tactic', 'Parent Technique ID': 'parent_id', 'Level': 'level'}
+
+
+def scale_up(incident_df, mapping_df, n):
+    """Replicate incidents (and their mapping rows) to n rows with new, unique ids."""
+    reps = -(-n // len(incident_df))
+    ids = incident_df['incident_id'].tolist()
+    offset = max(ids) + 1
+    inc = pd.concat([incident_df.assign(incident_id=incident_df['incident_id'] + r * offset)
+                     for r in range(reps)], ignore_index=True).head(n)
+    mp = pd.concat([mapping_df.assign(incident_id=mapping_df['incident_id'] + r * offset)
+                    for r in range(reps)], ignore_index=True)
+    return inc, mp[mp['incident_id'].isin(set(inc['incident_id']))]
+
+
+def timed(fn, repeat=1):
+    """(median seconds, last result)."""
+    times, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times), result
+
+
+# --- JSON path (what app.js / a script reading the exports does) ---
+
+def json_load(out_dir):
+    def read(name):
+        with open(os.path.join(out_dir, name), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    incidents = {r['incident_id']: r for r in read(INCIDENTS_JSON)}
+    defenses = {d['defense_id']: d for d in read(DEFENSES_JSON)}
+    mapping = {m['incident_id']: split_ids(m['matched_defense_ids']) for m in read(MAPPING_JSON)}
+    return incidents, defenses, mapping
+
+
+def json_search(incidents, query):
+    q = query.lower()
+    return [iid for iid, r in incidents.items()
+            if q in r['incident_title'].lower() or q in r['full_report_text'].lower()
+            or q in r['mitre_classification'].lower()]
+
+
+def json_reverse(mapping, defense_id):
+    return sorted(iid for iid, ids in mapping.items() if defense_id in ids)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="JSON vs SQLite artifact: load and query times.")
+    ap.add_argument("--incidents", type=int, default=SCALE * AIID_INCIDENTS)
+    ap.add_argument("--repeat", type=int, default=20, help="repetitions per query (median reported)")
+    args = ap.parse_args()
+
+    incident_df = pd.read_csv(INCIDENTS_CSV).fillna('')
+    defense_df = pd.read_csv(DEFENSES_CSV).rename(columns=DEFENSE_COLUMNS)
+    defense_df = defense_df[[c for c in DEFENSE_COLUMNS.values() if c in defense_df.columns]].fillna('')
+    mapping_df = pd.read_csv(MAPPING_CSV).fillna('')
+    incident_df, mapping_df = scale_up(incident_df, mapping_df, args.incidents)
+    ids = incident_df['incident_id'].tolist()
+    probe_ids = ids[::max(len(ids) // 50, 1)]
+    defense_id = mapping_df['matched_defense_ids'].map(lambda v: (split_ids(v) or [''])[0]).mode()[0]
+
+    with tempfile.TemporaryDirectory() as out:
+        path = lambda name: os.path.join(out, name)
+        t_json_build, _ = timed(lambda: [
+            dump_json(incident_df.to_dict(orient='records'), path(INCIDENTS_JSON)),
+            dump_json(defense_df.to_dict(orient='records'), path(DEFENSES_JSON)),
+            dump_json(mapping_df.to_dict(orient='records'), path(MAPPING_JSON))])
+        json_bytes = sum(os.path.getsize(path(n)) for n in (INCIDENTS_JSON, DEFENSES_JSON, MAPPING_JSON))
+        stats = build_sqlite(incident_df, defense_df, mapping_df, path(SQLITE_DB))
+
+        t_json_load, (incidents, defenses, mapping) = timed(lambda: json_load(out), 3)
+        t_db_open, conn = timed(lambda: connect(path(SQLITE_DB)).execute('SELECT 1').connection, 3)
+
+        rows = [
+            ('build', t_json_build, stats['seconds']),
+            ('load / open', t_json_load, t_db_open),
+            ('incident by id (x50)',
+             timed(lambda: [dict(incidents[i], matched_defense_ids=mapping.get(i, [])) for i in probe_ids],
+                   args.repeat)[0],
+             timed(lambda: [get_incident(conn, i) for i in probe_ids], args.repeat)[0]),
+            (f'search ({len(QUERIES)} queries)',
+             timed(lambda: [json_search(incidents, q) for q in QUERIES], max(args.repeat // 10, 1))[0],
+             timed(lambda: [search(conn, q, limit=len(ids)) for q in QUERIES], args.repeat)[0]),
+            (f'defense -> incidents ({defense_id})',
+             timed(lambda: json_reverse(mapping, defense_id), args.repeat)[0],
+             timed(lambda: incidents_for_defense(conn, defense_id), args.repeat)[0]),
+        ]
+        json_first = t_json_load + rows[2][1] / len(probe_ids)
+        db_first = t_db_open + rows[2][2] / len(probe_ids)
+
+        print(f"\n--- JSON vs SQLite: {len(incident_df):,} incidents, {len(mapping_df):,} mapping rows, "
+              f"{stats['pairs']:,} incident/defense pairs ---")
+        print(f"Size: JSON {json_bytes / 1e6:,.1f} MB | SQLite {stats['bytes'] / 1e6:,.1f} MB "
+              f"(FTS5 {'on' if stats['fts5'] else 'off'})")
+        print(f"{'operation':<40}{'JSON ms':>12}{'SQLite ms':>12}{'speedup':>10}")
+        for name, tj, ts in rows:
+            print(f"{name:<40}{tj * 1000:>12.2f}{ts * 1000:>12.2f}{tj / max(ts, 1e-9):>9.1f}x")
+        print(f"{'first answer (open + 1 lookup)':<40}{json_first * 1000:>12.2f}{db_first * 1000:>12.2f}"
+              f"{json_first / max(db_first, 1e-9):>9.1f}x")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
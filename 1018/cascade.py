@@ -0,0 +1,202 @@
+"""
+Model cascade for generate_mapping.py --cascade: ask a cheap tier first and
+escalate to the next (ultimately gemini-2.5-pro) only when the answer fails
+validation.
+
+A tier is a Gemini model name or `local` (the TF-IDF similarity mapper, free
+and instant). An answer is accepted when
+
+  - it is not an error row and every ID exists in the defense catalog (DEFENSE_IDS)
+  - it has MIN_IDS..MAX_IDS distinct IDs (the range the prompt asks for)
+  - the model's self-reported confidence is >= --min-confidence (LLM tiers) or
+    the best cosine score is >= --min-similarity (local tier)
+  - optionally, at least --min-agreement of its IDs are among the similarity
+    mapper's AGREEMENT_POOL best candidates (an independent cross-check)
+
+The last tier's answer is always kept. Each incident's path (tiers tried,
+rejection reasons, latency, tokens, cost) goes to cascade_stats.csv; the
+summary compares cost and latency with sending everything to the last tier.
+"""
+
+import json
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from batching import estimate_tokens
+from result_cache import ERROR_MARKERS
+
+LOCAL = 'local'
+MIN_IDS, MAX_IDS = 3, 5
+MIN_CONFIDENCE = 0.6
+MIN_SIMILARITY = 0.2
+AGREEMENT_POOL = 30
+STATS_FILE = 'cascade_stats.csv'
+
+# USD per 1M tokens (input, output); list prices for prompts under 200k tokens
+PRICES = {
+    'gemini-2.5-pro': (1.25, 10.00),
+    'gemini-2.5-flash': (0.30, 2.50),
+    'gemini-2.5-flash-lite': (0.10, 0.40),
+}
+CACHED_INPUT_FACTOR = 0.25   # Cached prompt tokens are billed at a quarter of the input price
+
+CONFIDENCE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "incident_id": {"type": "INTEGER"},
+        "matched_defense_ids": {
+            "type": "ARRAY",
+            "description": "List of 3 to 5 matching AIDEFEND Technique IDs.",
+            "items": {"type": "STRING"},
+        },
+        "confidence": {
+            "type": "NUMBER",
+            "description": "Confidence from 0 to 1 that these are the most relevant defenses for the incident.",
+        },
+    },
+    "required": ["incident_id", "matched_defense_ids", "confidence"],
+}
+
+
+def call_cost(model: str, prompt_tokens: int, response_tokens: int, cached_tokens: int = 0) -> float:
+    price_in, price_out = PRICES.get(model, PRICES['gemini-2.5-pro'])
+    fresh = prompt_tokens - cached_tokens
+    return (fresh * price_in + cached_tokens * price_in * CACHED_INPUT_FACTOR + response_tokens * price_out) / 1e6
+
+
+def validate(ids: Sequence[str], defense_ids: set, confidence: Optional[float] = None,
+             min_confidence: float = 0.0, pool: Optional[set] = None, min_agreement: float = 0.0) -> List[str]:
+    """Reasons to reject an answer (empty list = accept)."""
+    if not ids or any(i in ERROR_MARKERS for i in ids):
+        return ['error']
+    reasons = []
+    unknown = [i for i in ids if i not in defense_ids]
+    if unknown:
+        reasons.append(f"unknown ids: {' '.join(unknown)}")
+    n = len(set(ids))
+    if not MIN_IDS <= n <= MAX_IDS:
+        reasons.append(f"{n} ids")
+    if confidence is not None and confidence < min_confidence:
+        reasons.append(f"confidence {confidence:.2f}")
+    if pool is not None and min_agreement > 0:
+        agree = len(set(ids) & pool) / n
+        if agree < min_agreement:
+            reasons.append(f"agreement {agree:.2f}")
+    return reasons
+
+
+def local_candidates(mapper, texts: List[str], k: int, per_tactic: int, pool: int):
+    """Similarity-mapper picks, best cosine score and top-`pool` candidate set per text."""
+    scores = mapper.similarity(texts)
+    picks = [[mapper.ids[j] for j in row if j >= 0] for row in mapper.select(scores, k, per_tactic)]
+    top = np.argsort(-scores, axis=1)[:, :pool]
+    pools = [{mapper.ids[j] for j in row} for row in top]
+    return picks, scores.max(axis=1, initial=0.0).tolist(), pools
+
+
+class Cascade:
+    """Tiered matching for one run; collects one stats row per incident."""
+
+    def __init__(self, engine, tiers: List[str], defense_ids: set, response_schema: dict, prompt_fn: Callable,
+                 suffix_fn: Callable = None, prefix_caches: Dict[str, object] = None, local: Dict[int, tuple] = None,
+                 min_confidence: float = MIN_CONFIDENCE, min_similarity: float = MIN_SIMILARITY,
+                 min_agreement: float = 0.0):
+        self.engine = engine
+        self.tiers = tiers
+        self.response_schema = response_schema   # Last tier: the plain mapping schema
+        self.defense_ids = defense_ids
+        self.prompt_fn, self.suffix_fn = prompt_fn, suffix_fn
+        self.prefix_caches = prefix_caches or {}
+        self.local = local or {}
+        self.min_confidence, self.min_similarity, self.min_agreement = min_confidence, min_similarity, min_agreement
+        self.rows: List[dict] = []
+        self.calls: Dict[str, List[tuple]] = {}   # model -> [(latency, response tokens)]
+
+    async def ask(self, model: str, incident: dict, defense_list: str, last: bool):
+        """(ids, confidence, prompt tokens, response tokens, cached tokens) from one LLM tier."""
+        schema = self.response_schema if last else CONFIDENCE_SCHEMA
+        cache = self.prefix_caches.get(model)
+        if cache is not None:
+            reply = await cache.generate(self.engine, self.suffix_fn(incident), schema)
+        else:
+            reply = await self.engine.generate(self.prompt_fn(incident, defense_list), schema, model=model)
+        tokens = (reply.prompt_tokens, reply.response_tokens, getattr(reply, 'cached_tokens', 0))
+        try:
+            result = json.loads(reply.text)
+            ids, confidence = result["matched_defense_ids"], result.get("confidence")
+            if not isinstance(ids, list):
+                raise TypeError("matched_defense_ids is not a list")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return ["JSON_PARSE_ERROR"], None, *tokens
+        return ids, (float(confidence) if isinstance(confidence, (int, float)) else None), *tokens
+
+    async def match(self, incident: dict, defense_list: str) -> dict:
+        iid = int(incident['incident_id'])
+        picks, best, pool = self.local.get(iid, ([], 0.0, None))
+        # Baseline: this incident's full prompt sent to the last tier (cached prefix billed as cached)
+        top_cache = self.prefix_caches.get(self.tiers[-1])
+        row = {'incident_id': iid, 'tier': '', 'escalations': 0, 'rejected': '', 'latency_s': 0.0,
+               'prompt_tokens': 0, 'response_tokens': 0, 'cost_usd': 0.0,
+               'baseline_prompt_tokens': estimate_tokens(self.prompt_fn(incident, defense_list)),
+               'baseline_cached_tokens': estimate_tokens(top_cache.prefix) if top_cache and top_cache.enabled else 0}
+        rejected = []
+        for n, model in enumerate(self.tiers):
+            last = n == len(self.tiers) - 1
+            start = time.perf_counter()
+            if model == LOCAL:
+                ids = picks
+                reasons = validate(ids, self.defense_ids)
+                if best < self.min_similarity:
+                    reasons.append(f"similarity {best:.2f}")
+            else:
+                try:
+                    ids, confidence, p_tok, r_tok, c_tok = await self.ask(model, incident, defense_list, last)
+                except Exception as e:
+                    print(f"   ❌ {model} failed for incident {iid}: {e}")
+                    ids, confidence, p_tok, r_tok, c_tok = ["LLM_ERROR"], None, 0, 0, 0
+                row['prompt_tokens'] += p_tok
+                row['response_tokens'] += r_tok
+                row['cost_usd'] += call_cost(model, p_tok, r_tok, c_tok)
+                self.calls.setdefault(model, []).append((time.perf_counter() - start, r_tok))
+                reasons = [] if last else validate(ids, self.defense_ids, confidence, self.min_confidence,
+                                                   pool, self.min_agreement)
+            row['latency_s'] += time.perf_counter() - start
+            row['tier'] = model
+            if not reasons or last:
+                break
+            rejected.append(f"{model}: {', '.join(reasons)}")
+            row['escalations'] += 1
+        row['rejected'] = ' | '.join(rejected)
+        self.rows.append(row)
+        return {"incident_id": incident['incident_id'], "matched_defense_ids": ids}
+
+    def report(self, path: str = STATS_FILE) -> str:
+        """Write per-incident stats and summarize against sending every incident to the last tier."""
+        df = pd.DataFrame(self.rows, columns=['incident_id', 'tier', 'escalations', 'rejected', 'latency_s',
+                                              'prompt_tokens', 'response_tokens', 'cost_usd',
+                                              'baseline_prompt_tokens', 'baseline_cached_tokens'])
+        df.sort_values('incident_id').drop(columns=['baseline_prompt_tokens', 'baseline_cached_tokens']).round(
+            {'latency_s': 4, 'cost_usd': 7}).to_csv(path, index=False)
+        if df.empty:
+            return "Cascade: nothing mapped"
+        top, n = self.tiers[-1], len(df)
+        answered = df['tier'].value_counts()
+        llm_calls = [c for calls in self.calls.values() for c in calls]
+        top_calls = self.calls.get(top) or llm_calls
+        response = float(np.mean([c[1] for c in top_calls])) if top_calls else 0.0
+        baseline = sum(call_cost(top, p, response, c)
+                       for p, c in zip(df['baseline_prompt_tokens'], df['baseline_cached_tokens']))
+        cost = df['cost_usd'].sum()
+        saved = 1 - cost / max(baseline, 1e-12)
+        lines = [f"Cascade {' -> '.join(self.tiers)} on {n} incidents: answered by "
+                 + ', '.join(f"{t} {answered.get(t, 0) / n:.0%}" for t in self.tiers)
+                 + f"; escalation rate {df['escalations'].gt(0).mean():.0%}",
+                 f"   latency per incident: mean {df['latency_s'].mean():.2f}s, p95 {df['latency_s'].quantile(0.95):.2f}s"
+                 + (f" | all-{top}: ~{np.mean([c[0] for c in self.calls[top]]):.2f}s mean" if self.calls.get(top) else ''),
+                 f"   cost: ${cost:.4f} (${cost / n:.5f}/incident) | all-{top}: ~${baseline:.4f} "
+                 f"(${baseline / n:.5f}/incident) -> {abs(saved):.0%} {'saved' if saved >= 0 else 'more'}",
+                 f"   per-incident stats -> {path}"]
+        return '\n'.join(lines)
@@ -0,0 +1,264 @@
+"""
+Token budget for the incident report text (generate_mapping.py --report-tokens).
+
+full_report_text is every report of an incident joined together, so a few
+incidents with dozens of reports produce prompts many times the median size:
+slow, close to the context limit, and the usual source of LLM_ERROR rows.
+Each incident is measured against the budget; an oversized one is either
+
+  extract     trimmed to its most salient sentences (SumBasic: sentences rich in
+              the incident's frequent words win, and the words of a picked
+              sentence are down-weighted, so syndicated near-copies of the same
+              report do not fill the budget twice) and sent as one prompt, or
+  map-reduce  split into CHUNK_TOKENS chunks on sentence boundaries (at most
+              MAX_CHUNKS, extracted first if longer); every chunk is mapped on its
+              own (map, in parallel, full catalog) and one final call picks 3-5
+              IDs from the chunks' candidates, ranked by votes, given a salient
+              REDUCE_TOKENS excerpt of the report (reduce)
+
+Incidents within the budget are sent unchanged. One stats row per incident
+(report tokens, prompt tokens sent, calls, latency) goes to STATS_FILE; the
+summary compares the long tail of oversized incidents with the rest. When the
+catalog prefix is served from a context cache (context_cache.py), prompt
+tokens count only what is sent per call and the prefix goes to cached_tokens.
+"""
+
+import asyncio
+import json
+import re
+import time
+from collections import Counter
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from batching import estimate_tokens
+from result_cache import ERROR_MARKERS
+from retrieval import build_vocabulary, count_matrix, tokenize
+
+MODES = ('map-reduce', 'extract')
+CHUNK_TOKENS = 4000       # Report text per map call
+MAX_CHUNKS = 6            # Longer reports are extracted down to MAX_CHUNKS * CHUNK_TOKENS first
+REDUCE_TOKENS = 1500      # Report excerpt sent with the reduce call
+MAX_CANDIDATES = 15       # Chunk candidates offered to the reduce call
+MAX_IDS = 5               # Fewer distinct candidates than this skip the reduce call
+TITLE_BOOST = 2.0         # Words from the incident title count this much more
+STATS_FILE = 'report_budget_stats.csv'
+
+SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+
+def report_tokens(incident: dict) -> int:
+    return estimate_tokens(str(incident.get('full_report_text', '')))
+
+
+def split_sentences(text: str, max_chars: int = CHUNK_TOKENS * 4) -> List[str]:
+    """Sentences, with run-on 'sentences' longer than max_chars cut at word boundaries."""
+    out = []
+    for s in SENTENCE_RE.split(str(text or '').strip()):
+        while len(s) > max_chars:
+            cut = s.rfind(' ', 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            out.append(s[:cut])
+            s = s[cut:].lstrip()
+        if s:
+            out.append(s)
+    return out
+
+
+def extract(text: str, budget: int, title: str = '') -> str:
+    """The most salient sentences within `budget` tokens, in their original order."""
+    if estimate_tokens(text) <= budget:
+        return text
+    sentences = list(dict.fromkeys(split_sentences(text)))   # Exact repeats across reports add nothing
+    docs = [tokenize(s) for s in sentences]
+    vocab = build_vocabulary(docs)
+    X = count_matrix(docs, vocab)                              # sentences x terms
+    if not vocab:
+        return text[:budget * 4]
+    p = np.asarray(X.sum(axis=0)).ravel()
+    for t in set(tokenize(title)):
+        if t in vocab:
+            p[vocab[t]] *= TITLE_BOOST
+    p /= p.sum()
+    lengths = np.maximum(np.asarray(X.sum(axis=1)).ravel(), 1)
+    cost = np.array([estimate_tokens(s) for s in sentences])
+    remaining = budget - 1
+    picked = np.zeros(len(sentences), dtype=bool)
+    while True:
+        scores = (X @ p) / lengths
+        scores[picked | (cost > remaining)] = -1
+        best = int(np.argmax(scores))
+        if scores[best] < 0:
+            break
+        picked[best] = True
+        remaining -= cost[best] + 1
+        words = X[best].indices
+        p[words] = p[words] ** 2                               # SumBasic update: covered words matter less
+    return ' '.join(s for s, keep in zip(sentences, picked) if keep)
+
+
+def chunk_text(text: str, chunk_tokens: int = CHUNK_TOKENS, max_chunks: int = MAX_CHUNKS,
+               title: str = '') -> List[str]:
+    """Sentence-aligned chunks of at most chunk_tokens each, no more than max_chunks of them."""
+    if estimate_tokens(text) > chunk_tokens * max_chunks:
+        text = extract(text, chunk_tokens * max_chunks - max_chunks, title)
+    chunks, current, size = [], [], 0
+    for s in split_sentences(text, chunk_tokens * 4):
+        n = estimate_tokens(s)
+        if current and size + n > chunk_tokens:
+            chunks.append(' '.join(current))
+            current, size = [], 0
+        current.append(s)
+        size += n
+    if current:
+        chunks.append(' '.join(current))
+    return chunks[:max_chunks]
+
+
+def trim_report(incident: dict, budget: int) -> dict:
+    """Extract mode: the incident with its report cut to the budget (unchanged when within it)."""
+    if not budget or report_tokens(incident) <= budget:
+        return incident
+    return dict(incident, full_report_text=extract(str(incident['full_report_text']), budget,
+                                                   str(incident.get('incident_title', ''))))
+
+
+def parse_ids(text: str) -> List[str]:
+    result = json.loads(text)
+    ids = result["matched_defense_ids"]
+    if not isinstance(ids, list):
+        raise TypeError("matched_defense_ids is not a list")
+    return [str(i).strip() for i in ids]
+
+
+class ReportBudget:
+    """Sends each incident whole, extracted or map-reduced; collects one stats row per incident."""
+
+    def __init__(self, engine, budget: int, mode: str, response_schema: dict, prompt_fn: Callable,
+                 suffix_fn: Callable, entries: Dict[str, str], prefix_cache=None,
+                 chunk_tokens: int = CHUNK_TOKENS, max_chunks: int = MAX_CHUNKS, reduce_tokens: int = REDUCE_TOKENS):
+        self.engine = engine
+        self.budget = budget
+        self.mode = mode
+        self.response_schema = response_schema
+        self.prompt_fn, self.suffix_fn = prompt_fn, suffix_fn
+        self.entries = entries            # defense_id -> LLM_Entry line, for the reduce shortlist
+        self.prefix_cache = prefix_cache
+        self.chunk_tokens, self.max_chunks, self.reduce_tokens = chunk_tokens, max_chunks, reduce_tokens
+        self.rows: List[dict] = []
+
+    def prompt_tokens(self, part: dict, defense_list: str):
+        """(tokens sent with the request, prefix tokens served from the context cache) for one full-catalog call."""
+        if self.prefix_cache is not None and self.prefix_cache.enabled:
+            return estimate_tokens(self.suffix_fn(part)), estimate_tokens(self.prefix_cache.prefix)
+        return estimate_tokens(self.prompt_fn(part, defense_list)), 0
+
+    def oversized(self, incident: dict) -> bool:
+        return bool(self.budget) and report_tokens(incident) > self.budget
+
+    async def match(self, incident: dict, defense_list: str, single: Callable, original_tokens: int = None) -> dict:
+        """single(incident) -> match is the regular one-prompt path; returns the same match dict."""
+        start = time.perf_counter()
+        row = {'incident_id': int(incident['incident_id']),
+               'report_tokens': original_tokens if original_tokens is not None else report_tokens(incident),
+               'mode': 'full', 'chunks': 1, 'calls': 1, 'error': ''}
+        if self.mode == 'map-reduce' and self.oversized(incident):
+            row['mode'] = 'map-reduce'
+            match, prompt_tokens, cached_tokens = await self.map_reduce(incident, defense_list, row)
+        else:
+            if row['report_tokens'] > report_tokens(incident):
+                row['mode'] = 'extract'   # Trimmed before the cache lookup (trim_report)
+            match = await single(incident)
+            prompt_tokens, cached_tokens = self.prompt_tokens(incident, defense_list)
+        # Measured after the call: the context cache may have turned out to be unavailable
+        row['original_prompt_tokens'] = self.prompt_tokens(incident, defense_list)[0] \
+            - report_tokens(incident) + row['report_tokens']
+        row['prompt_tokens'] = prompt_tokens
+        row['cached_tokens'] = cached_tokens
+        row['latency_s'] = time.perf_counter() - start
+        if any(i in ERROR_MARKERS for i in match['matched_defense_ids']):
+            row['error'] = match['matched_defense_ids'][0]
+        self.rows.append(row)
+        return match
+
+    async def _ask(self, part: dict, defense_list: str):
+        if self.prefix_cache is not None:
+            return await self.prefix_cache.generate(self.engine, self.suffix_fn(part), self.response_schema)
+        return await self.engine.generate(self.prompt_fn(part, defense_list), self.response_schema)
+
+    async def map_reduce(self, incident: dict, defense_list: str, row: dict):
+        iid = incident['incident_id']
+        title = str(incident.get('incident_title', ''))
+        chunks = chunk_text(str(incident['full_report_text']), self.chunk_tokens, self.max_chunks, title)
+        parts = [dict(incident, full_report_text=f"[Part {k + 1} of {len(chunks)} of the reports] {chunk}")
+                 for k, chunk in enumerate(chunks)]
+        row['chunks'] = len(parts)
+
+        # Map: candidates per chunk, counted once per chunk
+        replies = await asyncio.gather(*(self._ask(part, defense_list) for part in parts), return_exceptions=True)
+        sent = [self.prompt_tokens(part, defense_list) for part in parts]
+        prompt_tokens, cached_tokens = sum(n for n, _ in sent), sum(c for _, c in sent)
+        votes, failures = Counter(), 0
+        for reply in replies:
+            try:
+                if isinstance(reply, Exception):
+                    raise reply
+                votes.update(list(dict.fromkeys(i for i in parse_ids(reply.text) if i in self.entries)))
+            except Exception as e:
+                failures += 1
+                print(f"   ⚠️  Chunk of incident {iid} failed: {e}")
+        row['calls'] = len(parts)
+        if not votes:
+            marker = 'LLM_ERROR' if any(isinstance(r, Exception) for r in replies) else 'JSON_PARSE_ERROR'
+            print(f"   ❌ Failed to process incident {iid}: no chunk returned usable IDs")
+            return {"incident_id": iid, "matched_defense_ids": [marker]}, prompt_tokens, cached_tokens
+        candidates = [did for did, _ in votes.most_common(MAX_CANDIDATES)]   # Ties keep first-seen order
+        if len(candidates) <= MAX_IDS:
+            return {"incident_id": iid, "matched_defense_ids": candidates}, prompt_tokens, cached_tokens
+
+        # Reduce: final pick from the candidates, with a salient excerpt of the whole report
+        shortlist = "\n".join(f"{self.entries[did]} [suggested for {votes[did]} of {len(parts)} parts]"
+                              for did in candidates)
+        summary = dict(incident, full_report_text=extract(str(incident['full_report_text']),
+                                                          self.reduce_tokens, title))
+        prompt = self.prompt_fn(summary, shortlist)
+        prompt_tokens += estimate_tokens(prompt)   # Shortlist instead of the catalog: never cached
+        row['calls'] += 1
+        try:
+            reply = await self.engine.generate(prompt, self.response_schema)
+            ids = [i for i in parse_ids(reply.text) if i in votes]
+            if not ids:
+                raise ValueError("no candidate IDs in the reduce answer")
+        except Exception as e:
+            print(f"   ⚠️  Reduce call for incident {iid} failed ({e}); keeping the most voted candidates")
+            ids = candidates[:MAX_IDS]
+        return {"incident_id": iid, "matched_defense_ids": ids}, prompt_tokens, cached_tokens
+
+    def report(self, path: str = STATS_FILE) -> str:
+        """Write per-incident stats and summarize the long tail (oversized vs within budget)."""
+        df = pd.DataFrame(self.rows, columns=['incident_id', 'report_tokens', 'mode', 'chunks', 'calls',
+                                              'original_prompt_tokens', 'prompt_tokens', 'cached_tokens',
+                                              'latency_s', 'error'])
+        df.sort_values('incident_id').round({'latency_s': 4}).to_csv(path, index=False)
+        if df.empty:
+            return "Report budget: nothing mapped"
+        over = df['mode'] != 'full'
+        lines = [f"Report budget {self.budget or 'off'}"
+                 + (f" ({self.mode}): {over.sum()} of {len(df)} incidents over budget" if self.budget else
+                    f": {len(df)} incidents, report tokens p50 {df['report_tokens'].median():,.0f}, "
+                    f"p95 {df['report_tokens'].quantile(0.95):,.0f}, max {df['report_tokens'].max():,}")]
+        for label, part in (('over budget', df[over]), ('within budget', df[~over])):
+            if part.empty:
+                continue
+            lines.append(f"   {label + ':':<15}prompt tokens p95 {part['original_prompt_tokens'].quantile(0.95):,.0f}"
+                         f" -> {part['prompt_tokens'].quantile(0.95):,.0f} (max "
+                         f"{part['original_prompt_tokens'].max():,} -> {part['prompt_tokens'].max():,}), "
+                         f"latency p50 {part['latency_s'].median():.2f}s p95 {part['latency_s'].quantile(0.95):.2f}s "
+                         f"max {part['latency_s'].max():.2f}s, {part['calls'].mean():.1f} calls, "
+                         f"{(part['error'] != '').sum()} error rows"
+                         + (f", {part['cached_tokens'].sum():,} prefix tokens from the context cache"
+                            if part['cached_tokens'].any() else ""))
+        lines.append(f"   per-incident stats -> {path}")
+        return '\n'.join(lines)
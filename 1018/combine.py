@@ -1,10 +1,49 @@
-import pandas as pd
+import argparse
 import ast
+import json
+import os
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dedup import near_duplicate_mask
+from instrumentation import start_run
 
-# 1. Load data
-incidents_df = pd.read_csv("../mongodump_full_snapshot/incidents.csv")
-reports_df = pd.read_csv("../mongodump_full_snapshot/reports.csv")
-mit_df = pd.read_csv("../mongodump_full_snapshot/classifications_MIT.csv")
+SNAPSHOT_DIR = "../mongodump_full_snapshot"
+OUTPUT_FILE = "merged_incident_data.csv"
+CHUNKSIZE = 20000  # Rows per reports.csv chunk in streaming / delta mode
+INCIDENT_CHUNKSIZE = 2000  # Incidents aggregated per output chunk; each holds all of their report texts
+MANIFEST_FILE = "combine_manifest.json"       # Per-incident content hashes from the last delta run
+CHANGED_IDS_FILE = "changed_incident_ids.json"  # Consumed by generate_mapping.py --changed-ids
+MANIFEST_VERSION = 1  # Bump when the output format changes to force a full rebuild
+NEAR_DUP_THRESHOLD = 0.0  # MinHash Jaccard above which reports of one incident are collapsed (0 = off)
+DEDUP_STATS_FILE = "dedup_stats.csv"
+DEDUP_STATS_COLUMNS = ['incident_id', 'reports_in', 'reports_kept', 'bytes_in', 'bytes_removed',
+                       'est_tokens_removed']
+
+# Columns we actually use, with explicit dtypes (avoids type inference on huge files)
+INCIDENT_COLUMNS = {
+    'incident_id': 'int64',
+    'date': 'string',
+    'reports': 'string',
+    'title': 'string',
+    'Alleged deployer of AI system': 'string',
+    'Alleged developer of AI system': 'string',
+    'Alleged harmed or nearly harmed parties': 'string',
+}
+REPORT_COLUMNS = {'report_number': 'string', 'text': 'string'}
+MIT_COLUMNS = {'Incident ID': 'int64', 'Risk Domain': 'string', 'Risk Subdomain': 'string'}
+
+OUTPUT_COLUMNS = ['incident_id', 'incident_title', 'incident_date', 'deployer', 'developer',
+                  'harmed_parties', 'full_report_text', 'mitre_classification']
+
+# 1. Load data helpers
+def snapshot_paths(snapshot_dir):
+    return (os.path.join(snapshot_dir, "incidents.csv"),
+            os.path.join(snapshot_dir, "reports.csv"),
+            os.path.join(snapshot_dir, "classifications_MIT.csv"))
 
 # 2. Prepare incidents.csv: expand report IDs
 # Convert the 'reports' column (string list) into a real Python list of integers
@@ -16,66 +55,280 @@ def safe_literal_eval(x):
     except:
         return []
 
-# Convert the report ID string into an actual list and store it in a new column
-incidents_df['report_number'] = incidents_df['reports'].apply(safe_literal_eval)
-
-# Expand the incidents dataframe so each incident–report pair has its own row
-incidents_exploded = incidents_df.explode('report_number')
+def load_incidents(path):
+    """Incident metadata (one row per incident) plus the exploded (incident_id, ord, report_number) pairs."""
+    incidents_df = pd.read_csv(path, usecols=list(INCIDENT_COLUMNS), dtype=INCIDENT_COLUMNS)
+    incidents_df = incidents_df.drop_duplicates('incident_id')
 
-# Select core incident information and ensure report_number is integer
-incident_core = incidents_exploded[['incident_id', 'date', 'Alleged deployer of AI system',
-                                   'Alleged developer of AI system', 'Alleged harmed or nearly harmed parties',
-                                   'title', 'report_number']].copy()
+    # Convert the report ID string into an actual list and expand to one row per incident–report pair
+    incidents_df['report_number'] = incidents_df['reports'].astype(object).apply(safe_literal_eval)
+    pairs = incidents_df[['incident_id', 'report_number']].explode('report_number')
+    # Position of each report in its incident's list: keeps the original text order
+    pairs['ord'] = pairs.groupby('incident_id').cumcount()
+    pairs['report_number'] = pd.to_numeric(pairs['report_number'], errors='coerce').fillna(-1).astype('int64')
 
-# Convert report_number to integer
-incident_core['report_number'] = pd.to_numeric(incident_core['report_number'], errors='coerce').fillna(-1).astype(int)
+    meta = incidents_df.rename(columns={
+        'title': 'incident_title',
+        'date': 'incident_date',
+        'Alleged deployer of AI system': 'deployer',
+        'Alleged developer of AI system': 'developer',
+        'Alleged harmed or nearly harmed parties': 'harmed_parties',
+    })[['incident_id', 'incident_title', 'incident_date', 'deployer', 'developer', 'harmed_parties']]
+    return meta, pairs.reset_index(drop=True)
 
-# 3. Merge reports.csv
-# Keep only report_number and text from reports.csv
-reports_text = reports_df[['report_number', 'text']].rename(columns={'text': 'detailed_report_text'})
-
-# Merge using 'report_number' as the key
-merged_reports = pd.merge(
-    incident_core,
-    reports_text,
-    on='report_number',
-    how='left'
-)
+def read_reports(path, chunksize=None):
+    """reports.csv restricted to report_number/text; an iterator of chunks when chunksize is set."""
+    reader = pd.read_csv(path, usecols=list(REPORT_COLUMNS), dtype=REPORT_COLUMNS, chunksize=chunksize)
+    for chunk in ([reader] if chunksize is None else reader):
+        chunk = chunk.rename(columns={'text': 'detailed_report_text'})
+        chunk['report_number'] = pd.to_numeric(chunk['report_number'], errors='coerce').fillna(-2).astype('int64')
+        yield chunk
 
 # 4. Aggregate full report text per incident
-merged_reports_grouped = merged_reports.groupby('incident_id').agg(
-    incident_title=('title', 'first'),
-    incident_date=('date', 'first'),
-    deployer=('Alleged deployer of AI system', 'first'),
-    developer=('Alleged developer of AI system', 'first'),
-    harmed_parties=('Alleged harmed or nearly harmed parties', 'first'),
-    # Concatenate all unique, non-null report texts as input for LLM
-    full_report_text=('detailed_report_text', lambda x: ' '.join(x.dropna().astype(str).unique()).strip())
-).reset_index()
+def collapse_near_duplicates(rows, threshold, stats=None):
+    """
+    Drop reports that are near-duplicates (MinHash Jaccard >= threshold) of an earlier
+    report of the same incident. Appends per-incident byte/token savings to `stats`.
+    """
+    sizes = rows.groupby('incident_id', sort=False).size()
+    multi = rows['incident_id'].isin(sizes.index[sizes > 1])
+    keep = pd.Series(True, index=rows.index)
+    records = []
+    for incident_id, group in rows[multi].groupby('incident_id', sort=False):
+        texts = group['detailed_report_text'].tolist()
+        mask = near_duplicate_mask(texts, threshold)
+        keep.loc[group.index] = mask
+        removed = sum(len(t.encode('utf-8')) for t, k in zip(texts, mask) if not k)
+        records.append((incident_id, len(texts), int(mask.sum()),
+                        sum(len(t.encode('utf-8')) for t in texts), removed, removed // 4))
+    if stats is not None and records:
+        stats.append(pd.DataFrame(records, columns=DEDUP_STATS_COLUMNS))
+    return rows[keep]
+
+def aggregate_report_text(rows, near_dup_threshold=0.0, stats=None):
+    """
+    Concatenate all unique, non-null report texts per incident (input for the LLM).
+    rows: incident_id, ord, detailed_report_text. Dedup and ordering are whole-frame
+    operations; the only per-group step is the C-level str.join.
+    """
+    rows = rows.dropna(subset=['detailed_report_text'])
+    rows = rows.sort_values(['incident_id', 'ord'], kind='stable')
+    rows = rows.drop_duplicates(['incident_id', 'detailed_report_text'])
+    if near_dup_threshold:
+        rows = collapse_near_duplicates(rows, near_dup_threshold, stats)
+    text = rows.groupby('incident_id', sort=True)['detailed_report_text'].agg(' '.join).str.strip()
+    return text.rename('full_report_text')
 
 # 5. Merge classification data (MITRE)
-# Fix field name for merging: rename 'Incident ID' → 'incident_id'
-mit_df.rename(columns={'Incident ID': 'incident_id'}, inplace=True)
-
-# Create a combined classification name: "Domain: Subdomain"
-mit_df['classification_name'] = mit_df['Risk Domain'] + ': ' + mit_df['Risk Subdomain']
-
-# Aggregate MITRE classifications per incident (separated by " | ")
-mit_df_agg = mit_df.groupby('incident_id').agg(
-    mitre_classification=('classification_name', lambda x: ' | '.join(x.unique()))
-).reset_index()
-
-# Final merge: combine incident report summary with MITRE classifications
-final_merged_df = pd.merge(
-    merged_reports_grouped,
-    mit_df_agg,
-    on='incident_id',
-    how='left'
-)
-
-# 6. Save final result as CSV
-final_merged_df.to_csv('merged_incident_data.csv', index=False)
-
-# Preview output
-merge_p = pd.read_csv("merged_incident_data.csv")
-print(merge_p.head())
+def load_mitre(path):
+    """Aggregate MITRE classifications per incident ("Domain: Subdomain", separated by " | ")."""
+    mit_df = pd.read_csv(path, usecols=list(MIT_COLUMNS), dtype=MIT_COLUMNS)
+    # Fix field name for merging: rename 'Incident ID' → 'incident_id'
+    mit_df = mit_df.rename(columns={'Incident ID': 'incident_id'})
+    mit_df['classification_name'] = mit_df['Risk Domain'] + ': ' + mit_df['Risk Subdomain']
+    mit_df = mit_df.dropna(subset=['classification_name']).drop_duplicates(['incident_id', 'classification_name'])
+    return mit_df.groupby('incident_id', sort=True)['classification_name'].agg(' | '.join).rename('mitre_classification')
+
+def finish(meta, text, mitre):
+    """Final merge: incident metadata + report text + MITRE classifications, in output column order."""
+    out = meta.merge(text, left_on='incident_id', right_index=True, how='left')
+    out['full_report_text'] = out['full_report_text'].fillna('')
+    out = out.merge(mitre, left_on='incident_id', right_index=True, how='left')
+    return out.sort_values('incident_id')[OUTPUT_COLUMNS]
+
+def combine_in_memory(snapshot_dir, out_path, near_dup_threshold=0.0, stats=None):
+    incidents_path, reports_path, mit_path = snapshot_paths(snapshot_dir)
+    meta, pairs = load_incidents(incidents_path)
+    reports = next(read_reports(reports_path))
+
+    # 3. Merge reports.csv using 'report_number' as the key
+    rows = pairs.merge(reports, on='report_number', how='left')
+    text = aggregate_report_text(rows, near_dup_threshold, stats)
+    out = finish(meta, text, load_mitre(mit_path))
+    out.to_csv(out_path, index=False)
+    return len(out)
+
+def combine_streaming(snapshot_dir, out_path, chunksize=CHUNKSIZE, near_dup_threshold=0.0, stats=None,
+                      incident_chunksize=INCIDENT_CHUNKSIZE):
+    """
+    Bounded-memory combine: reports.csv is streamed in chunks and each chunk's
+    (incident_id, ord, text) rows are spooled to a temporary SQLite file.
+    Incidents are then read back incident_chunksize at a time, aggregated and
+    appended to the output, so peak memory depends on the two chunk sizes, not
+    on snapshot size. Returns the number of incidents written.
+    """
+    incidents_path, reports_path, mit_path = snapshot_paths(snapshot_dir)
+    meta, pairs = load_incidents(incidents_path)
+    mitre = load_mitre(mit_path)
+    pair_index = pairs.set_index('report_number')[['incident_id', 'ord']]
+
+    spool_dir = os.path.dirname(os.path.abspath(out_path))
+    fd, spool_path = tempfile.mkstemp(suffix='.sqlite', prefix='combine-', dir=spool_dir)
+    os.close(fd)
+    con = sqlite3.connect(spool_path)
+    try:
+        con.execute("PRAGMA journal_mode=OFF")
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("CREATE TABLE rows (incident_id INTEGER, ord INTEGER, text TEXT)")
+        for chunk in read_reports(reports_path, chunksize):
+            chunk = chunk.dropna(subset=['detailed_report_text'])
+            joined = chunk.join(pair_index, on='report_number', how='inner')
+            con.executemany("INSERT INTO rows VALUES (?, ?, ?)",
+                            joined[['incident_id', 'ord', 'detailed_report_text']].itertuples(index=False, name=None))
+        con.execute("CREATE INDEX rows_incident ON rows (incident_id, ord)")
+        con.commit()
+
+        ids = np.sort(meta['incident_id'].to_numpy())
+        tmp_out = out_path + '.tmp'
+        written = 0
+        for start in range(0, len(ids), incident_chunksize):
+            lo, hi = int(ids[start]), int(ids[min(start + incident_chunksize, len(ids)) - 1])
+            rows = pd.read_sql_query(
+                "SELECT incident_id, ord, text AS detailed_report_text FROM rows "
+                "WHERE incident_id BETWEEN ? AND ?", con, params=(lo, hi))
+            part = meta[(meta['incident_id'] >= lo) & (meta['incident_id'] <= hi)]
+            out = finish(part, aggregate_report_text(rows, near_dup_threshold, stats), mitre)
+            out.to_csv(tmp_out, index=False, mode='w' if start == 0 else 'a', header=start == 0)
+            written += len(out)
+        if len(ids) == 0:
+            pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(tmp_out, index=False)
+        os.replace(tmp_out, out_path)
+    finally:
+        con.close()
+        os.remove(spool_path)
+    return written
+
+# 6. Delta mode: only recompute incidents whose inputs changed
+def incident_fingerprints(meta, pairs, mitre, reports_path, chunksize=CHUNKSIZE):
+    """
+    Content hash per incident over its metadata, ordered report list, report texts and
+    MITRE classification. reports.csv is streamed once and each text is reduced to a
+    64-bit hash, so memory is ~16 bytes per report regardless of text size.
+    """
+    report_hash = pd.concat([
+        pd.Series(pd.util.hash_pandas_object(chunk['detailed_report_text'].fillna(''), index=False).to_numpy(),
+                  index=chunk['report_number'].to_numpy())
+        for chunk in read_reports(reports_path, chunksize)
+    ])
+    report_hash = report_hash[~report_hash.index.duplicated(keep='last')]
+
+    rows = pairs.assign(text_hash=report_hash.reindex(pairs['report_number']).fillna(0).astype('uint64').to_numpy())
+    row_hash = pd.util.hash_pandas_object(rows[['incident_id', 'ord', 'report_number', 'text_hash']], index=False)
+    codes, uniques = pd.factorize(rows['incident_id'])
+    acc = np.zeros(len(uniques), dtype='uint64')
+    np.add.at(acc, codes, row_hash.to_numpy())  # order-sensitive via 'ord'; uint64 wraps around
+    reports_fp = pd.Series(acc, index=uniques)
+
+    frame = meta.set_index('incident_id')
+    frame = frame.assign(
+        reports_fp=reports_fp.reindex(frame.index).fillna(0).astype('uint64'),
+        mitre_classification=mitre.reindex(frame.index),
+    ).fillna('')
+    fp = pd.util.hash_pandas_object(frame.astype(str), index=True)
+    return {int(i): format(int(h), '016x') for i, h in fp.items()}
+
+def combine_delta(snapshot_dir, out_path, manifest_path=MANIFEST_FILE, changed_path=CHANGED_IDS_FILE,
+                  chunksize=CHUNKSIZE, near_dup_threshold=0.0, stats=None, incident_chunksize=INCIDENT_CHUNKSIZE):
+    """
+    Compare per-incident fingerprints against the previous manifest, rebuild only the
+    new/changed incidents, drop removed ones, and write the changed-IDs list.
+    Falls back to a full rebuild when there is no previous output or manifest.
+    Returns the number of incidents in the output.
+    """
+    incidents_path, reports_path, mit_path = snapshot_paths(snapshot_dir)
+    meta, pairs = load_incidents(incidents_path)
+    mitre = load_mitre(mit_path)
+    current = incident_fingerprints(meta, pairs, mitre, reports_path, chunksize)
+
+    previous = {}
+    if os.path.exists(manifest_path) and os.path.exists(out_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        # Output depends on the dedup threshold too: a different setting means a full rebuild
+        if (manifest.get('version') == MANIFEST_VERSION
+                and manifest.get('near_dup_threshold', 0.0) == near_dup_threshold):
+            previous = {int(k): v for k, v in manifest['incidents'].items()}
+
+    changed = sorted(i for i, h in current.items() if previous.get(i) != h)
+    removed = sorted(set(previous) - set(current))
+    print(f"[DELTA] {len(current)} incidents | changed/new={len(changed)} | removed={len(removed)} | "
+          f"unchanged={len(current) - len(changed)}")
+
+    if not previous:
+        combine_streaming(snapshot_dir, out_path, chunksize, near_dup_threshold, stats, incident_chunksize)
+    elif changed or removed:
+        # Stream reports again, keeping only texts that belong to changed incidents
+        part_pairs = pairs[pairs['incident_id'].isin(changed)]
+        pair_index = part_pairs.set_index('report_number')[['incident_id', 'ord']]
+        wanted = set(part_pairs['report_number'])
+        rows = [chunk[chunk['report_number'].isin(wanted)].join(pair_index, on='report_number', how='inner')
+                for chunk in read_reports(reports_path, chunksize)]
+        rows = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(
+            columns=['report_number', 'detailed_report_text', 'incident_id', 'ord'])
+        fresh = finish(meta[meta['incident_id'].isin(changed)],
+                       aggregate_report_text(rows, near_dup_threshold, stats), mitre)
+
+        existing = pd.read_csv(out_path, dtype={'incident_id': 'int64'})
+        keep = existing[~existing['incident_id'].isin(changed + removed)]
+        merged = pd.concat([keep, fresh], ignore_index=True).sort_values('incident_id')[OUTPUT_COLUMNS]
+        merged.to_csv(out_path + '.tmp', index=False)
+        os.replace(out_path + '.tmp', out_path)
+
+    with open(changed_path, 'w', encoding='utf-8') as f:
+        json.dump({'changed': changed, 'removed': removed, 'full_rebuild': not previous}, f)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'near_dup_threshold': near_dup_threshold, 'incidents': {str(k): v for k, v in current.items()}}, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    print(f"[DELTA] wrote {changed_path} and {manifest_path}")
+    return len(current)
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Join AIID incidents, reports and MITRE classifications.")
+    ap.add_argument("--snapshot", default=SNAPSHOT_DIR, help="directory with incidents.csv, reports.csv, classifications_MIT.csv")
+    ap.add_argument("--out", default=OUTPUT_FILE)
+    ap.add_argument("--streaming", action="store_true",
+                    help="chunked, bounded-memory mode for full snapshots")
+    ap.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="reports.csv rows read per chunk")
+    ap.add_argument("--incident-chunksize", type=int, default=INCIDENT_CHUNKSIZE,
+                    help="incidents aggregated and written per output chunk (streaming / delta)")
+    ap.add_argument("--delta", action="store_true",
+                    help="only recompute incidents whose reports, texts or MITRE classification changed")
+    ap.add_argument("--manifest", default=MANIFEST_FILE)
+    ap.add_argument("--near-dup-threshold", type=float, default=NEAR_DUP_THRESHOLD,
+                    help="collapse reports of one incident whose MinHash Jaccard is >= this (e.g. 0.8; 0 = off)")
+    ap.add_argument("--dedup-stats", default=DEDUP_STATS_FILE, help="per-incident near-duplicate stats CSV")
+    ap.add_argument("--changed-ids", default=CHANGED_IDS_FILE, help="where --delta writes changed/removed IDs")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    metrics = start_run('combine')
+    stats = []
+    mode = 'delta' if args.delta else 'streaming' if args.streaming else 'in_memory'
+    with metrics.phase(mode):
+        if args.delta:
+            rows = combine_delta(args.snapshot, args.out, args.manifest, args.changed_ids, args.chunksize,
+                                 args.near_dup_threshold, stats, args.incident_chunksize)
+        elif args.streaming:
+            rows = combine_streaming(args.snapshot, args.out, args.chunksize, args.near_dup_threshold, stats,
+                                     args.incident_chunksize)
+        else:
+            rows = combine_in_memory(args.snapshot, args.out, args.near_dup_threshold, stats)
+
+    if args.near_dup_threshold:
+        stats_df = pd.concat(stats, ignore_index=True) if stats else pd.DataFrame(columns=DEDUP_STATS_COLUMNS)
+        stats_df.to_csv(args.dedup_stats, index=False)
+        print(f"[DEDUP] threshold={args.near_dup_threshold} | reports removed="
+              f"{int((stats_df['reports_in'] - stats_df['reports_kept']).sum())} | "
+              f"bytes removed={int(stats_df['bytes_removed'].sum()):,} | "
+              f"est. tokens removed={int(stats_df['est_tokens_removed'].sum()):,} -> {args.dedup_stats}")
+        metrics.count('reports_removed', int((stats_df['reports_in'] - stats_df['reports_kept']).sum()))
+
+    # Preview output (first rows only; the full file can be larger than memory)
+    print(pd.read_csv(args.out, nrows=5))
+    print(f"{rows} incidents -> {args.out}")
+    metrics.add_rows(rows)
+    metrics.finish()
+
+if __name__ == "__main__":
+    main()
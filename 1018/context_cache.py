@@ -0,0 +1,161 @@
+"""
+Provider-side context caching for the static prompt prefix.
+
+Every single-incident prompt starts with the same instructions + AIDEFEND
+catalog block. PrefixCache stores that block once as cached content
+(client.create_cache) and requests then send only the incident suffix with
+cached_content=<name>, so the catalog is neither re-sent nor billed at the full
+input rate on every call.
+
+- the cache is keyed by SHA-256(model, prefix text): editing
+  AI_Defense_Techniques.csv (or the instructions) changes the key, and the old
+  provider cache is deleted and a new one created
+- the handle is kept in STATE_FILE, so the next run (e.g. a delta run) reuses a
+  cache that has not expired yet
+- the TTL is extended when less than REFRESH_MARGIN remains, and once at startup
+  (which also checks that a remembered cache still exists)
+- a request rejected because the cache vanished (404) is retried once with a
+  fresh cache; if the provider cannot cache at all (no support, prefix below its
+  minimum size), requests fall back to the full prompt
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+from llm_clients import CacheHandle
+
+STATE_FILE = 'llm_context_cache.json'
+CACHE_TTL = 3600          # Seconds; storage is billed per hour, so keep it close to the run length
+REFRESH_MARGIN = 0.25     # Extend the TTL once less than this share of it is left
+
+
+def prefix_key(model: str, prefix: str) -> str:
+    return hashlib.sha256(f"{model}\0{prefix}".encode('utf-8')).hexdigest()
+
+
+class PrefixCache:
+    """Lazily created, refreshed and invalidated cached content for one (model, prefix)."""
+
+    def __init__(self, client, model: str, prefix: str, ttl: float = CACHE_TTL,
+                 state_path: Optional[str] = STATE_FILE):
+        self.client = client
+        self.model = model
+        self.prefix = prefix
+        self.ttl = ttl
+        self.state_path = state_path
+        self.key = prefix_key(model, prefix)
+        self.enabled = hasattr(client, 'create_cache')
+        self.handle: Optional[CacheHandle] = None
+        self.stale: Optional[str] = None      # Remembered cache for an older catalog, deleted on first use
+        self.verified = False
+        self.stats = {'created': 0, 'refreshed': 0, 'invalidated': 0, 'requests': 0, 'fallback_requests': 0}
+        self._lock = None
+        self._load_state()
+
+    def _load_state(self) -> None:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except ValueError:
+            return
+        if state.get('key') == self.key and state.get('expires_at', 0) > time.time():
+            self.handle = CacheHandle(state['name'], state['expires_at'], state.get('tokens', 0))
+        elif state.get('key') != self.key and state.get('name'):
+            self.stale = state['name']
+
+    def _save_state(self) -> None:
+        if not self.state_path:
+            return
+        state = {'key': self.key, 'model': self.model} if self.handle is None else {
+            'key': self.key, 'model': self.model, 'name': self.handle.name,
+            'expires_at': self.handle.expires_at, 'tokens': self.handle.tokens}
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=1)
+        os.replace(tmp, self.state_path)
+
+    async def name(self) -> Optional[str]:
+        """Name of a live cache for the prefix (created or refreshed as needed), or None to send it inline."""
+        if not self.enabled:
+            return None
+        if self._lock is None:  # Created lazily so the lock binds to the running loop
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.stale:
+                print("🧊 Defense catalog or prompt changed: dropping the old context cache")
+                try:
+                    await self.client.delete_cache(self.stale)
+                except Exception:
+                    pass  # Already expired or deleted
+                self.stale = None
+
+            now = time.time()
+            if self.handle is not None and (not self.verified
+                                            or self.handle.expires_at - now < self.ttl * REFRESH_MARGIN):
+                try:
+                    self.handle.expires_at = await self.client.refresh_cache(self.handle.name, self.ttl)
+                    self.stats['refreshed'] += 1
+                    self.verified = True
+                    self._save_state()
+                except Exception:
+                    self.handle = None  # Gone on the provider side: create a new one below
+
+            if self.handle is None:
+                try:
+                    handle = await self.client.create_cache(self.model, self.prefix, self.ttl)
+                    if not getattr(handle, 'name', None):
+                        raise ValueError("the provider returned a cache without a name")
+                except Exception as e:
+                    print(f"⚠️  Context caching unavailable ({e}); sending the full prompt with every request")
+                    self.enabled = False
+                    return None
+                self.handle = handle
+                self.stats['created'] += 1
+                self.verified = True
+                self._save_state()
+                print(f"🧊 Context cache created: {self.handle.tokens:,} prefix tokens, TTL {self.ttl:.0f}s")
+            return self.handle.name
+
+    def invalidate(self, name: str) -> None:
+        """Forget a cache the provider no longer knows about."""
+        if self.handle is not None and self.handle.name == name:
+            self.handle = None
+            self.stats['invalidated'] += 1
+
+    async def generate(self, engine, suffix: str, response_schema: dict):
+        """engine.generate() with the prefix served from the cache when possible."""
+        for attempt in range(2):
+            name = await self.name()
+            if name is None:
+                self.stats['fallback_requests'] += 1
+                return await engine.generate(self.prefix + suffix, response_schema, model=self.model)
+            try:
+                reply = await engine.generate(suffix, response_schema, model=self.model, cached_content=name)
+            except Exception as e:
+                if getattr(e, 'code', None) != 404:
+                    raise
+                if attempt == 0:
+                    if engine.metrics is not None:
+                        engine.metrics.llm_retry(e)
+                    self.invalidate(name)  # Expired or deleted between refreshes
+                    continue
+                if engine.metrics is not None:
+                    engine.metrics.llm_error(e)
+                raise
+            self.stats['requests'] += 1
+            return reply
+
+    def summary(self) -> str:
+        s = self.stats
+        if not (s['requests'] or s['created'] or s['refreshed']):
+            return f"Context cache: not used ({s['fallback_requests']} requests sent the full prompt)"
+        tokens = self.handle.tokens if self.handle else 0
+        return (f"Context cache: {s['requests']} requests served from cached content "
+                f"({tokens:,} prefix tokens each, ~{tokens * s['requests']:,} not re-sent); "
+                f"created {s['created']}, refreshed {s['refreshed']}, invalidated {s['invalidated']}")
@@ -5,11 +5,16 @@ Extract AI defense techniques (and subTechniques) from your tactic JS files and
 Prints per-file counts for easy debugging.
 
 Usage:
-  python defendlist.py
+  python defendlist.py              # single-pass parser, parallel + cached
+  python defendlist.py --legacy     # original regex parser
+  python defendlist.py --bench      # parity + speed: legacy vs single-pass parser
 """
 
-import os, re, csv
-from typing import List, Tuple
+import argparse, csv, hashlib, json, os, re, time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from instrumentation import start_run
 
 # Your file list (in the relative paths you provided earlier)
 FILES = [
@@ -23,6 +28,8 @@ FILES = [
 ]
 
 OUT_PATH = "AI_Defense_Techniques.csv"
+CACHE_PATH = ".defendlist_cache.json"  # Parsed tactic files keyed by path + mtime/size/sha256
+CACHE_VERSION = 1
 
 def read_text(p: str) -> str:
     with open(p, "r", encoding="utf-8") as f:
@@ -184,25 +191,288 @@ def fallback_scan(text: str):
             results.append({"id": tid, "name": tname, "description": desc})
     return results
 
+# ---------------------------------------------------------------------------
+# Single-pass parser: one regex tokenizer pass over the file, then a recursive
+# descent over the tokens that builds the whole technique tree. Fields are read
+# from the object they belong to, so a parent never picks up a child's value.
+# ---------------------------------------------------------------------------
+
+TOKEN_RE = re.compile(r"""
+    (?P<skip>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<str>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|`(?:[^`\\]|\\.)*`)
+  | (?P<punct>[{}\[\]:,])
+  | (?P<word>[A-Za-z0-9_$.+\-]+)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0"}
+ESCAPE_RE = re.compile(r"\\(u\{[0-9a-fA-F]+\}|u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|\n|.)", re.DOTALL)
+
+def _unescape(m) -> str:
+    e = m.group(1)
+    if e[0] in "ux" and len(e) > 1:
+        return chr(int(e.strip("u{}x"), 16))
+    if e == "\n":
+        return ""  # line continuation
+    return ESCAPES.get(e, e)
+
+def tokenize_js(text: str) -> List[Tuple[str, str]]:
+    """(kind, value) tokens with whitespace/comments dropped and strings decoded."""
+    toks = []
+    for m in TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        if kind == "skip":
+            continue
+        v = m.group()
+        if kind == "str":
+            v = ESCAPE_RE.sub(_unescape, v[1:-1])
+        toks.append((kind, v))
+    return toks
+
+class JSLiteralParser:
+    """Recursive descent over object/array literals; unknown expressions are skipped."""
+
+    LITERALS = {"true": True, "false": False, "null": None, "undefined": None}
+
+    def __init__(self, toks: List[Tuple[str, str]]):
+        self.toks = toks
+        self.i = 0
+
+    def peek(self) -> Tuple[str, str]:
+        return self.toks[self.i] if self.i < len(self.toks) else ("eof", "")
+
+    def value(self):
+        kind, v = self.peek()
+        if v == "{" and kind == "punct":
+            return self.obj()
+        if v == "[" and kind == "punct":
+            return self.arr()
+        self.i += 1
+        if kind == "str":
+            # "a" + "b" string concatenation
+            while self.peek() == ("word", "+") and self.i + 1 < len(self.toks) and self.toks[self.i + 1][0] == "str":
+                v += self.toks[self.i + 1][1]
+                self.i += 2
+            return v
+        if kind == "word":
+            return self.LITERALS.get(v, v)
+        return None
+
+    def skip_expr(self) -> None:
+        """Skip the rest of an expression up to the next , } or ] at this nesting level."""
+        depth = 0
+        while self.i < len(self.toks):
+            kind, v = self.toks[self.i]
+            if kind == "punct":
+                if v in "{[":
+                    depth += 1
+                elif v in "}]":
+                    if depth == 0:
+                        return
+                    depth -= 1
+                elif v == "," and depth == 0:
+                    return
+            self.i += 1
+
+    def obj(self) -> dict:
+        out = {}
+        self.i += 1  # '{'
+        while self.i < len(self.toks):
+            kind, v = self.peek()
+            if kind == "punct" and v == "}":
+                self.i += 1
+                return out
+            if kind == "punct" and v == ",":
+                self.i += 1
+                continue
+            self.i += 1
+            if self.peek() == ("punct", ":"):
+                self.i += 1
+                out[v] = self.value()
+            self.skip_expr()
+        return out
+
+    def arr(self) -> list:
+        out = []
+        self.i += 1  # '['
+        while self.i < len(self.toks):
+            kind, v = self.peek()
+            if kind == "punct" and v == "]":
+                self.i += 1
+                return out
+            if kind == "punct" and v == ",":
+                self.i += 1
+                continue
+            out.append(self.value())
+            self.skip_expr()
+        return out
+
+    def top_level(self) -> list:
+        """All object/array literals that appear at the top level of the file."""
+        found = []
+        while self.i < len(self.toks):
+            kind, v = self.peek()
+            if kind == "punct" and v in "{[":
+                found.append(self.value())
+            else:
+                self.i += 1
+        return found
+
+def _tactic_objects(node):
+    """Depth-first search for objects that carry a 'techniques' array."""
+    if isinstance(node, dict):
+        if isinstance(node.get("techniques"), list):
+            yield node
+            return
+        for v in node.values():
+            yield from _tactic_objects(v)
+    elif isinstance(node, list):
+        for v in node:
+            yield from _tactic_objects(v)
+
+def _field(obj: dict, key: str) -> str:
+    v = obj.get(key)
+    return collapse_ws(v if isinstance(v, str) else ("" if v is None else str(v)))
+
+def parse_fast(text: str):
+    """Same result shape as parse_one(text, include_sub=True), built from one tokenizer pass."""
+    tactics = [t for node in JSLiteralParser(tokenize_js(text)).top_level() for t in _tactic_objects(node)]
+    tactic = _field(tactics[0], "name") if tactics else ""
+    techniques, subs = [], []
+    for t in tactics:
+        for obj in t["techniques"]:
+            if not isinstance(obj, dict):
+                continue
+            tid = _field(obj, "id")
+            techniques.append({"id": tid, "name": _field(obj, "name"), "description": _field(obj, "description")})
+            for sobj in obj.get("subTechniques") or []:
+                if isinstance(sobj, dict):
+                    subs.append({"parent_id": tid, "id": _field(sobj, "id"),
+                                 "name": _field(sobj, "name"), "description": _field(sobj, "description")})
+    return tactic, techniques, subs
+
+def file_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def parse_file(path: str, cached: Optional[dict] = None) -> dict:
+    """
+    Parse one tactic file, reusing `cached` when mtime/size are unchanged, or when
+    the content hash still matches after a touch. Runs in a worker process.
+    """
+    st = os.stat(path)
+    if cached and cached.get("mtime_ns") == st.st_mtime_ns and cached.get("size") == st.st_size:
+        return cached
+    text = read_text(path)
+    digest = file_digest(text)
+    if cached and cached.get("sha256") == digest:
+        return dict(cached, mtime_ns=st.st_mtime_ns, size=st.st_size)
+    tactic, techs, subs = parse_fast(text)
+    if not techs:
+        fb = fallback_scan(text)
+        if fb:
+            print(f"[INFO] fallback used for {os.path.basename(path)} -> {len(fb)} items")
+            techs = fb
+    return {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "sha256": digest,
+            "tactic": tactic, "techniques": techs, "subs": subs}
+
+def load_cache(path: str) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if cache.get("version") == CACHE_VERSION else {}
+    except (OSError, ValueError):
+        return {}
+
+def parse_all(paths: List[str], jobs: int = 0, cache_path: Optional[str] = CACHE_PATH) -> Dict[str, dict]:
+    """Parse tactic files in parallel worker processes, with an on-disk cache keyed by mtime/hash."""
+    cache = load_cache(cache_path).get("files", {}) if cache_path else {}
+    results = {}
+    workers = jobs or min(len(paths), os.cpu_count() or 1)
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {p: pool.submit(parse_file, p, cache.get(os.path.abspath(p))) for p in paths}
+            results = {p: f.result() for p, f in futures.items()}
+    else:
+        results = {p: parse_file(p, cache.get(os.path.abspath(p))) for p in paths}
+    if cache_path:
+        with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION,
+                       "files": {os.path.abspath(p): r for p, r in results.items()}}, f, ensure_ascii=False)
+        os.replace(cache_path + ".tmp", cache_path)
+    return results
+
+def benchmark(paths: List[str], repeat: int = 5) -> None:
+    """Compare the legacy regex parser with parse_fast: output parity and per-file speed."""
+    print(f"{'file':<14}{'legacy ms':>11}{'fast ms':>10}{'speedup':>9}  parity")
+    for path in paths:
+        text = read_text(path)
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            legacy = parse_one(text, include_sub=True)
+        t1 = time.perf_counter()
+        for _ in range(repeat):
+            fast = parse_fast(text)
+        t2 = time.perf_counter()
+        lt, ft = (t1 - t0) / repeat * 1000, (t2 - t1) / repeat * 1000
+        if legacy == fast:
+            parity = "identical"
+        else:
+            rows_l = legacy[1] + legacy[2]
+            rows_f = fast[1] + fast[2]
+            diff = sum(a != b for a, b in zip(rows_l, rows_f)) + abs(len(rows_l) - len(rows_f))
+            parity = f"{diff} differing rows (legacy={len(rows_l)}, fast={len(rows_f)})"
+        print(f"{os.path.basename(path):<14}{lt:>11.2f}{ft:>10.2f}{lt / max(ft, 1e-9):>8.1f}x  {parity}")
+
+def parse_legacy(path: str) -> dict:
+    text = read_text(path)
+    tactic, techs, subs = parse_one(text, include_sub=True)
+
+    # If no techniques were extracted at all, trigger fallback
+    if not techs:
+        fb = fallback_scan(text)
+        if fb:
+            print(f"[INFO] fallback used for {os.path.basename(path)} -> {len(fb)} items")
+            techs = fb
+    return {"tactic": tactic, "techniques": techs, "subs": subs}
+
 def main():
-    rows = []
-    total_tech, total_sub = 0, 0
+    ap = argparse.ArgumentParser(description="Export AIDEFEND techniques from the tactic JS files to CSV.")
+    ap.add_argument("--legacy", action="store_true", help="use the original regex-based parser")
+    ap.add_argument("--bench", action="store_true", help="compare legacy and single-pass parsers, write nothing")
+    ap.add_argument("--jobs", type=int, default=0, help="parser processes (0 = one per file, up to CPU count)")
+    ap.add_argument("--no-cache", action="store_true", help=f"ignore and do not update {CACHE_PATH}")
+    ap.add_argument("--tactics-dir", default=None, help="directory with the tactic JS files (default: paths in FILES)")
+    ap.add_argument("--out", default=OUT_PATH)
+    args = ap.parse_args()
 
-    for path in FILES:
+    files = FILES
+    if args.tactics_dir:
+        files = [os.path.join(args.tactics_dir, os.path.basename(f)) for f in FILES]
+    paths = []
+    for path in files:
         if not os.path.exists(path):
             print(f"[WARN] not found: {path}")
             continue
+        paths.append(path)
 
-        text = read_text(path)
-        tactic, techs, subs = parse_one(text, include_sub=True)
+    if args.bench:
+        benchmark(paths)
+        return
+
+    metrics = start_run('defendlist')
+    t0 = time.perf_counter()
+    with metrics.phase('parse'):
+        if args.legacy:
+            parsed = {p: parse_legacy(p) for p in paths}
+        else:
+            parsed = parse_all(paths, args.jobs, None if args.no_cache else CACHE_PATH)
+    elapsed = time.perf_counter() - t0
 
-        # If no techniques were extracted at all, trigger fallback
-        if not techs:
-            fb = fallback_scan(text)
-            if fb:
-                print(f"[INFO] fallback used for {os.path.basename(path)} -> {len(fb)} items")
-                techs = fb
+    rows = []
+    total_tech, total_sub = 0, 0
 
+    for path in paths:
+        tactic, techs, subs = parsed[path]["tactic"], parsed[path]["techniques"], parsed[path]["subs"]
         print(f"[OK] {os.path.basename(path)} | tactic='{tactic or '?'}' | techniques={len(techs)} | subTechniques={len(subs)}")
 
         total_tech += len(techs)
@@ -230,7 +500,7 @@ def main():
             })
 
     # Export CSV
-    with open(OUT_PATH, "w", encoding="utf-8", newline="") as f:
+    with open(args.out, "w", encoding="utf-8", newline="") as f:
         writer = csv.DictWriter(f, fieldnames=[
             "Source File","Tactic","Level","Parent Technique ID",
             "Technique ID","Technique Name","Description"
@@ -238,8 +508,11 @@ def main():
         writer.writeheader()
         writer.writerows(rows)
 
-    print(f"\nDone. Wrote {len(rows)} rows -> {os.path.abspath(OUT_PATH)}")
-    print(f"  Techniques: {total_tech} | SubTechniques: {total_sub}")
+    print(f"\nDone. Wrote {len(rows)} rows -> {os.path.abspath(args.out)}")
+    print(f"  Techniques: {total_tech} | SubTechniques: {total_sub} | parsed in {elapsed * 1000:.0f} ms")
+    metrics.add_rows(len(rows))
+    metrics.count('files', len(paths))
+    metrics.finish()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+"""
+Defense -> incidents reverse index with sub-technique rollup and per-tactic counts.
+
+Built once at export time by tojson.py (defense_index.json) so the UI and
+server.py answer "which incidents does AID-M-004 cover?" or "incidents per
+Tactic" with a dict lookup instead of splitting every mapping row:
+
+    {"version": 1,
+     "defenses": {"AID-D-003": {"tactic": "Detect", "parent_id": "",
+                                "incidents": [12, 40],            # mapped directly
+                                "rollup_incidents": [3, 12, 40],  # + its sub-techniques (parents only)
+                                "incident_count": 2, "rollup_count": 3}, ...},
+     "tactics":  {"Detect": {"defenses": 31,      # techniques with at least one incident
+                             "incidents": 58,     # distinct incidents
+                             "mappings": 140}},   # incident/defense pairs
+     "unknown_ids": ["AID-X-999"]}                # mapped but not in the catalog
+"""
+
+from typing import Dict, Iterable, List
+
+INDEX_VERSION = 1
+
+
+def split_ids(value) -> List[str]:
+    """matched_defense_ids as exported (comma-joined string) or already a list."""
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value or '').split(',') if v.strip()]
+
+
+def parent_of(defense_id: str, parent_id: str = '') -> str:
+    """Parent technique: the catalog column when set, else the ID before the '.' (AID-D-003.001 -> AID-D-003)."""
+    parent_id = str(parent_id or '').strip()
+    if parent_id:
+        return parent_id
+    return defense_id.rsplit('.', 1)[0] if '.' in defense_id else ''
+
+
+def build_defense_index(mapping: Iterable[dict], defenses: Iterable[dict]) -> dict:
+    """
+    mapping: records with incident_id / matched_defense_ids (mapping.json).
+    defenses: records with defense_id / tactic / parent_id (defenses.json).
+    """
+    catalog = {}
+    for d in defenses:
+        did = str(d.get('defense_id', '')).strip()
+        if did:
+            catalog[did] = {'tactic': d.get('tactic', '') or '',
+                            'parent_id': parent_of(did, d.get('parent_id', '')),
+                            'incidents': set()}
+
+    children = {}
+    for did, entry in catalog.items():
+        if entry['parent_id']:
+            children.setdefault(entry['parent_id'], []).append(did)
+
+    unknown = set()
+    tactic_incidents, tactic_mappings = {}, {}
+    for m in mapping:
+        iid = m['incident_id']
+        for did in set(split_ids(m.get('matched_defense_ids'))):
+            entry = catalog.get(did)
+            if entry is None:
+                unknown.add(did)
+                continue
+            entry['incidents'].add(iid)
+            tactic = entry['tactic']
+            tactic_incidents.setdefault(tactic, set()).add(iid)
+            tactic_mappings[tactic] = tactic_mappings.get(tactic, 0) + 1
+
+    out: Dict[str, dict] = {}
+    for did, entry in catalog.items():
+        incidents = sorted(entry['incidents'])
+        record = {'tactic': entry['tactic'], 'parent_id': entry['parent_id'],
+                  'incidents': incidents, 'incident_count': len(incidents)}
+        if did in children:
+            rollup = set(entry['incidents'])
+            for child in children[did]:
+                rollup |= catalog[child]['incidents']
+            record['rollup_incidents'] = sorted(rollup)
+            record['rollup_count'] = len(rollup)
+        else:
+            record['rollup_count'] = len(incidents)
+        out[did] = record
+
+    tactics = {}
+    for did, entry in catalog.items():
+        t = tactics.setdefault(entry['tactic'], {'defenses': 0, 'incidents': 0, 'mappings': 0})
+        t['defenses'] += bool(entry['incidents'])
+    for tactic, t in tactics.items():
+        t['incidents'] = len(tactic_incidents.get(tactic, ()))
+        t['mappings'] = tactic_mappings.get(tactic, 0)
+
+    return {'version': INDEX_VERSION, 'defenses': out,
+            'tactics': dict(sorted(tactics.items())), 'unknown_ids': sorted(unknown)}
+
+
+def incidents_for(index: dict, defense_id: str, rollup: bool = False) -> List:
+    """Incident ids mapped to a defense; with rollup, a parent also covers its sub-techniques."""
+    entry = index['defenses'].get(defense_id)
+    if entry is None:
+        return []
+    if rollup and 'rollup_incidents' in entry:
+        return entry['rollup_incidents']
+    return entry['incidents']
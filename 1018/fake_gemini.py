@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Gemini REST API (generateContent) with injected latency and errors.
+Answers with 3-5 defense IDs picked deterministically from the catalog in the prompt,
+so mapping runs can be benchmarked without an API key.
+
+FakeGeminiClient is the same stand-in in-process (no HTTP, no SDK), for
+generate_mapping.py --fake and the benchmark harness. It also implements context
+caching (create/refresh/delete, TTL expiry, minimum size) and counts how many
+catalog-prefix tokens were billed at the full input rate vs served from a cache.
+The HTTP server does not: cachedContents requests get a 404, so generate_mapping.py
+falls back to sending the full prompt.
+"flash"/"lite" models answer faster but a share of their answers is invalid
+(a fabricated ID or too few IDs), for testing the model cascade (cascade.py).
+
+Usage:
+  python fake_gemini.py --port 8765 --latency 2.0 --jitter 0.5 --error-rate 0.05
+  python generate_mapping.py --base-url http://127.0.0.1:8765 --api-key fake --concurrency 32
+  python generate_mapping.py --fake --fake-latency 0.2 --fake-error-rate 0.05
+"""
+
+import argparse, asyncio, json, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_clients import CacheHandle, LLMHTTPError, LLMReply
+
+ID_RE = re.compile(r"\bAID-[A-Z]+-\d+(?:\.\d+)?\b")
+INCIDENT_RE = re.compile(r"Incident ID:\s*(\d+)")
+MIN_CACHE_TOKENS = 1024   # Smallest cacheable content Gemini accepts (model-dependent)
+CHEAP_MODELS = ("flash", "lite")
+CHEAP_LATENCY = 0.3       # Latency factor of cheap models
+MAX_PROMPT_TOKENS = 1_048_576   # Context window; longer prompts fail with 400
+
+
+def estimate_tokens(text: str) -> int:
+    # Same rough 4-chars-per-token heuristic Gemini documents for English text
+    return max(1, len(text) // 4)
+
+
+def fake_pick(incident_id: int, catalog: list) -> dict:
+    """Deterministic pseudo-answer: same incident + catalog -> same defense IDs."""
+    rng = random.Random(incident_id)
+    k = min(len(catalog), rng.randint(3, 5))
+    return {"incident_id": incident_id, "matched_defense_ids": rng.sample(catalog, k)}
+
+
+def degrade(answer: dict, model: str, weak_rate: float) -> dict:
+    """Cheap-model answer: deterministic per (incident, model), invalid with probability weak_rate."""
+    rng = random.Random(f"{model}:{answer['incident_id']}")
+    r = rng.random()
+    if r < weak_rate / 2:
+        answer["matched_defense_ids"] = answer["matched_defense_ids"][:-1] + ["AID-X-999"]
+    elif r < weak_rate:
+        answer["matched_defense_ids"] = answer["matched_defense_ids"][:2]
+    answer["confidence"] = round(rng.uniform(0.2, 0.7) if r < weak_rate else rng.uniform(0.5, 1.0), 2)
+    return answer
+
+
+def fake_answer(prompt: str, batched: bool = False, partial: bool = False):
+    """Single-incident object, or an array with one object per 'Incident ID:' for batch prompts."""
+    catalog = list(dict.fromkeys(ID_RE.findall(prompt)))
+    ids = [int(x) for x in INCIDENT_RE.findall(prompt)] or [0]
+    if not batched:
+        return fake_pick(ids[0], catalog)
+    answers = [fake_pick(i, catalog) for i in ids]
+    return answers[:-1] if partial and len(answers) > 1 else answers
+
+
+class FakeGeminiClient:
+    """In-process client with the GeminiClient interface: simulated latency, injected 429/5xx, fake answers."""
+
+    def __init__(self, latency: float = 1.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 partial_rate: float = 0.0, seed: int = None, weak_rate: float = 0.2,
+                 token_latency: float = 0.0, max_prompt_tokens: int = MAX_PROMPT_TOKENS):
+        self.latency, self.jitter = latency, jitter
+        self.token_latency = token_latency          # Extra seconds per 1k uncached prompt tokens (prefill)
+        self.max_prompt_tokens = max_prompt_tokens
+        self.weak_rate = weak_rate
+        self.error_rate, self.partial_rate = error_rate, partial_rate
+        self.rng = random.Random(seed)
+        self.caches = {}   # name -> [text, expires_at, tokens]
+        # prefix_tokens: text before the first incident billed at the full input rate;
+        # cached_tokens: prefix served from cached content instead
+        self.stats = {"requests": 0, "errors": 0, "prompt_tokens": 0, "prefix_tokens": 0,
+                      "cached_tokens": 0, "cache_writes": 0}
+
+    async def generate(self, model: str, prompt: str, response_schema: dict, cached_content: str = None):
+        cheap = any(c in (model or "") for c in CHEAP_MODELS)
+        scale = CHEAP_LATENCY if cheap else 1.0
+        prefill = self.token_latency * estimate_tokens(prompt) / 1000
+        await asyncio.sleep(max(0.0, self.rng.gauss(self.latency * scale, self.jitter * scale)) + prefill * scale)
+        self.stats["requests"] += 1
+        if self.rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            raise LLMHTTPError(self.rng.choice([429, 500, 503]), "injected error")
+        cached_text, cached_tokens = "", 0
+        if cached_content is not None:
+            cache = self.caches.get(cached_content)
+            if cache is None or cache[1] <= time.time():
+                raise LLMHTTPError(404, f"cached content {cached_content} not found")
+            cached_text, cached_tokens = cache[0], cache[2]
+        first = INCIDENT_RE.search(prompt)
+        self.stats["prefix_tokens"] += estimate_tokens(prompt[:first.start()]) if first else 0
+        self.stats["cached_tokens"] += cached_tokens
+        prompt_tokens = estimate_tokens(prompt) + cached_tokens
+        if prompt_tokens > self.max_prompt_tokens:
+            self.stats["errors"] += 1
+            raise LLMHTTPError(400, f"prompt has {prompt_tokens} tokens, limit is {self.max_prompt_tokens}")
+        self.stats["prompt_tokens"] += prompt_tokens
+        batched = str((response_schema or {}).get("type", "")).upper() == "ARRAY"
+        answer = fake_answer(cached_text + prompt, batched, self.rng.random() < self.partial_rate)
+        if cheap and not batched:
+            answer = degrade(answer, model, self.weak_rate)
+        text = json.dumps(answer)
+        return LLMReply(text=text, prompt_tokens=prompt_tokens, response_tokens=estimate_tokens(text),
+                        cached_tokens=cached_tokens)
+
+    async def create_cache(self, model: str, text: str, ttl: float) -> CacheHandle:
+        tokens = estimate_tokens(text)
+        if tokens < MIN_CACHE_TOKENS:
+            raise LLMHTTPError(400, f"cached content is too small ({tokens} < {MIN_CACHE_TOKENS} tokens)")
+        name = f"cachedContents/fake-{len(self.caches) + 1}"
+        self.caches[name] = [text, time.time() + ttl, tokens]
+        self.stats["cache_writes"] += tokens
+        return CacheHandle(name=name, expires_at=self.caches[name][1], tokens=tokens)
+
+    async def refresh_cache(self, name: str, ttl: float) -> float:
+        cache = self.caches.get(name)
+        if cache is None or cache[1] <= time.time():
+            raise LLMHTTPError(404, f"cached content {name} not found")
+        cache[1] = time.time() + ttl
+        return cache[1]
+
+    async def delete_cache(self, name: str) -> None:
+        if self.caches.pop(name, None) is None:
+            raise LLMHTTPError(404, f"cached content {name} not found")
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    latency = 1.0
+    jitter = 0.0
+    error_rate = 0.0
+    partial_rate = 0.0
+    stats = {"requests": 0, "errors": 0, "prompt_tokens": 0}
+    stats_lock = threading.Lock()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if "cachedContents" in self.path:   # Context caching is only faked in-process (FakeGeminiClient)
+            return self._send(404, {"error": {"code": 404, "message": "context caching is not supported",
+                                              "status": "NOT_FOUND"}})
+        prompt = "".join(
+            part.get("text", "")
+            for content in request.get("contents", [])
+            for part in content.get("parts", [])
+        )
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        with self.stats_lock:
+            self.stats["requests"] += 1
+            if random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                code = random.choice([429, 500, 503])
+                return self._send(code, {"error": {"code": code, "message": "injected error", "status": "UNAVAILABLE"}})
+            prompt_tokens = estimate_tokens(prompt)
+            self.stats["prompt_tokens"] += prompt_tokens
+
+        schema = request.get("generationConfig", {}).get("responseSchema") or {}
+        batched = str(schema.get("type", "")).upper() == "ARRAY"
+        text = json.dumps(fake_answer(prompt, batched, random.random() < self.partial_rate))
+        self._send(200, {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": estimate_tokens(text),
+                "totalTokenCount": prompt_tokens + estimate_tokens(text),
+            },
+        })
+
+    def do_GET(self):
+        # /stats: counters for benchmark scripts
+        with self.stats_lock:
+            self._send(200, dict(self.stats))
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, latency: float = 1.0,
+          jitter: float = 0.0, error_rate: float = 0.0, partial_rate: float = 0.0) -> ThreadingHTTPServer:
+    FakeGeminiHandler.latency = latency
+    FakeGeminiHandler.jitter = jitter
+    FakeGeminiHandler.error_rate = error_rate
+    FakeGeminiHandler.partial_rate = partial_rate
+    server = ThreadingHTTPServer((host, port), FakeGeminiHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=1.0, help="mean response latency in seconds")
+    ap.add_argument("--jitter", type=float, default=0.0, help="latency standard deviation in seconds")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429/5xx")
+    ap.add_argument("--partial-rate", type=float, default=0.0,
+                    help="fraction of batched answers that drop their last incident")
+    args = ap.parse_args()
+
+    server = serve(args.host, args.port, args.latency, args.jitter, args.error_rate, args.partial_rate)
+    print(f"[OK] fake Gemini listening on http://{args.host}:{args.port} "
+          f"(latency={args.latency}s±{args.jitter}s, error_rate={args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
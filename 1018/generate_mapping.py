@@ -1,153 +1,455 @@
-import pandas as pd
+import argparse
+import asyncio
 import json
 import os
-from google import genai 
-from google.genai import types 
-import random  # Only used for fallback random ID when errors occur, preventing crashes
+import sys
+import time
+
+import pandas as pd
 
-# --- 1. File settings and API client initialization ---
+from chunking import CHUNK_TOKENS, MODES as OVERSIZE_MODES, ReportBudget, report_tokens, trim_report
+from cascade import AGREEMENT_POOL, LOCAL, MIN_CONFIDENCE, MIN_SIMILARITY, Cascade, local_candidates
+from context_cache import CACHE_TTL, STATE_FILE as CONTEXT_CACHE_STATE, PrefixCache
+from fake_gemini import MAX_PROMPT_TOKENS, FakeGeminiClient
+from instrumentation import start_run
+from llm_clients import GeminiClient
+from llm_engine import MappingEngine
+from result_cache import ResultCache, cache_key
+from retrieval import DefenseIndex, incident_query
+from similarity_mapper import PER_TACTIC, TOP_K as LOCAL_K, SimilarityMapper, incident_text
+from batching import (BATCH_PROMPT_TEMPLATE, MAX_BATCH_SIZE, BatchMapper, estimate_tokens,
+                      incident_block, pack_batches, savings_report)
+
+# --- 1. File settings and engine defaults ---
 INCIDENTS_FILE = 'merged_incident_data.csv'
 DEFENSES_FILE = 'AI_Defense_Techniques.csv'
 OUTPUT_MAPPING_FILE = 'llm_defense_mapping.csv'
+CACHE_FILE = 'llm_mapping_cache.jsonl'  # Append-only result cache (see result_cache.py)
 MODEL_NAME = "gemini-2.5-pro"  # Recommended model
 
-# Initialize Gemini client
-try:
-    client = genai.Client()
-    print("✅ Gemini client initialized successfully.")
-except Exception as e:
-    print(f"❌ Error: Failed to initialize Gemini client. Please check your GEMINI_API_KEY environment variable. Error: {e}")
-    exit()
+CONCURRENCY = 8              # Max in-flight requests
+REQUESTS_PER_MINUTE = 60     # Token-bucket refill rate shared by all workers
+MAX_RETRIES = 5              # Retries for 429 / 5xx before giving up on an incident
+TOP_K = 0                    # Shortlist size from the local BM25 prefilter (0 = full catalog)
+BATCH_TOKENS = 0             # Token budget per multi-incident request (0 = one incident per request)
+REPORT_TOKENS = 0            # Report-text budget per incident (0 = always send every report; see chunking.py)
+
+# JSON output schema (plain dict so any client can forward it)
+RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "incident_id": {"type": "INTEGER"},
+        "matched_defense_ids": {
+            "type": "ARRAY",
+            "description": "List of 3 to 5 matching AIDEFEND Technique IDs.",
+            "items": {"type": "STRING"},
+        },
+    },
+}
 
 # --- 2. Prepare AIDEFEND defense knowledge base ---
-try:
-    defense_df = pd.read_csv(DEFENSES_FILE)
+def load_defense_catalog(path=DEFENSES_FILE):
+    """Load the defense CSV and add the LLM-friendly 'LLM_Entry' column."""
+    defense_df = pd.read_csv(path)
     defense_df.rename(columns={
         'Technique ID': 'defense_id',
         'Technique Name': 'name',
         'Description': 'description'
     }, inplace=True)
-    
+
     # Create an LLM-friendly entry format (ID: Name - Truncated Description)
     defense_df['LLM_Entry'] = (
         defense_df['defense_id'] + ': ' +
         defense_df['name'] + ' - ' +
         defense_df['description'].fillna('').str.slice(0, 100).str.replace('\n', ' ') + '...'
     )
-    
-    DEFENSE_LIST_STR = "\n".join(defense_df['LLM_Entry'].tolist())
-    DEFENSE_IDS = defense_df['defense_id'].tolist()
-    print(f"✅ Loaded {len(DEFENSE_IDS)} defense techniques into LLM knowledge base.")
-
-except FileNotFoundError:
-    print(f"❌ Error: Defense list file not found: {DEFENSES_FILE}")
-    exit()
+    return defense_df
 
 # --- 3. Prompt structure for the LLM ---
-def generate_llm_prompt(incident_data, defense_list):
-    """Generate the LLM prompt using incident data and defense list."""
-    
-    prompt = f"""
+# Static prefix (instructions + catalog) first, incident last: the prefix is identical
+# for every request, so it can be stored once as provider-side cached content
+# (see context_cache.py) and each request only sends the suffix.
+PROMPT_PREFIX_TEMPLATE = """
     You are a top-tier AI security analyst. Your task is to analyze an AI incident and select 3 to 5 AIDEFEND defense technique IDs that are most relevant and effective at mitigating this incident.
 
+    【Task Requirements】
+    1. Identify the core attack mechanism and affected AI components.
+    2. Select 3 to 5 defense technique IDs from the list below that best mitigate or prevent this incident.
+    3. Output MUST be a pure JSON string.
+
     【Available AIDEFEND Defense List】
     You MUST strictly choose only from the IDs in this list. **Do NOT fabricate IDs**:
     {defense_list}
+    """
 
+PROMPT_SUFFIX_TEMPLATE = """
     【AI Incident Data】
-    Incident ID: {incident_data['incident_id']}
-    Title: {incident_data['incident_title']}
-    Deployer / Developer: {incident_data['deployer']} / {incident_data['developer']}
-    MITRE Risk Classification (reference only): {incident_data.get('mitre_classification', 'N/A')}
+    Incident ID: {incident_id}
+    Title: {incident_title}
+    Deployer / Developer: {deployer} / {developer}
+    MITRE Risk Classification (reference only): {mitre_classification}
 
     Detailed Report (Core LLM Analysis Text):
     ---
-    {incident_data['full_report_text']}
+    {full_report_text}
     ---
-
-    【Task Requirements】
-    1. Identify the core attack mechanism and affected AI components.
-    2. Select 3 to 5 defense technique IDs from the list that best mitigate or prevent this incident.
-    3. Output MUST be a pure JSON string.
     """
-    return prompt
+
+PROMPT_TEMPLATE = PROMPT_PREFIX_TEMPLATE + PROMPT_SUFFIX_TEMPLATE
+
+def generate_prompt_prefix(defense_list):
+    """Cacheable part of the prompt: instructions and the defense catalog."""
+    return PROMPT_PREFIX_TEMPLATE.format(defense_list=defense_list)
+
+def generate_prompt_suffix(incident_data):
+    """Per-incident part of the prompt."""
+    return PROMPT_SUFFIX_TEMPLATE.format(
+        incident_id=incident_data['incident_id'],
+        incident_title=incident_data['incident_title'],
+        deployer=incident_data['deployer'],
+        developer=incident_data['developer'],
+        mitre_classification=incident_data.get('mitre_classification', 'N/A'),
+        full_report_text=incident_data['full_report_text'],
+    )
+
+def generate_llm_prompt(incident_data, defense_list):
+    """Generate the full (uncached) LLM prompt using incident data and defense list."""
+    return generate_prompt_prefix(defense_list) + generate_prompt_suffix(incident_data)
 
 # --- 4. Gemini API call for defense matching ---
-def call_llm_for_matching(incident_data, defense_list):
+async def call_llm_for_matching(engine, incident_data, defense_list, prefix_cache=None):
     """
-    Perform matching using Gemini API.
+    Perform matching through the mapping engine (rate limit + retries handled there).
+    With a PrefixCache the catalog prefix comes from provider-side cached content.
     Returns parsed JSON results or an error placeholder.
     """
-    prompt = generate_llm_prompt(incident_data, defense_list)
-    
-    # Define the JSON output schema
-    response_schema = types.Schema(
-        type=types.Type.OBJECT,
-        properties={
-            "incident_id": types.Schema(type=types.Type.INTEGER),
-            "matched_defense_ids": types.Schema(
-                type=types.Type.ARRAY,
-                description="List of 3 to 5 matching AIDEFEND Technique IDs.",
-                items=types.Schema(type=types.Type.STRING)
-            ),
-        }
-    )
+    incident_id = incident_data['incident_id']
 
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=response_schema
-            )
-        )
-        
-        # Safely parse the model's JSON output
-        return json.loads(response.text)
-        
+        if prefix_cache is not None:
+            reply = await prefix_cache.generate(engine, generate_prompt_suffix(incident_data), RESPONSE_SCHEMA)
+        else:
+            reply = await engine.generate(generate_llm_prompt(incident_data, defense_list), RESPONSE_SCHEMA)
     except Exception as e:
-        # Capture all runtime errors (API timeout, JSON parse errors, etc.)
-        print(f"   ❌ Failed to process incident {incident_data['incident_id']}: {e}")
+        # Retries exhausted or non-retryable error (auth, bad request, ...)
+        print(f"   ❌ Failed to process incident {incident_id}: {e}")
         # Return placeholder to avoid stopping the pipeline
-        return {"incident_id": incident_data['incident_id'], "matched_defense_ids": ["LLM_ERROR"]}
+        return {"incident_id": incident_id, "matched_defense_ids": ["LLM_ERROR"]}
+
+    # Safely parse the model's JSON output
+    try:
+        result = json.loads(reply.text)
+        ids = result["matched_defense_ids"]
+        if not isinstance(ids, list):
+            raise TypeError("matched_defense_ids is not a list")
+    except (ValueError, KeyError, TypeError) as e:
+        print(f"   ❌ Unparseable response for incident {incident_id}: {e}")
+        if engine.metrics is not None:
+            engine.metrics.llm_error('json_parse')
+        return {"incident_id": incident_id, "matched_defense_ids": ["JSON_PARSE_ERROR"]}
+
+    # Trust our own incident id rather than the one echoed by the model
+    return {"incident_id": incident_id, "matched_defense_ids": ids}
+
+
+def save_mapping(llm_results, path=OUTPUT_MAPPING_FILE, replace_ids=None):
+    """
+    Write results as CSV with the ID list joined into a comma-separated string.
+    With replace_ids, rows for those incidents in the existing file are dropped and
+    the new results merged in; all other rows are kept (delta runs).
+    """
+    final_mapping_df = pd.DataFrame(llm_results, columns=['incident_id', 'matched_defense_ids'])
+    final_mapping_df['matched_defense_ids'] = final_mapping_df['matched_defense_ids'].apply(
+        lambda x: ', '.join(x) if isinstance(x, list) else x
+    )
+    if replace_ids is not None and os.path.exists(path):
+        existing = pd.read_csv(path)
+        existing = existing[~existing['incident_id'].isin(replace_ids)]
+        final_mapping_df = pd.concat([existing, final_mapping_df], ignore_index=True).sort_values('incident_id')
+    final_mapping_df.to_csv(path, index=False)
 
 # --- 5. Main execution pipeline ---
-try:
-    incidents_df = pd.read_csv(INCIDENTS_FILE)
-    incidents_df = incidents_df.fillna('')
-except FileNotFoundError:
-    print(f"❌ Error: Incident file not found: {INCIDENTS_FILE}")
-    exit()
+def parse_args():
+    ap = argparse.ArgumentParser(description="Map AI incidents to AIDEFEND defenses with Gemini.")
+    ap.add_argument("--limit", type=int, default=None,
+                    help="only process the first N incidents (useful for debugging)")
+    ap.add_argument("--model", default=MODEL_NAME)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY, help="max in-flight requests")
+    ap.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE,
+                    help="requests per minute across all workers (0 = unlimited)")
+    ap.add_argument("--max-retries", type=int, default=MAX_RETRIES)
+    ap.add_argument("--api-key", default=None, help="defaults to the GEMINI_API_KEY environment variable")
+    ap.add_argument("--base-url", default=None,
+                    help="Gemini-compatible endpoint, e.g. http://127.0.0.1:8765 for fake_gemini.py")
+    ap.add_argument("--fake", action="store_true",
+                    help="use the in-process FakeGeminiClient (no API key; for benchmarks)")
+    ap.add_argument("--fake-latency", type=float, default=0.5, help="mean fake response latency in seconds")
+    ap.add_argument("--fake-error-rate", type=float, default=0.0, help="fraction of fake requests failing with 429/5xx")
+    ap.add_argument("--fake-token-latency", type=float, default=0.0,
+                    help="extra fake latency in seconds per 1k prompt tokens")
+    ap.add_argument("--fake-max-tokens", type=int, default=MAX_PROMPT_TOKENS,
+                    help="fake context window; longer prompts fail with 400")
+    ap.add_argument("--top-k", type=int, default=TOP_K,
+                    help="send only the K best BM25 candidates per incident (0 = full catalog; see retrieval.py --eval)")
+    ap.add_argument("--batch-tokens", type=int, default=BATCH_TOKENS,
+                    help="pack several incidents per request under this token budget (0 = single-incident mode)")
+    ap.add_argument("--max-batch", type=int, default=MAX_BATCH_SIZE, help="max incidents per batched request")
+    ap.add_argument("--report-tokens", type=int, default=REPORT_TOKENS,
+                    help="incidents whose report text is longer than this are extracted or map-reduced (0 = off)")
+    ap.add_argument("--oversize", choices=OVERSIZE_MODES, default=OVERSIZE_MODES[0],
+                    help="map-reduce: map chunks, then one merge call; extract: keep the most salient sentences")
+    ap.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="report text per map-reduce chunk")
+    ap.add_argument("--cascade", default=None, metavar="TIERS",
+                    help="comma-separated tiers tried in order, escalating when validation fails, "
+                         "e.g. gemini-2.5-flash,gemini-2.5-pro or local,gemini-2.5-flash,gemini-2.5-pro")
+    ap.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE,
+                    help="cascade: escalate when a model's self-reported confidence is below this")
+    ap.add_argument("--min-similarity", type=float, default=MIN_SIMILARITY,
+                    help="cascade: escalate from the local tier when the best cosine score is below this")
+    ap.add_argument("--min-agreement", type=float, default=0.0,
+                    help=f"cascade: escalate when less than this share of the IDs is among the similarity "
+                         f"mapper's top {AGREEMENT_POOL} (0 = off)")
+    ap.add_argument("--changed-ids", default=None,
+                    help="changed_incident_ids.json from combine.py --delta: re-map only those incidents")
+    ap.add_argument("--no-context-cache", action="store_true",
+                    help="send the catalog prefix with every request instead of caching it provider-side")
+    ap.add_argument("--cache-ttl", type=float, default=CACHE_TTL, help="context cache TTL in seconds")
+    ap.add_argument("--cache", default=CACHE_FILE, help="JSONL result cache path")
+    ap.add_argument("--no-cache", action="store_true", help="ignore the cache and re-map everything")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    metrics = start_run('generate_mapping')
+
+    # Initialize Gemini client
+    if args.fake:
+        client = FakeGeminiClient(latency=args.fake_latency, jitter=args.fake_latency / 4,
+                                  error_rate=args.fake_error_rate, seed=0,
+                                  token_latency=args.fake_token_latency, max_prompt_tokens=args.fake_max_tokens)
+        print(f"✅ Fake Gemini client (latency={args.fake_latency}s, error_rate={args.fake_error_rate}).")
+    else:
+        try:
+            client = GeminiClient(api_key=args.api_key, base_url=args.base_url)
+            print("✅ Gemini client initialized successfully.")
+        except Exception as e:
+            sys.exit(f"❌ Error: Failed to initialize Gemini client. Please check your GEMINI_API_KEY environment variable. Error: {e}")
+
+    with metrics.phase('load'):
+        try:
+            defense_df = load_defense_catalog(DEFENSES_FILE)
+        except FileNotFoundError:
+            sys.exit(f"❌ Error: Defense list file not found: {DEFENSES_FILE}")
+        DEFENSE_LIST_STR = "\n".join(defense_df['LLM_Entry'].tolist())
+        print(f"✅ Loaded {len(defense_df)} defense techniques into LLM knowledge base.")
+
+        try:
+            incidents_df = pd.read_csv(INCIDENTS_FILE)
+            incidents_df = incidents_df.fillna('')
+        except FileNotFoundError:
+            sys.exit(f"❌ Error: Incident file not found: {INCIDENTS_FILE}")
+
+    # Delta run: only incidents combine.py --delta reported as changed; removed ones are dropped
+    replace_ids = None
+    if args.changed_ids:
+        with open(args.changed_ids, 'r', encoding='utf-8') as f:
+            delta = json.load(f)
+        if not delta.get('full_rebuild'):
+            replace_ids = set(delta['changed']) | set(delta['removed'])
+            incidents_df = incidents_df[incidents_df['incident_id'].isin(delta['changed'])]
+            print(f"🔁 Delta run: {len(delta['changed'])} changed, {len(delta['removed'])} removed incidents")
+
+    incidents_to_process = incidents_df.head(args.limit) if args.limit else incidents_df
+    incidents = incidents_to_process.to_dict(orient='records')
+
+    if args.batch_tokens and args.top_k:
+        # A batch shares one catalog block, so per-incident shortlists do not apply
+        print("⚠️  --top-k is ignored in batch mode (the catalog is sent once per batch).")
+        args.top_k = 0
+    tiers = [t.strip() for t in args.cascade.split(',') if t.strip()] if args.cascade else []
+    if tiers and args.batch_tokens:
+        # Validation and escalation are per incident
+        print("⚠️  --batch-tokens is ignored in cascade mode.")
+        args.batch_tokens = 0
+    template = BATCH_PROMPT_TEMPLATE if args.batch_tokens else PROMPT_TEMPLATE
+
+    # Oversized reports: extract mode trims them here, so prompts, cache keys and batches all see the short text
+    original_tokens = {int(incident['incident_id']): report_tokens(incident) for incident in incidents}
+    oversized = sum(n > args.report_tokens for n in original_tokens.values()) if args.report_tokens else 0
+    if oversized and args.oversize == 'map-reduce' and (args.batch_tokens or tiers):
+        print("⚠️  --oversize map-reduce needs single-incident mode; extracting oversized reports instead.")
+        args.oversize = 'extract'
+    if oversized:
+        if args.oversize == 'extract':
+            incidents = [trim_report(incident, args.report_tokens) for incident in incidents]
+        print(f"📏 {oversized} incidents over {args.report_tokens:,} report tokens -> {args.oversize}")
+
+    # Optional local prefilter: shortlist top-K defenses per incident before the LLM call
+    if args.top_k:
+        with metrics.phase('prefilter'):
+            index = DefenseIndex(defense_df['defense_id'],
+                                 defense_df['name'] + ' ' + defense_df['description'].fillna(''))
+            entries = defense_df['LLM_Entry'].tolist()
+            shortlists = index.top_k([incident_query(incident) for incident in incidents], args.top_k)
+            defense_lists = ["\n".join(entries[j] for j in sorted(order)) for order in shortlists]
+        print(f"🔎 BM25 prefilter: {min(args.top_k, len(entries))}/{len(entries)} catalog entries per prompt")
+    else:
+        defense_lists = [DEFENSE_LIST_STR] * len(incidents)
+
+    # Serve unchanged incidents from the cache; only misses and error rows go to the LLM
+    cache = None if args.no_cache else ResultCache(args.cache)
+    llm_results = [None] * len(incidents)
+    pending = []
+    base_key = args.model
+    if tiers:
+        # The thresholds decide which tier's answer is accepted, so they are part of the answer's identity
+        base_key = (f"cascade:{','.join(tiers)}|confidence:{args.min_confidence}"
+                    f"|similarity:{args.min_similarity}|agreement:{args.min_agreement}")
+        if LOCAL in tiers or args.min_agreement > 0:
+            base_key += f"|local:{LOCAL_K}:{PER_TACTIC}:{AGREEMENT_POOL}"
+    for i, (incident, defense_list) in enumerate(zip(incidents, defense_lists)):
+        model_key = base_key
+        if args.oversize == 'map-reduce' and args.report_tokens and report_tokens(incident) > args.report_tokens:
+            model_key += f"|map-reduce:{args.report_tokens}:{args.chunk_tokens}"
+        key = cache_key(incident, defense_list, model_key, template)
+        hit = cache.get(key) if cache else None
+        if hit is not None:
+            llm_results[i] = hit
+        else:
+            pending.append((i, key, incident, defense_list))
+    metrics.count('cache_hits', len(incidents) - len(pending))
+    metrics.count('cache_misses', len(pending))
+    if cache:
+        print(f"🗄️  {cache.summary()} -> {len(pending)} incidents to send")
+
+    engine = MappingEngine(
+        client, args.model,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        metrics=metrics,
+    )
+
+    # Single-incident mode with the full catalog: every prompt shares the same prefix (one cache per model)
+    prefix_caches = {}
+    if not (args.no_context_cache or args.batch_tokens or args.top_k) and pending:
+        for model in [t for t in tiers if t != LOCAL] or [args.model]:
+            state = CONTEXT_CACHE_STATE if model == args.model else CONTEXT_CACHE_STATE.replace('.json', f"-{model}.json")
+            prefix_caches[model] = PrefixCache(client, model, generate_prompt_prefix(DEFENSE_LIST_STR),
+                                               args.cache_ttl, state)
+    prefix_cache = prefix_caches.get(args.model)
 
-llm_results = []
+    cascade = None
+    if tiers:
+        local = {}
+        if (LOCAL in tiers or args.min_agreement > 0) and pending:
+            # Similarity-mapper picks / candidate pools: the free tier and the agreement cross-check
+            with metrics.phase('local'):
+                frame = pd.DataFrame([item[2] for item in pending])
+                picks, best, pools = local_candidates(SimilarityMapper(pd.read_csv(DEFENSES_FILE)),
+                                                      incident_text(frame), LOCAL_K, PER_TACTIC, AGREEMENT_POOL)
+                local = {int(item[2]['incident_id']): row for item, row in zip(pending, zip(picks, best, pools))}
+        cascade = Cascade(engine, tiers, set(defense_df['defense_id']), RESPONSE_SCHEMA, generate_llm_prompt,
+                          generate_prompt_suffix, prefix_caches, local, args.min_confidence,
+                          args.min_similarity, args.min_agreement)
+        print(f"🪜 Cascade: {' -> '.join(tiers)} (min confidence {args.min_confidence}, "
+              f"min agreement {args.min_agreement or 'off'})")
 
-# Test with first 30 incidents first (recommended for debugging)
-incidents_to_process = incidents_df.head(30)
-# After verifying correctness, replace with:
-# incidents_to_process = incidents_df
+    budget = None
+    if not (tiers or args.batch_tokens):
+        # Single-incident mode: every incident goes through the budget (stats are kept even with it off)
+        budget = ReportBudget(engine, args.report_tokens, args.oversize, RESPONSE_SCHEMA, generate_llm_prompt,
+                              generate_prompt_suffix, dict(zip(defense_df['defense_id'], defense_df['LLM_Entry'])),
+                              prefix_cache, args.chunk_tokens)
 
-print(f"\n--- Processing {len(incidents_to_process)} AI incidents (ensure API key is set) ---")
+    print(f"\n--- Processing {len(pending)} AI incidents "
+          f"(concurrency={engine.concurrency}, rpm={args.rpm or 'unlimited'}) ---")
 
-for index, row in incidents_to_process.iterrows():
-    incident_data = row.to_dict()
-    
-    if index % 1 == 0:  # Print progress for every incident during testing
-        print(f"\n-> Processing incident #{index} (ID: {incident_data['incident_id']})")
+    done = 0
 
-    match = call_llm_for_matching(incident_data, DEFENSE_LIST_STR)
-    llm_results.append(match)
+    def record(slot, match):
+        nonlocal done
+        done += 1
+        i, key, _, _ = pending[slot]
+        llm_results[i] = match
+        for marker in ('LLM_ERROR', 'JSON_PARSE_ERROR'):
+            if marker in match['matched_defense_ids']:
+                metrics.count(f"rows_{marker.lower()}")
+        if cache:
+            cache.put(key, match)  # flushed immediately so a crash keeps finished work
+        print(f"-> [{done}/{len(pending)}] incident {match['incident_id']}: "
+              f"{', '.join(match['matched_defense_ids'])}")
 
-# 6. Save LLM mapping results
-final_mapping_df = pd.DataFrame(llm_results)
+    start = time.perf_counter()
+    with metrics.phase('llm'):
+        try:
+            if args.batch_tokens:
+                # Pack pending incidents under the token budget; the catalog is sent once per batch
+                slots = {str(item[2]['incident_id']): slot for slot, item in enumerate(pending)}
+                mapper = BatchMapper(engine, DEFENSE_LIST_STR,
+                                     on_incident=lambda incident, match: record(slots[str(incident['incident_id'])], match))
+                fixed = estimate_tokens(BATCH_PROMPT_TEMPLATE) + estimate_tokens(DEFENSE_LIST_STR)
+                sizes = [estimate_tokens(incident_block(item[2])) for item in pending]
+                batches = pack_batches(sizes, args.batch_tokens, fixed, args.max_batch)
+                print(f"📦 {len(pending)} incidents packed into {len(batches)} batches "
+                      f"(budget {args.batch_tokens:,} tokens, max {args.max_batch} per batch)")
+                asyncio.run(engine.map(batches, lambda batch: mapper.map_batch([pending[j][2] for j in batch])))
+            elif cascade is not None:
+                asyncio.run(engine.map(
+                    pending,
+                    lambda item: cascade.match(item[2], item[3]),
+                    on_result=lambda slot, match: record(slot, match),
+                ))
+            else:
+                asyncio.run(engine.map(
+                    pending,
+                    lambda item: budget.match(
+                        item[2], item[3],
+                        lambda incident: call_llm_for_matching(engine, incident, item[3], prefix_cache),
+                        original_tokens[int(item[2]['incident_id'])]),
+                    on_result=lambda slot, match: record(slot, match),
+                ))
+        finally:
+            if cache:
+                cache.close()
+    elapsed = time.perf_counter() - start
 
-# Convert ID list into comma-separated string
-final_mapping_df['matched_defense_ids'] = final_mapping_df['matched_defense_ids'].apply(
-    lambda x: ', '.join(x) if isinstance(x, list) else x
-)
+    # 6. Save LLM mapping results (in incident order, cached + fresh)
+    with metrics.phase('save'):
+        save_mapping(llm_results, OUTPUT_MAPPING_FILE, replace_ids)
+    metrics.add_rows(len(pending))
 
-final_mapping_df.to_csv(OUTPUT_MAPPING_FILE, index=False)
+    print("\n--- LLM matching completed ---")
+    print(f"⏱️  {len(pending)} incidents in {elapsed:.1f}s ({len(pending) / max(elapsed, 1e-9):.2f} incidents/s)")
+    if args.batch_tokens:
+        single_tokens = sum(estimate_tokens(generate_llm_prompt(item[2], DEFENSE_LIST_STR)) for item in pending)
+        print(f"📦 {savings_report(mapper, single_tokens, len(pending))}")
+        metrics.count('batch_requests', mapper.calls)
+        metrics.count('batch_splits', mapper.splits)
+    if cache:
+        print(f"🗄️  {cache.summary()}")
+    for model, prefix_cache in prefix_caches.items():
+        print(f"🧊 {model + ': ' if tiers else ''}{prefix_cache.summary()}")
+        for name, value in prefix_cache.stats.items():
+            metrics.count(f"context_cache_{name}", value)
+    if budget is not None:
+        print(f"📏 {budget.report()}")
+        for row in budget.rows:
+            metrics.count(f"report_{row['mode'].replace('-', '_')}")
+        metrics.count('report_map_reduce_calls', sum(row['calls'] for row in budget.rows if row['mode'] == 'map-reduce'))
+    if cascade is not None:
+        print(f"🪜 {cascade.report()}")
+        for row in cascade.rows:
+            metrics.count(f"cascade_answered_{row['tier']}")
+        metrics.count('cascade_escalations', sum(row['escalations'] for row in cascade.rows))
+    if args.fake:
+        stats = client.stats
+        print(f"💰 Fake billing: {stats['prompt_tokens']:,} prompt tokens, {stats['prefix_tokens']:,} prefix tokens "
+              f"at the full rate, {stats['cached_tokens']:,} served from cache, {stats['cache_writes']:,} cache writes")
+    print(f"✅ Final mapping saved to '{OUTPUT_MAPPING_FILE}'.")
+    metrics.finish()
+    print("You may now integrate the results into your website.")
 
-print("\n--- LLM matching completed ---")
-print(f"✅ Final mapping saved to '{OUTPUT_MAPPING_FILE}'.")
-print("You may now integrate the results into your website.")
+if __name__ == "__main__":
+    main()
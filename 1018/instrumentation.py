@@ -0,0 +1,244 @@
+"""
+Shared run instrumentation for the pipeline scripts.
+
+    metrics = start_run('combine')
+    with metrics.phase('load'):
+        ...
+    metrics.add_rows(len(out))
+    metrics.finish()
+
+Each run records wall / CPU time (total and per phase), peak RSS, rows/s and,
+for LLM stages, per-call latency, prompt/response tokens, retries and errors
+by class (MappingEngine reports these when given `metrics=`). On finish, or at
+interpreter exit if the script bailed out early (success=false), it writes
+
+    <dir>/<stage>-<timestamp>.json    run report (latency percentiles included)
+    <dir>/<stage>.prom                Prometheus textfile (node_exporter textfile collector)
+
+<dir> is METRICS_DIR or the PIPELINE_METRICS_DIR environment variable
+(pipeline.py points every stage at <out>/metrics).
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+try:
+    import resource  # Unix only; peak RSS is reported as null elsewhere
+except ImportError:
+    resource = None
+
+METRICS_DIR = 'run_metrics'
+METRICS_ENV = 'PIPELINE_METRICS_DIR'
+PREFIX = 'aiid'
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)   # Seconds, Prometheus histogram
+PERCENTILES = (50, 90, 95, 99)
+
+
+def error_class(exc: BaseException) -> str:
+    """Short, low-cardinality label for an exception (http_429, timeout, connection, json_parse, ...)."""
+    code = getattr(exc, 'code', None) or getattr(exc, 'status_code', None)
+    if isinstance(code, int):
+        return f"http_{code}"
+    if isinstance(exc, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(exc, ConnectionError):
+        return 'connection'
+    if isinstance(exc, (ValueError, KeyError, TypeError)):
+        return 'json_parse'
+    return type(exc).__name__
+
+
+def peak_rss_bytes() -> Optional[int]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024   # KiB on Linux, bytes on macOS
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class RunMetrics:
+    def __init__(self, stage: str, out_dir: Optional[str] = None):
+        self.stage = stage
+        self.out_dir = out_dir or os.environ.get(METRICS_ENV) or METRICS_DIR
+        self.started_at = time.time()
+        self._wall0 = time.perf_counter()
+        self._cpu0 = time.process_time()
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self.rows = 0
+        self.counters: Dict[str, int] = {}
+        self.latencies = []
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        self.cached_tokens = 0
+        self.retries: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.report = None
+
+    # --- Recording ---
+
+    @contextmanager
+    def phase(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            p = self.phases.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0})
+            p['wall_s'] += time.perf_counter() - wall
+            p['cpu_s'] += time.process_time() - cpu
+
+    def add_rows(self, n: int) -> None:
+        self.rows += int(n)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def llm_call(self, latency: float, prompt_tokens: int = 0, response_tokens: int = 0,
+                 cached_tokens: int = 0) -> None:
+        """One successful request (latency of that attempt only)."""
+        self.latencies.append(latency)
+        self.prompt_tokens += prompt_tokens or 0
+        self.response_tokens += response_tokens or 0
+        self.cached_tokens += cached_tokens or 0
+
+    def llm_retry(self, exc: BaseException) -> None:
+        cls = error_class(exc)
+        self.retries[cls] = self.retries.get(cls, 0) + 1
+
+    def llm_error(self, exc_or_class) -> None:
+        """A final failure (retries exhausted, non-retryable, unparseable answer)."""
+        cls = exc_or_class if isinstance(exc_or_class, str) else error_class(exc_or_class)
+        self.errors[cls] = self.errors.get(cls, 0) + 1
+
+    # --- Output ---
+
+    def build_report(self, success: bool) -> dict:
+        wall = time.perf_counter() - self._wall0
+        lat = sorted(self.latencies)
+        report = {
+            'stage': self.stage,
+            'success': success,
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'argv': sys.argv[1:],
+            'wall_s': round(wall, 3),
+            'cpu_s': round(time.process_time() - self._cpu0, 3),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'rows': self.rows,
+            'rows_per_s': round(self.rows / wall, 2) if wall > 0 else None,
+            'phases': {k: {m: round(v, 3) for m, v in p.items()} for k, p in self.phases.items()},
+            'counters': self.counters,
+        }
+        if lat or self.retries or self.errors:
+            report['llm'] = {
+                'calls': len(lat),
+                'latency_s': {f"p{p}": round(percentile(lat, p), 3) for p in PERCENTILES} if lat else {},
+                'latency_mean_s': round(sum(lat) / len(lat), 3) if lat else None,
+                'prompt_tokens': self.prompt_tokens,
+                'response_tokens': self.response_tokens,
+                'cached_tokens': self.cached_tokens,
+                'retries': self.retries,
+                'errors': self.errors,
+            }
+        return report
+
+    def prometheus(self, report: dict) -> str:
+        label = f'stage="{self.stage}"'
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for suffix, labels, value in samples:
+                if value is not None:
+                    lines.append(f"{PREFIX}_{name}{suffix}{{{labels}}} {value}")
+
+        metric('stage_success', 'gauge', 'Whether the last run finished normally.',
+               [('', label, int(report['success']))])
+        metric('stage_last_run_timestamp_seconds', 'gauge', 'Start time of the last run.',
+               [('', label, round(self.started_at, 3))])
+        metric('stage_wall_seconds', 'gauge', 'Wall time of the last run.', [('', label, report['wall_s'])])
+        metric('stage_cpu_seconds', 'gauge', 'CPU time of the last run.', [('', label, report['cpu_s'])])
+        metric('stage_peak_rss_bytes', 'gauge', 'Peak resident memory of the last run.',
+               [('', label, report['peak_rss_bytes'])])
+        metric('stage_rows', 'gauge', 'Rows processed by the last run.', [('', label, report['rows'])])
+        metric('stage_rows_per_second', 'gauge', 'Throughput of the last run.', [('', label, report['rows_per_s'])])
+        if self.phases:
+            metric('phase_wall_seconds', 'gauge', 'Wall time per phase of the last run.',
+                   [('', f'{label},phase="{k}"', p['wall_s']) for k, p in report['phases'].items()])
+        if self.counters:
+            metric('stage_events', 'gauge', 'Stage-specific counters of the last run.',
+                   [('', f'{label},event="{k}"', v) for k, v in sorted(self.counters.items())])
+
+        if 'llm' in report:
+            llm = report['llm']
+            buckets, cumulative = [], 0
+            lat = sorted(self.latencies)
+            for bound in LATENCY_BUCKETS:
+                while cumulative < len(lat) and lat[cumulative] <= bound:
+                    cumulative += 1
+                buckets.append(('_bucket', f'{label},le="{bound}"', cumulative))
+            buckets.append(('_bucket', f'{label},le="+Inf"', len(lat)))
+            buckets.append(('_sum', label, round(sum(lat), 3)))
+            buckets.append(('_count', label, len(lat)))
+            metric('llm_latency_seconds', 'histogram', 'Latency of successful LLM calls.', buckets)
+            metric('llm_tokens', 'gauge', 'LLM tokens in the last run.',
+                   [('', f'{label},kind="prompt"', llm['prompt_tokens']),
+                    ('', f'{label},kind="response"', llm['response_tokens']),
+                    ('', f'{label},kind="cached"', llm['cached_tokens'])])
+            metric('llm_retries', 'gauge', 'Retried LLM calls by error class.',
+                   [('', f'{label},error="{k}"', v) for k, v in sorted(llm['retries'].items())])
+            metric('llm_errors', 'gauge', 'Failed LLM calls by error class.',
+                   [('', f'{label},error="{k}"', v) for k, v in sorted(llm['errors'].items())])
+        return '\n'.join(lines) + '\n'
+
+    def finish(self, success: bool = True, quiet: bool = False) -> dict:
+        """Write the JSON report and the Prometheus textfile (once)."""
+        if self.report is not None:
+            return self.report
+        self.report = report = self.build_report(success)
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        json_path = os.path.join(self.out_dir, f"{self.stage}-{stamp}.json")
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        prom_path = os.path.join(self.out_dir, f"{self.stage}.prom")
+        with open(prom_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(self.prometheus(report))
+        os.replace(prom_path + '.tmp', prom_path)   # The collector must never read a partial file
+        if not quiet:
+            print(summary(report) + f" -> {json_path}")
+        return report
+
+
+def summary(report: dict) -> str:
+    rss = report['peak_rss_bytes']
+    text = (f"📈 {report['stage']}: {report['wall_s']:.1f}s wall, {report['cpu_s']:.1f}s CPU, "
+            f"peak {rss / 2 ** 20:,.0f} MB, " if rss else
+            f"📈 {report['stage']}: {report['wall_s']:.1f}s wall, {report['cpu_s']:.1f}s CPU, ")
+    text += f"{report['rows']:,} rows ({report['rows_per_s'] or 0:,.1f}/s)"
+    llm = report.get('llm')
+    if llm and llm['calls']:
+        text += (f" | LLM {llm['calls']} calls, p50 {llm['latency_s']['p50']:.2f}s / "
+                 f"p95 {llm['latency_s']['p95']:.2f}s, {llm['prompt_tokens']:,} prompt tokens, "
+                 f"{sum(llm['retries'].values())} retries, {sum(llm['errors'].values())} errors")
+    return text
+
+
+def start_run(stage: str, out_dir: Optional[str] = None) -> RunMetrics:
+    """RunMetrics whose report is also written at exit when the script returns early."""
+    metrics = RunMetrics(stage, out_dir)
+    atexit.register(lambda: metrics.report is None and metrics.finish(success=False, quiet=True))
+    return metrics
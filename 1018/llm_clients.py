@@ -0,0 +1,108 @@
+"""
+Pluggable LLM clients for the defense-mapping pipeline.
+
+Every client exposes a single coroutine
+
+    await client.generate(model, prompt, response_schema) -> LLMReply
+
+so the mapping engine can be pointed at the real Gemini API, at the local
+fake server in fake_gemini.py (via base_url), or at any test double.
+
+Clients that support provider-side context caching also implement
+
+    await client.create_cache(model, text, ttl) -> CacheHandle
+    await client.refresh_cache(name, ttl) -> new expiry (epoch seconds)
+    await client.delete_cache(name)
+
+and accept generate(..., cached_content=name), in which case the prompt is
+only the part that follows the cached text (see context_cache.py).
+"""
+
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class LLMReply:
+    """Raw model output plus the token usage reported by the provider."""
+    text: str
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    cached_tokens: int = 0      # Part of prompt_tokens served from cached content
+
+
+@dataclass
+class CacheHandle:
+    """Provider-side cached content: resource name, expiry (epoch seconds) and size."""
+    name: str
+    expires_at: float
+    tokens: int = 0
+
+
+class LLMHTTPError(Exception):
+    """HTTP-level failure carrying the status code (used for retry decisions)."""
+
+    def __init__(self, code: int, message: str = ""):
+        super().__init__(f"{code} {message}".strip())
+        self.code = code
+
+
+class GeminiClient:
+    """
+    Async wrapper around the google-genai SDK.
+    Pass base_url to talk to a Gemini-compatible endpoint such as fake_gemini.py.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = None):
+        # Imported lazily so offline/fake runs do not need the SDK installed
+        from google import genai
+        from google.genai import types
+
+        self._types = types
+        kwargs = {}
+        if api_key:
+            kwargs["api_key"] = api_key
+        if base_url:
+            kwargs["http_options"] = types.HttpOptions(base_url=base_url)
+        self._client = genai.Client(**kwargs)
+
+    async def generate(self, model: str, prompt: str, response_schema: dict,
+                       cached_content: str = None) -> LLMReply:
+        response = await self._client.aio.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=self._types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=response_schema,
+                cached_content=cached_content,
+            ),
+        )
+        usage = response.usage_metadata
+        return LLMReply(
+            text=response.text or "",
+            prompt_tokens=(usage.prompt_token_count or 0) if usage else 0,
+            response_tokens=(usage.candidates_token_count or 0) if usage else 0,
+            cached_tokens=(usage.cached_content_token_count or 0) if usage else 0,
+        )
+
+    async def create_cache(self, model: str, text: str, ttl: float) -> CacheHandle:
+        cache = await self._client.aio.caches.create(
+            model=model,
+            config=self._types.CreateCachedContentConfig(contents=[text], ttl=f"{int(ttl)}s"),
+        )
+        usage = cache.usage_metadata
+        return CacheHandle(name=cache.name, expires_at=_epoch(cache.expire_time, ttl),
+                           tokens=(usage.total_token_count or 0) if usage else 0)
+
+    async def refresh_cache(self, name: str, ttl: float) -> float:
+        cache = await self._client.aio.caches.update(
+            name=name, config=self._types.UpdateCachedContentConfig(ttl=f"{int(ttl)}s"))
+        return _epoch(cache.expire_time, ttl)
+
+    async def delete_cache(self, name: str) -> None:
+        await self._client.aio.caches.delete(name=name)
+
+
+def _epoch(expire_time, ttl: float) -> float:
+    """Expiry reported by the provider, or now + ttl when it is missing."""
+    return expire_time.timestamp() if expire_time is not None else time.time() + ttl
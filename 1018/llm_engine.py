@@ -0,0 +1,130 @@
+"""
+Concurrent mapping engine for generate_mapping.py.
+
+- bounded number of in-flight requests (worker pool over an asyncio queue)
+- token-bucket rate limiter shared by all workers
+- jittered exponential backoff for 429 / 5xx / transport errors
+- pluggable client (see llm_clients.py)
+- optional per-call metrics (latency, tokens, retries, errors; see instrumentation.py)
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429, 5xx and transport-level failures are worth retrying; everything else is not."""
+    code = getattr(exc, "code", None) or getattr(exc, "status_code", None)
+    if isinstance(code, int):
+        return code == 429 or 500 <= code < 600
+    return isinstance(exc, (asyncio.TimeoutError, ConnectionError))
+
+
+class MappingEngine:
+    """Runs LLM requests with a concurrency cap, a shared rate limit and retries."""
+
+    def __init__(self, client, model: str, concurrency: int = 8,
+                 requests_per_minute: float = 60.0, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 60.0, metrics=None):
+        self.client = client
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.requests_per_minute = requests_per_minute
+        self.metrics = metrics
+        self._bucket = None
+
+    def _limiter(self) -> Optional[TokenBucket]:
+        # Created lazily so the asyncio.Lock binds to the running loop
+        if self._bucket is None and self.requests_per_minute:
+            self._bucket = TokenBucket(self.requests_per_minute / 60.0)
+        return self._bucket
+
+    async def generate(self, prompt: str, response_schema: dict, model: str = None, cached_content: str = None):
+        """One rate-limited request with jittered exponential backoff."""
+        # Only passed when set, so clients without context caching keep working
+        extra = {'cached_content': cached_content} if cached_content else {}
+        limiter = self._limiter()
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                reply = await self.client.generate(model or self.model, prompt, response_schema, **extra)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    # A 404 on cached content is usually an expired cache: PrefixCache retries and records it
+                    if self.metrics is not None and not (cached_content and getattr(e, 'code', None) == 404):
+                        self.metrics.llm_error(e)
+                    raise
+                if self.metrics is not None:
+                    self.metrics.llm_retry(e)
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                print(f"   ⏳ Retryable error ({e}); retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            if self.metrics is not None:
+                self.metrics.llm_call(time.perf_counter() - start, getattr(reply, 'prompt_tokens', 0),
+                                      getattr(reply, 'response_tokens', 0), getattr(reply, 'cached_tokens', 0))
+            return reply
+
+    async def map(self, items: Iterable[Any], fn: Callable[[Any], Awaitable[Any]],
+                  on_result: Callable[[int, Any], None] = None) -> List[Any]:
+        """
+        Apply coroutine `fn` to every item with at most `concurrency` in flight.
+        Results are returned in input order; `on_result(index, result)` fires as each completes.
+        """
+        items = list(items)
+        results: List[Any] = [None] * len(items)
+        queue: asyncio.Queue = asyncio.Queue()
+        for i in range(len(items)):
+            queue.put_nowait(i)
+
+        async def worker():
+            while True:
+                try:
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results[i] = await fn(items[i])
+                if on_result is not None:
+                    on_result(i, results[i])
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(items)) or 1)))
+        return results
@@ -0,0 +1,133 @@
+"""
+Load test for server.py: N keep-alive connections issue GETs for a fixed time
+and report requests/sec and latency percentiles.
+
+    python loadtest.py --spawn --data-dir ../Web         # starts server.py pinned to one core
+    python loadtest.py --url http://127.0.0.1:8000       # against a running server
+
+The request mix cycles through search pages, incident details, defenses and
+defense -> incidents lookups built from the server's own data.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import quote, urlsplit
+
+CONNECTIONS = 32
+DURATION = 10.0
+SEARCH_TERMS = ['', 'face', 'privacy', 'deepfake chatbot', 'autonomous vehicle', 'bias', 'model']
+
+
+async def fetch(reader, writer, host, path, gzip=True):
+    """One keep-alive GET; returns (status, body)."""
+    req = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+    if gzip:
+        req += "Accept-Encoding: gzip\r\n"
+    writer.write((req + "\r\n").encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def build_paths(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await fetch(reader, writer, host, '/incidents?page_size=500', gzip=False)
+    writer.close()
+    listing = json.loads(body)['results']
+    paths = [f"/incidents?q={quote(t)}&page={p}" for t in SEARCH_TERMS for p in (1, 2)]
+    paths += [f"/incidents/{r['incident_id']}" for r in listing[:50]]
+    defense_ids = sorted({d for r in listing for d in r.get('matched_defense_ids', [])})[:30]
+    paths += [f"/defenses/{quote(d)}" for d in defense_ids]
+    paths += [f"/defenses/{quote(d)}/incidents" for d in defense_ids]
+    return paths
+
+
+async def worker(host, port, paths, offset, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await fetch(reader, writer, host, paths[i % len(paths)])
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+            i += 1
+    finally:
+        writer.close()
+
+
+async def run(host, port, connections, duration):
+    paths = await build_paths(host, port)
+    latencies, errors = [], {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(worker(host, port, paths, c * 7, deadline, latencies, errors)
+                           for c in range(connections)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(int(p / 100 * len(latencies)), len(latencies) - 1)] * 1000
+    print(f"\n--- Load test: {connections} connections, {elapsed:.1f}s, {len(paths)} distinct paths ---")
+    print(f"Requests:     {len(latencies):,}")
+    print(f"Requests/sec: {len(latencies) / elapsed:,.0f}")
+    print(f"Latency ms:   p50 {pct(50):.2f}  p90 {pct(90):.2f}  p99 {pct(99):.2f}  max {latencies[-1] * 1000:.2f}")
+    if errors:
+        print(f"Non-200:      {errors}")
+
+
+def spawn_server(data_dir, port):
+    """server.py in a subprocess pinned to CPU 0 (Linux) so the number is per core."""
+    cmd = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py'),
+           '--data-dir', data_dir, '--port', str(port), '--reload-interval', '0']
+    pin = (lambda: os.sched_setaffinity(0, {0})) if hasattr(os, 'sched_setaffinity') else None
+    proc = subprocess.Popen(cmd, preexec_fn=pin, stdout=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    sys.exit("❌ server.py did not start")
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Requests/sec for server.py.")
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--connections", type=int, default=CONNECTIONS)
+    ap.add_argument("--duration", type=float, default=DURATION)
+    ap.add_argument("--spawn", action="store_true", help="start server.py (pinned to one core) for the run")
+    ap.add_argument("--data-dir", default=".", help="artifact directory for --spawn")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+    proc = spawn_server(args.data_dir, port) if args.spawn else None
+    try:
+        asyncio.run(run(host, port, args.connections, args.duration))
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Incident x defense mapping as a binary matrix (mapping_matrix.npz) instead of
+comma-separated strings that every consumer has to split and trim.
+
+Members (plain, uncompressed .npy arrays; np.load works, and load_matrix()
+memory-maps them straight out of the zip without copying or parsing):
+
+    incident_ids  int64 (n,)        row -> incident_id, ascending
+    defense_ids   <U (m,)           column -> defense ID: catalog order first, then IDs
+                                    missing from the catalog and error markers
+    n_catalog     int64 ()          columns [0, n_catalog) are catalog techniques
+    indptr        int32 (n + 1,)    CSR row pointers
+    indices       int16/int32 (nnz) CSR column per pair, in the order the model listed them
+    bits          uint8 (n, ceil(m/8))  packed bitset of the same pairs (membership, column scans)
+    version       int64 ()
+
+Rows keep their original ID order, so to_mapping_df() reproduces
+llm_defense_mapping.csv (and to_records() mapping.json) exactly.
+
+Usage:
+  python mapping_matrix.py                                  # llm_defense_mapping.csv -> mapping_matrix.npz
+  python mapping_matrix.py --to-csv roundtrip.csv --to-json roundtrip.json
+  python mapping_matrix.py --verify                         # round-trip check + load/lookup timings
+"""
+
+import argparse
+import json
+import os
+import struct
+import time
+import zipfile
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from defense_index import split_ids
+
+MATRIX_FILE = 'mapping_matrix.npz'
+MATRIX_VERSION = 1
+MAPPING_CSV = 'llm_defense_mapping.csv'
+DEFENSES_CSV = 'AI_Defense_Techniques.csv'
+
+
+def build_matrix(mapping: Iterable[dict], catalog_ids: Iterable[str] = ()) -> Dict[str, np.ndarray]:
+    """Arrays for mapping records (incident_id, matched_defense_ids as string or list)."""
+    rows = sorted(((int(m['incident_id']), split_ids(m.get('matched_defense_ids'))) for m in mapping),
+                  key=lambda r: r[0])
+    columns = {did: j for j, did in enumerate(dict.fromkeys(str(d).strip() for d in catalog_ids if str(d).strip()))}
+    n_catalog = len(columns)
+    for _, ids in rows:
+        for did in ids:
+            columns.setdefault(did, len(columns))   # Unknown IDs / error markers get extra columns
+
+    lengths = np.fromiter((len(ids) for _, ids in rows), dtype=np.int64, count=len(rows))
+    indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=indptr[1:])
+    index_dtype = np.int16 if len(columns) < 2 ** 15 else np.int32
+    indices = np.fromiter((columns[did] for _, ids in rows for did in ids), dtype=index_dtype, count=int(indptr[-1]))
+
+    dense = np.zeros((len(rows), max(len(columns), 1)), dtype=bool)
+    dense[np.repeat(np.arange(len(rows)), lengths), indices] = True
+    return {
+        'version': np.int64(MATRIX_VERSION),
+        'incident_ids': np.array([iid for iid, _ in rows], dtype=np.int64),
+        'defense_ids': np.array(list(columns), dtype=f"<U{max(map(len, columns), default=1)}"),
+        'n_catalog': np.int64(n_catalog),
+        'indptr': indptr,
+        'indices': indices,
+        'bits': np.packbits(dense, axis=1),
+    }
+
+
+def save_matrix(arrays: Dict[str, np.ndarray], path: str = MATRIX_FILE) -> int:
+    """Write uncompressed (so members stay memory-mappable) and atomically; returns the size in bytes."""
+    tmp = path + '.tmp.npz'   # np.savez appends .npz to names without it
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+
+def _mmap_npz(path: str) -> Optional[Dict[str, np.ndarray]]:
+    """Memory-map every member of an uncompressed .npz (None if any member is compressed)."""
+    arrays = {}
+    with zipfile.ZipFile(path) as zf, open(path, 'rb') as f:
+        for info in zf.infolist():
+            if info.compress_type != zipfile.ZIP_STORED or not info.filename.endswith('.npy'):
+                return None
+            f.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH', f.read(4))
+            f.seek(info.header_offset + 30 + name_len + extra_len)   # Start of the .npy data
+            version = np.lib.format.read_magic(f)
+            read_header = (np.lib.format.read_array_header_1_0 if version == (1, 0)
+                           else np.lib.format.read_array_header_2_0)
+            shape, fortran, dtype = read_header(f)
+            name = info.filename[:-4]
+            if dtype.hasobject:
+                return None
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran else 'C')
+    return arrays
+
+
+class MappingMatrix:
+    """Read-only view over the arrays with id <-> index dictionaries."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.incident_ids = arrays['incident_ids']
+        self.defense_ids = arrays['defense_ids']
+        self.n_catalog = int(arrays['n_catalog'])
+        self.indptr = arrays['indptr']
+        self.indices = arrays['indices']
+        self.bits = arrays['bits']
+        self._defense_col = None
+
+    @property
+    def shape(self):
+        return len(self.incident_ids), len(self.defense_ids)
+
+    def row_of(self, incident_id: int) -> int:
+        i = int(np.searchsorted(self.incident_ids, incident_id))
+        if i == len(self.incident_ids) or self.incident_ids[i] != incident_id:
+            raise KeyError(incident_id)
+        return i
+
+    def col_of(self, defense_id: str) -> int:
+        if self._defense_col is None:
+            self._defense_col = {str(d): j for j, d in enumerate(self.defense_ids)}
+        return self._defense_col[defense_id]
+
+    def defenses_for(self, incident_id: int) -> List[str]:
+        i = self.row_of(incident_id)
+        return [str(self.defense_ids[j]) for j in self.indices[self.indptr[i]:self.indptr[i + 1]]]
+
+    def incidents_for(self, defense_id: str) -> np.ndarray:
+        """Incident ids mapped to a defense: one bit-column scan."""
+        j = self.col_of(defense_id)
+        return self.incident_ids[(self.bits[:, j // 8] >> (7 - j % 8)) & 1 == 1]
+
+    def has(self, incident_id: int, defense_id: str) -> bool:
+        j = self.col_of(defense_id)
+        return bool((self.bits[self.row_of(incident_id), j // 8] >> (7 - j % 8)) & 1)
+
+    def to_csr(self) -> sparse.csr_matrix:
+        """(incidents x defenses) 0/1 matrix for analytics (duplicate IDs in a row count once)."""
+        csr = sparse.csr_matrix((np.ones(len(self.indices), dtype=np.int32), np.array(self.indices, dtype=np.int32),
+                                 np.array(self.indptr)), shape=self.shape)   # Copies: the memmaps are read-only
+        csr.sum_duplicates()
+        csr.data[:] = 1
+        return csr
+
+    def to_lists(self) -> Dict[int, List[str]]:
+        """incident_id -> defense IDs in the model's order (what split_ids() gives per mapping row)."""
+        names = self.defense_ids.tolist()
+        indptr, indices = np.asarray(self.indptr).tolist(), np.asarray(self.indices).tolist()
+        return {iid: [names[j] for j in indices[a:b]]
+                for iid, a, b in zip(self.incident_ids.tolist(), indptr[:-1], indptr[1:])}
+
+    def to_records(self) -> List[dict]:
+        """mapping.json records: {"incident_id", "matched_defense_ids": "A, B, C"}."""
+        return [{'incident_id': iid, 'matched_defense_ids': ', '.join(ids)} for iid, ids in self.to_lists().items()]
+
+    def to_mapping_df(self) -> pd.DataFrame:
+        """llm_defense_mapping.csv as a DataFrame."""
+        return pd.DataFrame(self.to_records(), columns=['incident_id', 'matched_defense_ids'])
+
+
+def load_matrix(path: str = MATRIX_FILE, mmap: bool = True) -> MappingMatrix:
+    arrays = _mmap_npz(path) if mmap else None
+    if arrays is None:
+        with np.load(path) as npz:
+            arrays = {k: npz[k] for k in npz.files}
+    if int(arrays['version']) != MATRIX_VERSION:
+        raise ValueError(f"{path}: unsupported matrix version {int(arrays['version'])}")
+    return MappingMatrix(arrays)
+
+
+def catalog_ids(path: str = DEFENSES_CSV) -> List[str]:
+    """Technique IDs in catalog order (raw AI_Defense_Techniques.csv or defenses.json-style columns)."""
+    df = pd.read_csv(path)
+    column = 'Technique ID' if 'Technique ID' in df.columns else 'defense_id'
+    return df[column].dropna().astype(str).tolist()
+
+
+def read_mapping(path: str) -> pd.DataFrame:
+    """llm_defense_mapping.csv or mapping.json as a DataFrame."""
+    if path.endswith('.json'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return pd.DataFrame(json.load(f), columns=['incident_id', 'matched_defense_ids'])
+    return pd.read_csv(path).fillna('')
+
+
+def verify(mapping_path: str, path: str) -> None:
+    """Round-trip check and the cost of text parsing vs the matrix."""
+    t0 = time.perf_counter()
+    mapping_df = read_mapping(mapping_path)
+    parsed = {int(i): split_ids(v) for i, v in zip(mapping_df['incident_id'], mapping_df['matched_defense_ids'])}
+    t_split = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    matrix = load_matrix(path)
+    t_load = time.perf_counter() - t0
+
+    back = matrix.to_mapping_df()
+    expected = mapping_df.assign(matched_defense_ids=mapping_df['matched_defense_ids'].map(
+        lambda v: ', '.join(split_ids(v)))).sort_values('incident_id').reset_index(drop=True)
+    same = back.astype(str).equals(expected[['incident_id', 'matched_defense_ids']].astype(str))
+
+    probe = str(matrix.defense_ids[int(matrix.indices[0]) if len(matrix.indices) else 0])
+    matrix.col_of(probe)   # Build the id dictionary outside the timing
+    t0 = time.perf_counter()
+    scan = sorted(i for i, ids in parsed.items() if probe in ids)
+    t_scan = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    fast = matrix.incidents_for(probe).tolist()
+    t_bits = time.perf_counter() - t0
+
+    print(f"{'round trip to CSV/JSON':<34}{'identical' if same and scan == fast else 'MISMATCH'}")
+    print(f"{'load':<34}{t_load * 1000:>9.2f} ms (mmap)  vs {t_split * 1000:>9.2f} ms (read text + split)")
+    print(f"{'incidents for ' + probe:<34}{t_bits * 1000:>9.3f} ms (bits)  vs {t_scan * 1000:>9.3f} ms (scan lists)")
+    if not same or scan != fast:
+        raise SystemExit(1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--mapping", default=MAPPING_CSV, help="llm_defense_mapping.csv or mapping.json")
+    ap.add_argument("--defenses", default=DEFENSES_CSV, help="catalog that fixes the column order")
+    ap.add_argument("--out", default=MATRIX_FILE)
+    ap.add_argument("--to-csv", default=None, help="also write the matrix back as a mapping CSV")
+    ap.add_argument("--to-json", default=None, help="also write the matrix back as mapping.json records")
+    ap.add_argument("--verify", action="store_true", help="check the round trip and time lookups")
+    args = ap.parse_args()
+
+    mapping_df = read_mapping(args.mapping)
+    catalog = catalog_ids(args.defenses) if os.path.exists(args.defenses) else []
+
+    t0 = time.perf_counter()
+    arrays = build_matrix(mapping_df.to_dict(orient='records'), catalog)
+    size = save_matrix(arrays, args.out)
+    extra = len(arrays['defense_ids']) - int(arrays['n_catalog'])
+    print(f"✅ {len(arrays['incident_ids'])} incidents x {len(arrays['defense_ids'])} defenses "
+          f"({len(arrays['indices'])} pairs, {extra} non-catalog IDs) -> {args.out} "
+          f"({size / 1024:,.1f} KB) in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+    matrix = load_matrix(args.out)
+    if args.to_csv:
+        matrix.to_mapping_df().to_csv(args.to_csv, index=False)
+        print(f"✅ Round trip -> {args.to_csv}")
+    if args.to_json:
+        with open(args.to_json, 'w', encoding='utf-8') as f:
+            json.dump(matrix.to_records(), f, ensure_ascii=False, indent=4)
+        print(f"✅ Round trip -> {args.to_json}")
+    if args.verify:
+        verify(args.mapping, args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+"""
+One entry point for the whole pipeline: defendlist -> combine -> generate_mapping -> tojson.
+
+Stages form a DAG with declared inputs and outputs. Each stage runs its script in
+its own work directory (<out>/work/<stage>/), so nothing is written into the
+caller's cwd. A stage is skipped when the hash of its code, arguments and input
+contents matches its last successful run. Stages with no path between them
+(defendlist and combine) run concurrently. Finished artifacts are copied into a
+fresh <out>/releases/<run_id>/ and <out>/current is switched to it with one
+atomic symlink replace, so `server.py --data-dir <out>/current` never sees a
+half-written site. Every stage writes its run report and Prometheus textfile
+(instrumentation.py) to <out>/metrics/.
+
+Usage:
+  python pipeline.py --out ../dist --tactics ../aidefense-framework/tactics --snapshot ../mongodump_full_snapshot
+  python pipeline.py --out ../dist --offline              # similarity_mapper.py instead of the Gemini API
+  python pipeline.py --out ../dist --dry-run              # which stages would run
+  python pipeline.py --out ../dist --force mapping        # re-run a stage even if its inputs are unchanged
+"""
+
+import argparse
+import ast
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shlex
+import shutil
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+
+from combine import OUTPUT_FILE as INCIDENTS_CSV, SNAPSHOT_DIR
+from defendlist import OUT_PATH as DEFENSES_CSV
+from generate_mapping import OUTPUT_MAPPING_FILE as MAPPING_CSV
+from instrumentation import METRICS_ENV
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WEB_DIR = os.path.join(HERE, '..', 'Web')
+WEB_INDEX = 'index.html'                            # Frontend entry; it and the scripts it loads go into every release
+TACTICS_DIR = '../aidefense-framework/tactics'
+OUT_DIR = '../dist'
+SITE_DIR = 'site'                                   # tojson.py --out-dir inside its work dir
+STATE_FILE = 'pipeline_state.json'
+STATE_VERSION = 1
+JOBS = 2
+KEEP_RELEASES = 3
+ERROR_MARKERS = (b'LLM_ERROR', b'JSON_PARSE_ERROR')
+SCRIPT_REF_RE = re.compile(r'''<script[^>]*\ssrc=["']([^"']+)["']|(?:new Worker|importScripts)\(\s*["']([^"']+)["']''')
+
+# An input is an external path or (upstream stage, file name in its work dir)
+Input = Union[str, Tuple[str, str]]
+
+
+@dataclass
+class Stage:
+    name: str
+    script: str
+    args: List[str]
+    inputs: List[Input]
+    outputs: List[str]                                # Left by the script in its work dir
+    code: List[str]                                   # Local modules hashed with the stage (local_modules)
+    publish: Dict[str, str] = field(default_factory=dict)  # output -> path inside the release
+    complete: Optional[str] = None                    # Output that must be free of ERROR_MARKERS to be cached
+
+    @property
+    def deps(self) -> List[str]:
+        return [i[0] for i in self.inputs if isinstance(i, tuple)]
+
+
+def local_modules(script: str, root: str = HERE) -> List[str]:
+    """The script and every module in `root` it imports, directly or through other local modules."""
+    found, pending = [script], [script]
+    while pending:
+        with open(os.path.join(root, pending.pop()), encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [a.name for a in node.names]
+            elif isinstance(node, ast.ImportFrom) and not node.level and node.module:
+                names = [node.module]
+            else:
+                continue
+            for name in names:
+                module = name.split('.')[0] + '.py'
+                if module not in found and os.path.exists(os.path.join(root, module)):
+                    found.append(module)
+                    pending.append(module)
+    return sorted(found)
+
+
+def build_stages(args) -> List[Stage]:
+    snapshot = os.path.abspath(args.snapshot)
+    mapper = 'similarity_mapper.py' if args.offline else 'generate_mapping.py'
+    return [
+        Stage('defendlist', 'defendlist.py', ['--tactics-dir', os.path.abspath(args.tactics)],
+              [os.path.abspath(args.tactics)], [DEFENSES_CSV], local_modules('defendlist.py'),
+              publish={DEFENSES_CSV: f'data/{DEFENSES_CSV}'}),
+        Stage('combine', 'combine.py', ['--snapshot', snapshot] + shlex.split(args.combine_args),
+              [os.path.join(snapshot, n) for n in ('incidents.csv', 'reports.csv', 'classifications_MIT.csv')],
+              [INCIDENTS_CSV], local_modules('combine.py'),
+              publish={INCIDENTS_CSV: f'data/{INCIDENTS_CSV}'}),
+        Stage('mapping', mapper, shlex.split(args.mapping_args),
+              [('combine', INCIDENTS_CSV), ('defendlist', DEFENSES_CSV)], [MAPPING_CSV], local_modules(mapper),
+              publish={MAPPING_CSV: f'data/{MAPPING_CSV}'}, complete=MAPPING_CSV),
+        Stage('tojson', 'tojson.py', ['--out-dir', SITE_DIR, '--matrix'] + (['--sharded'] if args.sharded else []),
+              [('combine', INCIDENTS_CSV), ('defendlist', DEFENSES_CSV), ('mapping', MAPPING_CSV)],
+              [SITE_DIR], local_modules('tojson.py'),
+              publish={SITE_DIR: '.'}),
+    ]
+
+
+def web_static(web_dir: str = WEB_DIR, entry: str = WEB_INDEX) -> List[str]:
+    """The entry page and every local script it loads: <script src>, then Worker/importScripts in those."""
+    names, pending = [entry], [entry]
+    while pending:
+        path = os.path.join(web_dir, pending.pop())
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding='utf-8') as f:
+            for m in SCRIPT_REF_RE.finditer(f.read()):
+                ref = m.group(1) or m.group(2)
+                if '//' not in ref and ref not in names:
+                    names.append(ref)
+                    pending.append(ref)
+    return names
+
+
+def check_dag(stages: List[Stage]) -> None:
+    """Unknown dependencies or cycles are configuration errors."""
+    names = {s.name for s in stages}
+    for s in stages:
+        missing = set(s.deps) - names
+        if missing:
+            raise ValueError(f"stage {s.name} depends on unknown stage(s): {', '.join(sorted(missing))}")
+    done, pending = set(), list(stages)
+    while pending:
+        ready = [s for s in pending if set(s.deps) <= done]
+        if not ready:
+            raise ValueError(f"dependency cycle among: {', '.join(s.name for s in pending)}")
+        done.update(s.name for s in ready)
+        pending = [s for s in pending if s.name not in done]
+
+
+# --- 1. Content hashes (stat-cached, like defendlist.py) ---
+
+def file_digest(path: str, files: dict) -> str:
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    hit = files.get(key)
+    if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+        return hit[2]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    files[key] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    return files[key][2]
+
+
+def path_digest(path: str, files: dict) -> str:
+    if not os.path.isdir(path):
+        return file_digest(path, files)
+    h = hashlib.sha256()
+    for root, dirs, names in os.walk(path):
+        dirs.sort()
+        for name in sorted(names):
+            full = os.path.join(root, name)
+            h.update(os.path.relpath(full, path).encode('utf-8') + b'\0')
+            h.update(file_digest(full, files).encode('ascii'))
+    return h.hexdigest()
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], out_dir: str, jobs: int = JOBS, force=(), dry_run: bool = False):
+        check_dag(stages)
+        self.stages = {s.name: s for s in stages}
+        self.out_dir = os.path.abspath(out_dir)
+        self.work_root = os.path.join(self.out_dir, 'work')
+        self.state_path = os.path.join(self.out_dir, STATE_FILE)
+        self.metrics_dir = os.path.join(self.out_dir, 'metrics')   # Run reports + .prom files of every stage
+        self.state = self.load_state()
+        self.max_jobs = max(jobs, 1)
+        self.jobs = None   # Semaphore, created inside the event loop
+        self.force = set(self.stages) if 'all' in force else set(force)
+        self.dry_run = dry_run
+        self.status: Dict[str, str] = {}
+        self.hashes: Dict[str, str] = {}
+
+    def load_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == STATE_VERSION:
+                return state
+        except (FileNotFoundError, ValueError):
+            pass
+        return {'version': STATE_VERSION, 'files': {}, 'stages': {}, 'published': None}
+
+    def save_state(self) -> None:
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp, self.state_path)
+
+    def work_dir(self, name: str) -> str:
+        return os.path.join(self.work_root, name)
+
+    def input_path(self, ref: Input) -> str:
+        return os.path.join(self.work_dir(ref[0]), ref[1]) if isinstance(ref, tuple) else ref
+
+    def stage_hash(self, stage: Stage) -> str:
+        files = self.state['files']
+        spec = {
+            'script': stage.script,
+            'args': stage.args,
+            'code': {m: file_digest(os.path.join(HERE, m), files) for m in stage.code},
+            'inputs': [[str(ref), path_digest(self.input_path(ref), files)] for ref in stage.inputs],
+        }
+        return hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def is_complete(self, stage: Stage) -> bool:
+        """False when the output still carries LLM error rows: the stage is re-run next time."""
+        if stage.complete is None:
+            return True
+        with open(os.path.join(self.work_dir(stage.name), stage.complete), 'rb') as f:
+            data = f.read()
+        return not any(marker in data for marker in ERROR_MARKERS)
+
+    # --- 2. Stages ---
+
+    async def run_stage(self, stage: Stage, tasks: dict) -> None:
+        for dep in stage.deps:
+            await tasks[dep]
+            if self.status[dep] == 'failed':
+                self.status[stage.name] = 'failed'
+                print(f"⏭️  {stage.name}: not run ({dep} failed)")
+                return
+
+        work = self.work_dir(stage.name)
+        upstream_ran = any(self.status[d] in ('ran', 'would run') for d in stage.deps)
+        if self.dry_run and upstream_ran:
+            self.status[stage.name] = 'would run'
+            print(f"▶️  {stage.name}: would run (upstream changed)")
+            return
+        try:
+            digest = self.stage_hash(stage)
+        except FileNotFoundError as e:
+            self.status[stage.name] = 'failed'
+            print(f"❌ {stage.name}: missing input {e.filename}")
+            return
+        self.hashes[stage.name] = digest
+
+        previous = self.state['stages'].get(stage.name)
+        outputs_present = all(os.path.exists(os.path.join(work, o)) for o in stage.outputs)
+        if previous == digest and outputs_present and stage.name not in self.force:
+            self.status[stage.name] = 'skipped'
+            print(f"✅ {stage.name}: unchanged, skipped")
+            return
+        if self.dry_run:
+            self.status[stage.name] = 'would run'
+            print(f"▶️  {stage.name}: would run")
+            return
+
+        async with self.jobs:
+            os.makedirs(work, exist_ok=True)
+            for output in stage.outputs:   # A run that fails but exits 0 must not leave the last run's output behind
+                path = os.path.join(work, output)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                elif os.path.lexists(path):
+                    os.remove(path)
+            for ref in stage.inputs:
+                if isinstance(ref, tuple):
+                    link = os.path.join(work, ref[1])
+                    if os.path.lexists(link):
+                        os.remove(link)
+                    os.symlink(self.input_path(ref), link)
+
+            log_path = os.path.join(self.work_root, f"{stage.name}.log")
+            print(f"▶️  {stage.name}: running {stage.script} {' '.join(stage.args)}".rstrip())
+            start = time.perf_counter()
+            with open(log_path, 'wb') as log:
+                proc = await asyncio.create_subprocess_exec(
+                    sys.executable, os.path.join(HERE, stage.script), *stage.args,
+                    cwd=work, stdout=log, stderr=asyncio.subprocess.STDOUT,
+                    env={**os.environ, 'PYTHONUNBUFFERED': '1', METRICS_ENV: self.metrics_dir})
+                code = await proc.wait()
+            elapsed = time.perf_counter() - start
+
+        missing = [o for o in stage.outputs if not os.path.exists(os.path.join(work, o))]
+        if code != 0 or missing:
+            self.status[stage.name] = 'failed'
+            reason = f"exit code {code}" if code != 0 else f"missing outputs: {', '.join(missing)}"
+            print(f"❌ {stage.name}: {reason} after {elapsed:.1f}s — last lines of {log_path}:")
+            with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f.readlines()[-15:]:
+                    print(f"    {line.rstrip()}")
+            return
+
+        self.status[stage.name] = 'ran'
+        if self.is_complete(stage):
+            self.state['stages'][stage.name] = digest
+        else:
+            self.state['stages'].pop(stage.name, None)
+            print(f"⚠️  {stage.name}: output has error rows; it will run again next time")
+        self.save_state()
+        print(f"✅ {stage.name}: done in {elapsed:.1f}s (log: {log_path})")
+
+    async def run(self) -> bool:
+        self.jobs = asyncio.Semaphore(self.max_jobs)
+        os.makedirs(self.work_root, exist_ok=True)
+        tasks = {}
+        for name, stage in self.stages.items():
+            tasks[name] = asyncio.ensure_future(self.run_stage(stage, tasks))
+        await asyncio.gather(*tasks.values())
+        if not self.dry_run:
+            self.save_state()
+        return all(s != 'failed' for s in self.status.values())
+
+    # --- 3. Atomic publish ---
+
+    def publish(self, keep: int = KEEP_RELEASES) -> Optional[str]:
+        """Copy published outputs + frontend into releases/<run_id>/ and swap the `current` symlink."""
+        files = self.state['files']
+        static = [os.path.join(WEB_DIR, n) for n in web_static()]
+        missing = [os.path.relpath(p, WEB_DIR) for p in static if not os.path.exists(p)]
+        if missing:
+            raise FileNotFoundError(f"{WEB_INDEX} loads missing script(s): {', '.join(missing)}")
+        release_key = hashlib.sha256(json.dumps(
+            [self.state['stages'].get(n) or self.hashes.get(n) for n in self.stages]
+            + [file_digest(p, files) for p in static]).encode('utf-8')).hexdigest()
+        current = os.path.join(self.out_dir, 'current')
+        if self.state.get('published') == release_key and os.path.exists(current):
+            print(f"✅ Nothing new to publish ({os.path.realpath(current)})")
+            return None
+
+        releases = os.path.join(self.out_dir, 'releases')
+        run_id = time.strftime('%Y%m%d-%H%M%S') + '-' + release_key[:8]
+        final = os.path.join(releases, run_id)
+        tmp = final + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for stage in self.stages.values():
+            for output, target in stage.publish.items():
+                src = os.path.join(self.work_dir(stage.name), output)
+                dst = os.path.normpath(os.path.join(tmp, target))
+                if os.path.isdir(src):
+                    shutil.copytree(src, dst, dirs_exist_ok=True)
+                else:
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    shutil.copy2(src, dst)
+        for path in static:
+            dst = os.path.join(tmp, os.path.relpath(path, WEB_DIR))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(path, dst)
+        missing = [n for n in web_static(tmp) if not os.path.exists(os.path.join(tmp, n))]
+        if missing:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise FileNotFoundError(f"release {run_id} is missing script(s) loaded by {WEB_INDEX}: {', '.join(missing)}")
+        os.rename(tmp, final)
+
+        link_tmp = current + '.tmp'
+        if os.path.lexists(link_tmp):
+            os.remove(link_tmp)
+        os.symlink(os.path.join('releases', run_id), link_tmp)
+        os.replace(link_tmp, current)   # Atomic: readers see the old or the new release, never a mix
+        self.state['published'] = release_key
+        self.save_state()
+
+        old = sorted(d for d in os.listdir(releases) if d != run_id and not d.endswith('.tmp'))
+        for name in old[:max(len(old) - (keep - 1), 0)]:
+            shutil.rmtree(os.path.join(releases, name), ignore_errors=True)
+        print(f"📦 Published {final} -> {current}")
+        return final
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Run defendlist -> combine -> mapping -> tojson as one DAG.")
+    ap.add_argument("--out", default=OUT_DIR, help="output directory (work dirs, releases, current symlink)")
+    ap.add_argument("--tactics", default=TACTICS_DIR, help="directory with the AIDEFEND tactic JS files")
+    ap.add_argument("--snapshot", default=SNAPSHOT_DIR, help="AIID snapshot directory for combine.py")
+    ap.add_argument("--offline", action="store_true", help="map with similarity_mapper.py (no API key)")
+    ap.add_argument("--mapping-args", default="", help='extra generate_mapping.py arguments, e.g. "--concurrency 16"')
+    ap.add_argument("--combine-args", default="", help='extra combine.py arguments, e.g. "--streaming"')
+    ap.add_argument("--no-sharded", dest="sharded", action="store_false", help="plain tojson.py export")
+    ap.add_argument("--jobs", type=int, default=JOBS, help="stages running at the same time")
+    ap.add_argument("--force", nargs="*", default=[], metavar="STAGE", help="re-run these stages ('all' for every stage)")
+    ap.add_argument("--dry-run", action="store_true", help="report which stages would run, run nothing")
+    ap.add_argument("--keep", type=int, default=KEEP_RELEASES, help="releases kept under <out>/releases")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    stages = build_stages(args)
+    unknown = set(args.force) - {s.name for s in stages} - {'all'}
+    if unknown:
+        sys.exit(f"❌ Unknown stage(s) for --force: {', '.join(sorted(unknown))}")
+
+    pipeline = Pipeline(stages, args.out, args.jobs, args.force, args.dry_run)
+    start = time.perf_counter()
+    ok = asyncio.run(pipeline.run())
+    print(f"\n⏱️  {time.perf_counter() - start:.1f}s | " + ", ".join(f"{n}: {s}" for n, s in pipeline.status.items()))
+    if not ok:
+        sys.exit("❌ Pipeline failed; nothing published.")
+    if not args.dry_run:
+        pipeline.publish(args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Content-addressed, append-only JSONL cache for LLM mapping results.
+
+The key is a SHA-256 over everything that can change an answer: the incident
+fields that go into the prompt, the defense catalog text, the model name and
+the prompt template. Each result is appended and flushed as soon as it
+arrives, so a crashed run loses at most the in-flight requests.
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+# Incident fields rendered into the prompt (anything else does not affect the answer)
+PROMPT_FIELDS = ('incident_id', 'incident_title', 'deployer', 'developer',
+                 'mitre_classification', 'full_report_text')
+
+# Placeholder rows that should be retried instead of served from the cache
+ERROR_MARKERS = ('LLM_ERROR', 'JSON_PARSE_ERROR')
+
+
+def cache_key(incident_data: dict, defense_list: str, model: str, template: str) -> str:
+    """Stable hash of (incident prompt fields, catalog, model, prompt template)."""
+    h = hashlib.sha256()
+    for part in (model, template, defense_list):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    for field in PROMPT_FIELDS:
+        h.update(str(incident_data.get(field, '')).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def is_error(ids) -> bool:
+    return not ids or any(i in ERROR_MARKERS for i in ids)
+
+
+class ResultCache:
+    """Append-only JSONL store: one {"key", "incident_id", "matched_defense_ids"} object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, dict] = {}
+        self.hits = self.misses = self.retried_errors = 0
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    self.entries[entry['key']] = entry  # last write wins
+        self._fh = None
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return a cached good result, counting hits/misses; error rows count as misses."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if is_error(entry['matched_defense_ids']):
+            self.misses += 1
+            self.retried_errors += 1
+            return None
+        self.hits += 1
+        return {'incident_id': entry['incident_id'], 'matched_defense_ids': entry['matched_defense_ids']}
+
+    def put(self, key: str, result: dict) -> None:
+        entry = {'key': key, 'incident_id': result['incident_id'],
+                 'matched_defense_ids': result['matched_defense_ids']}
+        self.entries[key] = entry
+        if self._fh is None:
+            self._fh = open(self.path, 'a', encoding='utf-8')
+            if self._fh.tell() and not self._ends_with_newline():
+                self._fh.write('\n')  # Close a torn last line so the first new entry starts on its own
+        self._fh.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self._fh.flush()
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def summary(self) -> str:
+        return (f"cache hits={self.hits} misses={self.misses} "
+                f"(of which {self.retried_errors} retried error rows)")
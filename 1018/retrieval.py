@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local BM25 retrieval over the AIDEFEND catalog (NumPy + SciPy sparse matrices).
+
+Used by generate_mapping.py (--top-k) to shortlist candidate defenses per incident,
+so each prompt carries K catalog entries instead of all ~174.
+
+Evaluation mode measures, for several K, how many of the defenses the LLM picked
+with the full catalog (llm_defense_mapping.csv) survive the shortlist:
+
+Usage:
+  python retrieval.py --eval --k 10 20 30 40 60
+"""
+
+import argparse, re
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+DEFENSES_FILE = "AI_Defense_Techniques.csv"
+INCIDENTS_FILE = "merged_incident_data.csv"
+MAPPING_FILE = "llm_defense_mapping.csv"
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from had has
+have he her his how i if in into is it its may more most no not of on or our out over she so such
+than that the their them there these they this those to up was we were what when which who will
+with would you your said says
+""".split())
+
+# BM25 parameters (standard Okapi defaults)
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(str(text).lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def build_vocabulary(docs: Iterable[List[str]]) -> Dict[str, int]:
+    vocab: Dict[str, int] = {}
+    for toks in docs:
+        for t in toks:
+            if t not in vocab:
+                vocab[t] = len(vocab)
+    return vocab
+
+
+def count_matrix(docs: Sequence[List[str]], vocab: Dict[str, int], binary: bool = False) -> sparse.csr_matrix:
+    """Sparse (n_docs x n_terms) term-count matrix; out-of-vocabulary tokens are dropped."""
+    indptr, indices = [0], []
+    for toks in docs:
+        idx = [vocab[t] for t in toks if t in vocab]
+        if binary:
+            idx = list(set(idx))
+        indices.extend(idx)
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    m = sparse.csr_matrix((data, np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+                          shape=(len(docs), len(vocab)))
+    m.sum_duplicates()
+    return m
+
+
+class DefenseIndex:
+    """BM25 index over defense descriptions; scores many incidents with one sparse product."""
+
+    def __init__(self, ids: Sequence[str], texts: Sequence[str]):
+        self.ids = list(ids)
+        docs = [tokenize(t) for t in texts]
+        self.vocab = build_vocabulary(docs)
+        tf = count_matrix(docs, self.vocab).tocsr()
+
+        n_docs = tf.shape[0]
+        df = np.bincount(tf.indices, minlength=len(self.vocab))
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        norm = K1 * (1 - B + B * doc_len / max(doc_len.mean(), 1.0))
+
+        # Precompute the BM25 weight of every (doc, term) pair once
+        rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+        w = tf.data * (K1 + 1) / (tf.data + norm[rows]) * idf[tf.indices]
+        self.weights = sparse.csr_matrix((w.astype(np.float32), tf.indices, tf.indptr), shape=tf.shape)
+
+    @classmethod
+    def from_csv(cls, path: str = DEFENSES_FILE) -> "DefenseIndex":
+        df = pd.read_csv(path).fillna("")
+        return cls(df["Technique ID"], df["Technique Name"] + " " + df["Description"])
+
+    def scores(self, queries: Sequence[str]) -> np.ndarray:
+        """Dense (n_queries x n_defenses) BM25 scores. Query terms are binary (presence only)."""
+        q = count_matrix([tokenize(t) for t in queries], self.vocab, binary=True)
+        return (q @ self.weights.T).toarray()
+
+    def top_k(self, queries: Sequence[str], k: int) -> List[List[int]]:
+        """Indices of the k best defenses per query, best first."""
+        s = self.scores(queries)
+        k = min(k, s.shape[1])
+        part = np.argpartition(-s, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(s, part, axis=1).argsort(axis=1)[:, ::-1]
+        return np.take_along_axis(part, order, axis=1).tolist()
+
+
+def incident_query(incident: dict) -> str:
+    """Text used to retrieve defenses for one incident (same fields the prompt shows)."""
+    return " ".join(str(incident.get(f, "")) for f in
+                    ("incident_title", "mitre_classification", "full_report_text"))
+
+
+def split_ids(s) -> List[str]:
+    return [x.strip() for x in str(s).split(",") if x.strip()]
+
+
+def evaluate(index: DefenseIndex, incidents: pd.DataFrame, mapping: pd.DataFrame, ks: Sequence[int]):
+    """Recall of the full-catalog LLM picks inside the top-K shortlist, per K."""
+    ref = {int(r.incident_id): split_ids(r.matched_defense_ids) for r in mapping.itertuples()}
+    ref = {k: v for k, v in ref.items() if v and not any(x in ("LLM_ERROR", "JSON_PARSE_ERROR") for x in v)}
+    incidents = incidents[incidents["incident_id"].isin(ref)]
+    if incidents.empty:
+        print("[WARN] no overlapping incidents between mapping and incident file")
+        return []
+
+    ranked = index.top_k([incident_query(r) for r in incidents.to_dict(orient="records")], max(ks))
+    pos = {d: i for i, d in enumerate(index.ids)}
+    report = []
+    for k in ks:
+        recalls, complete = [], 0
+        for iid, order in zip(incidents["incident_id"], ranked):
+            shortlist = set(order[:k])
+            wanted = [pos[d] for d in ref[int(iid)] if d in pos]
+            hit = sum(1 for d in wanted if d in shortlist)
+            recalls.append(hit / max(len(wanted), 1))
+            complete += hit == len(wanted)
+        report.append({"k": k, "mean_recall": float(np.mean(recalls)),
+                       "full_recall_share": complete / len(recalls),
+                       "catalog_share": k / len(index.ids)})
+    return report
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--eval", action="store_true", help="recall of top-K shortlist vs. full-catalog LLM mapping")
+    ap.add_argument("--k", type=int, nargs="+", default=[10, 20, 30, 40, 60, 80])
+    ap.add_argument("--defenses", default=DEFENSES_FILE)
+    ap.add_argument("--incidents", default=INCIDENTS_FILE)
+    ap.add_argument("--mapping", default=MAPPING_FILE)
+    ap.add_argument("--target-recall", type=float, default=0.95)
+    args = ap.parse_args()
+
+    index = DefenseIndex.from_csv(args.defenses)
+    print(f"[OK] BM25 index: {len(index.ids)} defenses, {len(index.vocab)} terms")
+    if not args.eval:
+        return
+
+    incidents = pd.read_csv(args.incidents).fillna("")
+    mapping = pd.read_csv(args.mapping).fillna("")
+    report = evaluate(index, incidents, mapping, sorted(args.k))
+    print(f"\n{'K':>5} {'mean recall':>12} {'all picks kept':>15} {'catalog share':>14}")
+    for r in report:
+        print(f"{r['k']:>5} {r['mean_recall']:>12.3f} {r['full_recall_share']:>15.1%} {r['catalog_share']:>14.1%}")
+    ok = [r["k"] for r in report if r["mean_recall"] >= args.target_recall]
+    if ok:
+        print(f"\nSmallest K with mean recall >= {args.target_recall}: {ok[0]}")
+    elif report:
+        print(f"\nNo tested K reaches mean recall {args.target_recall}; try larger values.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Tokenized inverted index over incidents (title, report text, MITRE classification).
+
+Built once at export time by tojson.py and written as search_index.json:
+
+    {"version": 1,
+     "ids":      [incident_id, ...],            # document number -> incident id
+     "terms":    ["abuse", "access", ...],      # sorted, for prefix range lookups
+     "postings": [[3, 1, 7], ...]}              # per term: delta-encoded document numbers
+
+Web/search.js reads the same format; both sides tokenize identically
+(lowercase, runs of letters/digits), so a query is a few posting-list
+intersections instead of a substring scan over the whole corpus.
+"""
+
+import bisect
+import re
+from typing import Dict, Iterable, List, Sequence
+
+SEARCH_FIELDS = ('incident_title', 'full_report_text', 'mitre_classification')
+INDEX_VERSION = 1
+MAX_TERM_LEN = 30   # Longer "words" are URLs/hashes nobody types
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in TOKEN_RE.findall(str(text).lower()) if len(t) <= MAX_TERM_LEN]
+
+
+def build_search_index(records: Iterable[dict], fields: Sequence[str] = SEARCH_FIELDS) -> dict:
+    ids, postings = [], {}
+    for doc, record in enumerate(records):
+        ids.append(record['incident_id'])
+        terms = set()
+        for field in fields:
+            terms.update(tokenize(record.get(field, '')))
+        for term in terms:
+            postings.setdefault(term, []).append(doc)  # docs arrive in order: lists stay sorted
+
+    terms = sorted(postings)
+    encoded = []
+    for term in terms:
+        docs = postings[term]
+        encoded.append([docs[0]] + [b - a for a, b in zip(docs, docs[1:])])
+    return {'version': INDEX_VERSION, 'ids': ids, 'terms': terms, 'postings': encoded}
+
+
+class SearchIndex:
+    """Query side of search_index.json (prefix match per query token, AND across tokens)."""
+
+    def __init__(self, raw: dict):
+        self.ids = raw['ids']
+        self.terms = raw['terms']
+        self.postings = []
+        for deltas in raw['postings']:
+            docs, acc = [], 0
+            for d in deltas:
+                acc += d
+                docs.append(acc)
+            self.postings.append(docs)
+
+    def _prefix_docs(self, prefix: str) -> set:
+        lo = bisect.bisect_left(self.terms, prefix)
+        hi = bisect.bisect_left(self.terms, prefix + '\uffff')
+        if hi - lo == 1:
+            return set(self.postings[lo])
+        out = set()
+        for i in range(lo, hi):
+            out.update(self.postings[i])
+        return out
+
+    def search(self, query: str) -> List:
+        """Incident ids (in index order) whose indexed text contains every query token as a word prefix."""
+        tokens = sorted(set(tokenize(query)), key=len, reverse=True)  # longest = most selective first
+        if not tokens:
+            return list(self.ids)
+        docs = None
+        for token in tokens:
+            found = self._prefix_docs(token)
+            docs = found if docs is None else docs & found
+            if not docs:
+                return []
+        return [self.ids[d] for d in sorted(docs)]
+
+
+def index_stats(raw: dict) -> Dict[str, int]:
+    return {'documents': len(raw['ids']), 'terms': len(raw['terms']),
+            'postings': sum(len(p) for p in raw['postings'])}
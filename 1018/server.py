@@ -0,0 +1,378 @@
+"""
+Query server for the tojson.py artifacts (replaces `python -m http.server`).
+
+Loads incidents / defenses / mapping once into in-memory indexes and answers:
+
+    GET /incidents?q=<words>&page=<n>&page_size=<n>   search + paginated summaries
+    GET /incidents/<id>                               full incident with its defenses
+    GET /defenses/<id>                                one defense technique
+    GET /defenses/<id>/incidents?page=<n>&rollup=1    incidents mapped to that defense (+ sub-techniques)
+    GET /tactics                                      per-tactic defense / incident / mapping counts
+
+Any other path is served as a static file from --static (the Web/ frontend).
+Responses carry a weak ETag (304 on If-None-Match) and are gzipped when the
+client accepts it. The artifacts are polled for changes (and reloaded on SIGHUP);
+a new store is built off the event loop and swapped in atomically.
+
+Usage: python server.py --data-dir ../Web --static ../Web --port 8000
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import signal
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from defense_index import build_defense_index, incidents_for, split_ids
+from mapping_matrix import MATRIX_FILE, load_matrix
+from search_index import SEARCH_FIELDS, SearchIndex, build_search_index
+from tojson import (DEFENSE_INDEX_JSON, DEFENSES_JSON, INCIDENT_INDEX_JSON, INCIDENT_SHARD_DIR,
+                    INCIDENTS_JSON, INDEX_FIELDS, MAPPING_JSON, SEARCH_INDEX_JSON)
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+RELOAD_INTERVAL = 2.0       # Seconds between artifact mtime checks
+GZIP_MIN_BYTES = 1024       # Smaller bodies are not worth compressing
+RESPONSE_CACHE_SIZE = 4096  # Rendered (path, query) responses kept per store
+COMPACT = (',', ':')
+
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+# --- 1. In-memory store ---
+
+def artifact_paths(data_dir):
+    names = [INCIDENTS_JSON, INCIDENT_INDEX_JSON, DEFENSES_JSON, MAPPING_JSON, SEARCH_INDEX_JSON,
+             DEFENSE_INDEX_JSON, MATRIX_FILE]
+    return [os.path.join(data_dir, n) for n in names]
+
+
+def artifact_version(data_dir):
+    """(path, mtime, size) of every artifact that exists; changes when tojson.py reruns."""
+    version = []
+    for path in artifact_paths(data_dir):
+        try:
+            st = os.stat(path)
+            version.append((path, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            pass
+    return tuple(version)
+
+
+def read_json(path):
+    with open(path, 'rb') as f:
+        return json.loads(f.read())
+
+
+class Store:
+    """Everything one artifact generation needs to answer queries, plus its response cache."""
+
+    def __init__(self, data_dir):
+        self.version = artifact_version(data_dir)
+        self.loaded_at = time.time()
+
+        # Incidents: monolithic export, or summary index + detail shards from --sharded
+        path = os.path.join(data_dir, INCIDENTS_JSON)
+        if os.path.exists(path):
+            incidents = read_json(path)
+        else:
+            incidents = []
+            for summary in read_json(os.path.join(data_dir, INCIDENT_INDEX_JSON)):
+                shard = os.path.join(data_dir, INCIDENT_SHARD_DIR, f"{summary['incident_id']}.json")
+                incidents.append(read_json(shard) if os.path.exists(shard) else summary)
+        incidents.sort(key=lambda r: r['incident_id'])
+
+        self.defenses = {}
+        for d in read_json(os.path.join(data_dir, DEFENSES_JSON)):
+            key = str(d.get('defense_id', '')).strip()
+            if key:
+                self.defenses[key] = d
+
+        self.incident_defenses = {}
+        path = os.path.join(data_dir, MAPPING_JSON)
+        matrix_path = os.path.join(data_dir, MATRIX_FILE)
+        if os.path.exists(matrix_path) and (not os.path.exists(path)
+                                            or os.path.getmtime(matrix_path) >= os.path.getmtime(path)):
+            # tojson.py --matrix: rows come pre-split; an npz older than mapping.json is stale
+            self.incident_defenses = load_matrix(matrix_path).to_lists()
+            mapping = [{'incident_id': iid, 'matched_defense_ids': ids} for iid, ids in self.incident_defenses.items()]
+        else:
+            mapping = read_json(path) if os.path.exists(path) else []
+            for m in mapping:
+                self.incident_defenses[m['incident_id']] = split_ids(m.get('matched_defense_ids'))
+
+        self.incidents = {}
+        self.summaries = {}
+        for r in incidents:
+            iid = r['incident_id']
+            r['matched_defense_ids'] = self.incident_defenses.get(iid, [])
+            self.incidents[iid] = r
+            summary = {k: r[k] for k in INDEX_FIELDS if k in r}
+            summary['matched_defense_ids'] = r['matched_defense_ids']
+            self.summaries[iid] = summary
+        self.order = list(self.incidents)
+
+        # Reverse index (defense -> incidents, tactic counts): exported by tojson.py, else built here
+        path = os.path.join(data_dir, DEFENSE_INDEX_JSON)
+        if os.path.exists(path):
+            self.defense_index = read_json(path)
+        else:
+            self.defense_index = build_defense_index(mapping, self.defenses.values())
+
+        # Prebuilt search index when exported; its document order may differ, so ids are re-sorted
+        path = os.path.join(data_dir, SEARCH_INDEX_JSON)
+        if os.path.exists(path):
+            self.search_index = SearchIndex(read_json(path))
+        else:
+            self.search_index = SearchIndex(build_search_index(
+                ({'incident_id': iid, **{f: r.get(f, '') for f in SEARCH_FIELDS}}
+                 for iid, r in self.incidents.items())))
+
+        self.cache = OrderedDict()
+
+    def search(self, query):
+        if not query.strip():
+            return self.order
+        return sorted(iid for iid in self.search_index.search(query) if iid in self.incidents)
+
+
+# --- 2. Routes ---
+
+def page_args(params):
+    try:
+        page = max(int(params.get('page', ['1'])[0]), 1)
+        size = min(max(int(params.get('page_size', [str(PAGE_SIZE)])[0]), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("page and page_size must be integers")
+    return page, size
+
+
+def paginate(store, ids, params, **extra):
+    page, size = page_args(params)
+    total = len(ids)
+    start = (page - 1) * size
+    return {**extra, 'page': page, 'page_size': size, 'total': total,
+            'pages': (total + size - 1) // size,
+            'results': [store.summaries[i] for i in ids[start:start + size]]}
+
+
+def route(store, path, params):
+    """(status, payload) for an API path, or None when the path is not an API route."""
+    if path == '/incidents':
+        query = params.get('q', [''])[0]
+        return 200, paginate(store, store.search(query), params, query=query)
+
+    m = re.fullmatch(r'/incidents/(\d+)', path)
+    if m:
+        incident = store.incidents.get(int(m.group(1)))
+        if incident is None:
+            return 404, {'error': f"incident {m.group(1)} not found"}
+        defenses = [store.defenses[d] for d in incident['matched_defense_ids'] if d in store.defenses]
+        return 200, {**incident, 'defenses': defenses}
+
+    m = re.fullmatch(r'/defenses/([^/]+)(/incidents)?', path)
+    if m:
+        did = unquote(m.group(1))
+        if did not in store.defenses:
+            return 404, {'error': f"defense {did} not found"}
+        entry = store.defense_index['defenses'].get(did, {})
+        if m.group(2):
+            rollup = params.get('rollup', ['0'])[0] not in ('0', 'false', '')
+            ids = [i for i in incidents_for(store.defense_index, did, rollup) if i in store.summaries]
+            return 200, paginate(store, ids, params, defense_id=did, rollup=rollup)
+        return 200, {**store.defenses[did], 'incident_count': entry.get('incident_count', 0),
+                     'rollup_count': entry.get('rollup_count', 0)}
+
+    if path == '/tactics':
+        return 200, store.defense_index['tactics']
+
+    return None
+
+
+# --- 3. HTTP ---
+
+class QueryServer:
+    def __init__(self, data_dir, static_dir=None, reload_interval=RELOAD_INTERVAL):
+        self.data_dir = data_dir
+        self.static_dir = os.path.abspath(static_dir) if static_dir else None
+        self.reload_interval = reload_interval
+        self.store = Store(data_dir)
+        self.requests = 0
+        self._reloading = False
+
+    # --- Hot reload ---
+
+    async def reload(self, reason):
+        if self._reloading:
+            return
+        self._reloading = True
+        try:
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            store = await loop.run_in_executor(None, Store, self.data_dir)
+            self.store = store   # In-flight requests keep the store they started with
+            print(f"🔁 Reloaded artifacts ({reason}): {len(store.incidents)} incidents, "
+                  f"{len(store.defenses)} defenses in {time.perf_counter() - start:.2f}s")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Reload failed, keeping previous artifacts: {e}")
+        finally:
+            self._reloading = False
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            if artifact_version(self.data_dir) != self.store.version:
+                await self.reload("artifacts changed")
+
+    # --- Responses ---
+
+    def render(self, store, target):
+        """
+        [status, content_type, body, etag, gzipped_body] for a GET target. API responses
+        are cached per store, so the gzip of a hot response is computed once.
+        """
+        cached = store.cache.get(target)
+        if cached is not None:
+            store.cache.move_to_end(target)
+            return cached
+
+        parts = urlsplit(target)
+        path = parts.path.rstrip('/') or '/'
+        try:
+            result = route(store, path, parse_qs(parts.query))
+        except ValueError as e:
+            result = 400, {'error': str(e)}
+        if result is None:
+            return self.static(path)
+
+        status, payload = result
+        body = json.dumps(payload, ensure_ascii=False, separators=COMPACT).encode('utf-8')
+        etag = 'W/"%s"' % hashlib.sha1(body).hexdigest()[:20]
+        rendered = [status, 'application/json; charset=utf-8', body, etag, None]
+        if status == 200:
+            store.cache[target] = rendered
+            if len(store.cache) > RESPONSE_CACHE_SIZE:
+                store.cache.popitem(last=False)
+        return rendered
+
+    def static(self, path):
+        if self.static_dir is None:
+            return [404, 'application/json', b'{"error":"not found"}', None, None]
+        rel = 'index.html' if path == '/' else unquote(path).lstrip('/')
+        full = os.path.abspath(os.path.join(self.static_dir, rel))
+        if not full.startswith(self.static_dir + os.sep) or not os.path.isfile(full):
+            return [404, 'application/json', b'{"error":"not found"}', None, None]
+        with open(full, 'rb') as f:
+            body = f.read()
+        st = os.stat(full)
+        etag = 'W/"%x-%x"' % (st.st_mtime_ns, st.st_size)
+        ctype = mimetypes.guess_type(full)[0] or 'application/octet-stream'
+        return [200, ctype, body, etag, None]
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b'\r\n', b'\n', b''):
+                            break
+                        name, _, value = line.decode('latin-1').partition(':')
+                        headers[name.strip().lower()] = value.strip()
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:  # Line over the stream limit, or not "METHOD target version"
+                    body = b'{"error":"bad request"}'
+                    writer.write(f"HTTP/1.1 400 {STATUS_TEXT[400]}\r\nContent-Type: application/json\r\n"
+                                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body)
+                    await writer.drain()
+                    break
+                keep_alive = (headers.get('connection', '').lower() != 'close'
+                              and version == 'HTTP/1.1')
+                self.requests += 1
+
+                if method not in ('GET', 'HEAD'):
+                    rendered = [405, 'application/json', b'{"error":"method not allowed"}', None, None]
+                    keep_alive = False  # Its body is never read, so the next "request" would be body bytes
+                else:
+                    try:
+                        rendered = self.render(self.store, target)
+                    except Exception as e:  # Never drop the connection on a handler bug
+                        print(f"❌ {target}: {e}")
+                        rendered = [500, 'application/json', b'{"error":"internal error"}', None, None]
+                status, ctype, body, etag, _ = rendered
+
+                out = {'Content-Type': ctype, 'Vary': 'Accept-Encoding'}
+                if etag:
+                    out['ETag'] = etag
+                if status == 200 and etag and headers.get('if-none-match') == etag:
+                    status, body = 304, b''
+                elif (len(body) >= GZIP_MIN_BYTES and 'gzip' in headers.get('accept-encoding', '')
+                      and not ctype.startswith(('image/', 'font/'))):
+                    if rendered[4] is None:
+                        rendered[4] = gzip.compress(body, compresslevel=6, mtime=0)
+                    body = rendered[4]
+                    out['Content-Encoding'] = 'gzip'
+                out['Content-Length'] = str(len(body))
+                out['Connection'] = 'keep-alive' if keep_alive else 'close'
+
+                head = f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n" + \
+                       ''.join(f"{k}: {v}\r\n" for k, v in out.items()) + "\r\n"
+                writer.write(head.encode('latin-1') + (b'' if method == 'HEAD' else body))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle, host, port)
+        loop = asyncio.get_running_loop()
+        if hasattr(signal, 'SIGHUP'):
+            loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.reload("SIGHUP")))
+        watcher = asyncio.ensure_future(self.watch()) if self.reload_interval > 0 else None
+        print(f"✅ Serving {len(self.store.incidents)} incidents, {len(self.store.defenses)} defenses "
+              f"on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if watcher:
+                watcher.cancel()
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Serve incident/defense queries from the tojson.py artifacts.")
+    ap.add_argument("--data-dir", default=".", help="directory holding the tojson.py JSON artifacts")
+    ap.add_argument("--static", default=None, help="also serve this directory (e.g. ../Web) for other paths")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--reload-interval", type=float, default=RELOAD_INTERVAL,
+                    help="seconds between artifact change checks (0 disables; SIGHUP still reloads)")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    server = QueryServer(args.data_dir, args.static, args.reload_interval)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"\nServed {server.requests:,} requests.")
+
+
+if __name__ == "__main__":
+    main()
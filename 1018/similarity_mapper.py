@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM-free defense mapping: TF-IDF cosine similarity between each incident's
+full_report_text and the AIDEFEND descriptions, computed as sparse matrix products.
+
+Top-k selection is tactic-aware: at most --per-tactic picks come from the same
+Tactic, so a mapping is not five near-identical Detect techniques.
+
+Usage:
+  python similarity_mapper.py                          # full mapping -> llm_defense_mapping.csv
+  python similarity_mapper.py --fallback               # only fill LLM_ERROR / JSON_PARSE_ERROR rows
+  python similarity_mapper.py --agreement mapping.json # compare against the Gemini mapping
+"""
+
+import argparse, json, time
+from typing import List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from instrumentation import start_run
+from retrieval import build_vocabulary, count_matrix, split_ids, tokenize
+
+INCIDENTS_FILE = "merged_incident_data.csv"
+DEFENSES_FILE = "AI_Defense_Techniques.csv"
+OUTPUT_MAPPING_FILE = "llm_defense_mapping.csv"
+ERROR_MARKERS = ("LLM_ERROR", "JSON_PARSE_ERROR")
+
+TOP_K = 4            # Same 3-5 range the LLM prompt asks for
+PER_TACTIC = 2       # Max picks from one tactic
+CHUNK = 5000         # Incidents scored per matrix product (bounds peak memory)
+
+
+def l2_normalize(m: sparse.csr_matrix) -> sparse.csr_matrix:
+    norms = np.sqrt(np.asarray(m.multiply(m).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms) @ m
+
+
+class SimilarityMapper:
+    """TF-IDF space fitted on the defense catalog; incidents are projected into it."""
+
+    def __init__(self, defense_df: pd.DataFrame):
+        defense_df = defense_df.fillna("")
+        self.ids = defense_df["Technique ID"].tolist()
+        self.tactics, self.tactic_codes = np.unique(defense_df["Tactic"].astype(str), return_inverse=True)
+        docs = [tokenize(t) for t in defense_df["Technique Name"] + " " + defense_df["Description"]]
+        self.vocab = build_vocabulary(docs)
+        tf = count_matrix(docs, self.vocab)
+        df = np.bincount(tf.indices, minlength=len(self.vocab))
+        self.idf = (np.log((1 + len(docs)) / (1 + df)) + 1).astype(np.float32)
+        self.defense_vecs = self._weigh(tf)
+
+    def _weigh(self, tf: sparse.csr_matrix) -> sparse.csr_matrix:
+        # Sublinear tf keeps long multi-report incidents from being dominated by repeated words
+        tf = tf.copy()
+        tf.data = 1 + np.log(tf.data)
+        return l2_normalize(tf @ sparse.diags(self.idf))
+
+    def similarity(self, texts: List[str]) -> np.ndarray:
+        """Dense (n_texts x n_defenses) cosine similarity."""
+        tf = count_matrix([tokenize(t) for t in texts], self.vocab)
+        return (self._weigh(tf) @ self.defense_vecs.T).toarray()
+
+    def select(self, scores: np.ndarray, k: int, per_tactic: int) -> np.ndarray:
+        """
+        Vectorized tactic-aware top-k: walk defenses by descending score, drop any that
+        would exceed `per_tactic` for its tactic, keep the first k survivors.
+        Returns an (n, k) index array, -1 where fewer than k candidates qualify.
+        """
+        order = np.argsort(-scores, axis=1)
+        tactic = self.tactic_codes[order]                                    # (n, m)
+        onehot = tactic[:, :, None] == np.arange(len(self.tactics))          # (n, m, t)
+        rank_in_tactic = (np.cumsum(onehot, axis=1) * onehot).sum(axis=2) - 1
+        keep = (rank_in_tactic < per_tactic) & (np.take_along_axis(scores, order, axis=1) > 0)
+        slot = np.cumsum(keep, axis=1) - 1
+        keep &= slot < k
+        out = np.full((scores.shape[0], k), -1, dtype=np.int64)
+        rows, cols = np.nonzero(keep)
+        out[rows, slot[rows, cols]] = order[rows, cols]
+        return out
+
+    def map_texts(self, texts: List[str], k: int = TOP_K, per_tactic: int = PER_TACTIC) -> List[List[str]]:
+        picks = []
+        for start in range(0, len(texts), CHUNK):
+            sel = self.select(self.similarity(texts[start:start + CHUNK]), k, per_tactic)
+            picks.extend([self.ids[j] for j in row if j >= 0] for row in sel)
+        return picks
+
+
+def incident_text(df: pd.DataFrame) -> List[str]:
+    return (df["incident_title"].astype(str) + " " + df["mitre_classification"].astype(str) + " "
+            + df["full_report_text"].astype(str)).tolist()
+
+
+def to_mapping_df(incident_ids, picks) -> pd.DataFrame:
+    return pd.DataFrame({"incident_id": list(incident_ids),
+                         "matched_defense_ids": [", ".join(p) for p in picks]})
+
+
+def agreement(pred: dict, ref: dict, k: int) -> dict:
+    """Mean Jaccard, precision@k and recall of predicted vs. reference defense sets."""
+    jac, prec, rec = [], [], []
+    for iid, ref_ids in ref.items():
+        if iid not in pred or not ref_ids or any(x in ERROR_MARKERS for x in ref_ids):
+            continue
+        p, r = pred[iid][:k], set(ref_ids)
+        inter = len(set(p) & r)
+        jac.append(inter / max(len(set(p) | r), 1))
+        prec.append(inter / max(len(p), 1))
+        rec.append(inter / len(r))
+    n = len(jac)
+    return {"incidents_compared": n,
+            "mean_jaccard": float(np.mean(jac)) if n else 0.0,
+            f"precision_at_{k}": float(np.mean(prec)) if n else 0.0,
+            "recall": float(np.mean(rec)) if n else 0.0}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--incidents", default=INCIDENTS_FILE)
+    ap.add_argument("--defenses", default=DEFENSES_FILE)
+    ap.add_argument("--out", default=OUTPUT_MAPPING_FILE)
+    ap.add_argument("--k", type=int, default=TOP_K)
+    ap.add_argument("--per-tactic", type=int, default=PER_TACTIC)
+    ap.add_argument("--fallback", action="store_true",
+                    help="keep existing LLM rows in --out and only replace error/missing ones")
+    ap.add_argument("--agreement", metavar="MAPPING_JSON",
+                    help="report agreement with an existing mapping.json instead of writing a mapping")
+    args = ap.parse_args()
+
+    metrics = start_run("similarity_mapper")
+    t0 = time.perf_counter()
+    with metrics.phase("index"):
+        mapper = SimilarityMapper(pd.read_csv(args.defenses))
+        incidents = pd.read_csv(args.incidents).fillna("")
+    with metrics.phase("map"):
+        picks = mapper.map_texts(incident_text(incidents), args.k, args.per_tactic)
+    metrics.add_rows(len(incidents))
+    pred = dict(zip(incidents["incident_id"].astype(int), picks))
+    print(f"[OK] mapped {len(pred)} incidents against {len(mapper.ids)} defenses "
+          f"in {time.perf_counter() - t0:.2f}s")
+
+    if args.agreement:
+        with open(args.agreement, "r", encoding="utf-8") as f:
+            ref = {int(m["incident_id"]): split_ids(m["matched_defense_ids"]) for m in json.load(f)}
+        print(json.dumps(agreement(pred, ref, args.k), indent=2))
+        metrics.finish()
+        return
+
+    if args.fallback:
+        existing = pd.read_csv(args.out).fillna("")
+        ids = existing["matched_defense_ids"].map(split_ids)
+        bad = ids.map(lambda x: not x or any(i in ERROR_MARKERS for i in x))
+        existing.loc[bad, "matched_defense_ids"] = [
+            ", ".join(pred.get(int(i), [])) for i in existing.loc[bad, "incident_id"]]
+        missing = sorted(set(pred) - set(existing["incident_id"].astype(int)))
+        if missing:
+            existing = pd.concat([existing, to_mapping_df(missing, [pred[i] for i in missing])], ignore_index=True)
+        existing["incident_id"] = existing["incident_id"].astype(int)
+        existing.sort_values("incident_id").to_csv(args.out, index=False)
+        print(f"[OK] filled {int(bad.sum())} error rows and {len(missing)} missing incidents -> {args.out}")
+        metrics.count("filled_error_rows", int(bad.sum()))
+        metrics.finish()
+        return
+
+    to_mapping_df(pred.keys(), pred.values()).to_csv(args.out, index=False)
+    print(f"[OK] wrote {len(pred)} rows -> {args.out}")
+    metrics.finish()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+SQLite artifact for the export stage (tojson.py --sqlite): one file with
+
+    incidents          every merged_incident_data.csv column, incident_id as the rowid
+    defenses           defenses.json fields, defense_id primary key
+    incident_defense   (incident_id, defense_id, rank) split out of matched_defense_ids,
+                       indexed both ways for incident -> defenses and defense -> incidents
+    incidents_fts      FTS5 over title, report text and MITRE classification
+                       (external content: the text is stored once, in incidents)
+
+Id lookups, full-text search and reverse lookups are then indexed queries
+instead of parsing three JSON files. The build is one transaction of
+executemany() bulk inserts into a temporary file that replaces the target.
+"""
+
+import os
+import re
+import sqlite3
+import time
+from typing import List, Optional
+
+from defense_index import split_ids
+
+SCHEMA_VERSION = 1
+FTS_FIELDS = ['incident_title', 'full_report_text', 'mitre_classification']
+DEFENSE_FIELDS = ['defense_id', 'name', 'description', 'tactic', 'parent_id', 'level']
+TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def has_fts5() -> bool:
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE t USING fts5(x)')
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def build_sqlite(incident_df, defense_df, mapping_df, path: str) -> dict:
+    """Write the database to `path` (atomically) and return row counts and build time."""
+    start = time.perf_counter()
+    tmp = path + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    conn.execute('PRAGMA journal_mode=OFF')     # Scratch file until os.replace: no rollback journal needed
+    conn.execute('PRAGMA synchronous=OFF')
+    fts = has_fts5()
+
+    incident_cols = [c for c in incident_df.columns if c != 'incident_id']
+    defense_cols = [c for c in DEFENSE_FIELDS if c in defense_df.columns]
+    quote = lambda c: '"' + c.replace('"', '""') + '"'
+
+    with conn:
+        conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute(f"CREATE TABLE incidents (incident_id INTEGER PRIMARY KEY, "
+                     f"{', '.join(quote(c) + ' TEXT' for c in incident_cols)})")
+        conn.execute(f"CREATE TABLE defenses ({', '.join(quote(c) + ' TEXT' for c in defense_cols)}, "
+                     f"PRIMARY KEY (defense_id)) WITHOUT ROWID")
+        conn.execute('CREATE TABLE incident_defense (incident_id INTEGER, defense_id TEXT, rank INTEGER, '
+                     'PRIMARY KEY (incident_id, defense_id)) WITHOUT ROWID')
+
+        conn.executemany(
+            f"INSERT INTO incidents VALUES ({', '.join('?' * (len(incident_cols) + 1))})",
+            incident_df[['incident_id'] + incident_cols].astype({'incident_id': int}).itertuples(index=False, name=None))
+        conn.executemany(
+            f"INSERT OR REPLACE INTO defenses VALUES ({', '.join('?' * len(defense_cols))})",
+            defense_df[defense_cols].itertuples(index=False, name=None))
+
+        pairs = []
+        for iid, ids in zip(mapping_df['incident_id'], mapping_df['matched_defense_ids']):
+            for rank, did in enumerate(dict.fromkeys(split_ids(ids))):
+                pairs.append((int(iid), did, rank))
+        conn.executemany('INSERT OR IGNORE INTO incident_defense VALUES (?, ?, ?)', pairs)
+        # Built after the bulk insert: one sort instead of per-row index maintenance
+        conn.execute('CREATE INDEX incident_defense_by_defense ON incident_defense (defense_id, incident_id)')
+
+        if fts:
+            cols = [c for c in FTS_FIELDS if c in incident_cols]
+            conn.execute(f"CREATE VIRTUAL TABLE incidents_fts USING fts5({', '.join(cols)}, "
+                         f"content='incidents', content_rowid='incident_id', tokenize='unicode61')")
+            conn.execute("INSERT INTO incidents_fts(incidents_fts) VALUES ('rebuild')")
+
+        conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('schema_version', str(SCHEMA_VERSION)), ('fts5', str(int(fts))),
+            ('built_at', time.strftime('%Y-%m-%dT%H:%M:%S'))])
+    conn.execute('ANALYZE')
+    conn.close()
+    os.replace(tmp, path)
+
+    return {'incidents': len(incident_df), 'defenses': len(defense_df), 'pairs': len(pairs),
+            'fts5': fts, 'seconds': time.perf_counter() - start, 'bytes': os.path.getsize(path)}
+
+
+# --- Queries (used by the benchmark; the same SQL works from any client) ---
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def get_incident(conn, incident_id: int) -> Optional[dict]:
+    row = conn.execute('SELECT * FROM incidents WHERE incident_id = ?', (incident_id,)).fetchone()
+    if row is None:
+        return None
+    incident = dict(row)
+    incident['matched_defense_ids'] = [r[0] for r in conn.execute(
+        'SELECT defense_id FROM incident_defense WHERE incident_id = ? ORDER BY rank', (incident_id,))]
+    return incident
+
+
+def fts_query(text: str) -> str:
+    """User input -> FTS5 query: every word must match as a prefix (same rule as search_index.py)."""
+    return ' AND '.join(f'"{t}"*' for t in TOKEN_RE.findall(text.lower()))
+
+
+def search(conn, text: str, limit: int = 50) -> List[int]:
+    query = fts_query(text)
+    if not query:
+        return [r[0] for r in conn.execute('SELECT incident_id FROM incidents ORDER BY incident_id LIMIT ?', (limit,))]
+    try:
+        return [r[0] for r in conn.execute(
+            'SELECT rowid FROM incidents_fts WHERE incidents_fts MATCH ? ORDER BY rowid LIMIT ?', (query, limit))]
+    except sqlite3.OperationalError:  # Built without FTS5: substring scan over the same fields
+        words = TOKEN_RE.findall(text.lower())
+        where = ' AND '.join('(' + ' OR '.join(f"{c} LIKE ?" for c in FTS_FIELDS) + ')' for _ in words)
+        params = [f"%{w}%" for w in words for _ in FTS_FIELDS]
+        return [r[0] for r in conn.execute(
+            f"SELECT incident_id FROM incidents WHERE {where} ORDER BY incident_id LIMIT ?", (*params, limit))]
+
+
+def incidents_for_defense(conn, defense_id: str) -> List[int]:
+    return [r[0] for r in conn.execute(
+        'SELECT incident_id FROM incident_defense WHERE defense_id = ? ORDER BY incident_id', (defense_id,))]
@@ -0,0 +1,183 @@
+"""
+Synthetic AIID-scale inputs for benchmarks: an AIID-style snapshot
+(incidents.csv, reports.csv, classifications_MIT.csv) plus AIDEFEND-style tactic
+JS files, at any size.
+
+Report texts are drawn from a pool of random sentences over a Zipf-distributed
+vocabulary (so TF-IDF / BM25 / MinHash behave like on real text); a share of
+reports are syndicated near-copies of an earlier report of the same incident,
+and some reports are attached to two incidents, as in the real snapshot.
+
+Usage:
+  python synth_data.py --incidents 100000 --reports 1000000 --out ../synthetic
+  # -> ../synthetic/snapshot/*.csv and ../synthetic/tactics/*.js
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+
+import numpy as np
+
+INCIDENTS = 2000
+REPORTS = 10000
+WORDS_PER_REPORT = 300     # Mean; lengths are log-normal
+TECHNIQUES_PER_TACTIC = 20
+DUP_RATE = 0.1             # Reports that are near-copies of an earlier report of the same incident
+SHARED_RATE = 0.02         # Reports also listed under a second incident
+SENTENCE_POOL = 20000
+VOCAB_SIZE = 30000
+CHUNK = 50000              # Reports generated / written per batch
+
+DOMAIN_WORDS = ['facial', 'recognition', 'deepfake', 'privacy', 'leak', 'chatbot', 'autonomous', 'vehicle',
+                'bias', 'hallucination', 'misinformation', 'surveillance', 'fraud', 'injection', 'prompt',
+                'poisoning', 'model', 'data', 'police', 'arrest', 'crash', 'voice', 'clone', 'hiring']
+MIT_DOMAINS = {
+    'Discrimination & Toxicity': ['Unfair discrimination and misrepresentation', 'Exposure to toxic content'],
+    'Privacy & Security': ['Compromise of privacy', 'AI system security vulnerabilities and attacks'],
+    'Misinformation': ['False or misleading information', 'Pollution of information ecosystem'],
+    'Malicious Actors & Misuse': ['Fraud, scams, and targeted manipulation', 'Cyberattacks, weapon development or use'],
+    'Human-Computer Interaction': ['Overreliance and unsafe use', 'Loss of human agency and autonomy'],
+    'Socioeconomic & Environmental': ['Increased inequality and decline in employment quality'],
+    'AI system safety, failures, and limitations': ['Lack of capability or robustness',
+                                                    'AI pursuing its own goals in conflict with human goals'],
+}
+TACTICS = [('deceive', 'Deceive', 'DV'), ('detect', 'Detect', 'D'), ('evict', 'Evict', 'E'),
+           ('harden', 'Harden', 'H'), ('isolate', 'Isolate', 'I'), ('model', 'Model', 'M'),
+           ('restore', 'Restore', 'R')]
+ORGS = ['openai', 'google', 'meta', 'microsoft', 'amazon', 'tesla', 'clearview', 'unknown']
+
+
+class TextGen:
+    """Random sentences over a Zipf vocabulary; reports are sequences of pooled sentences."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        vocab = DOMAIN_WORDS + [f"w{i:x}" for i in range(VOCAB_SIZE)]
+        ranks = np.arange(1, len(vocab) + 1)
+        p = 1.0 / ranks
+        words = rng.choice(len(vocab), size=SENTENCE_POOL * 12, p=p / p.sum())
+        lengths = rng.integers(6, 19, size=SENTENCE_POOL)
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]) % (len(words) - 20)
+        self.sentences = [' '.join(vocab[w] for w in words[s:s + n]) + '.' for s, n in zip(starts, lengths)]
+
+    def text(self, n_words):
+        k = max(1, n_words // 12)
+        return ' '.join(self.sentences[i] for i in self.rng.integers(0, SENTENCE_POOL, size=k))
+
+    def near_copy(self, text):
+        """Syndicated copy: different byline, one sentence swapped."""
+        sentences = text.split('. ')
+        sentences[self.rng.integers(0, len(sentences))] = self.sentences[self.rng.integers(0, SENTENCE_POOL)]
+        return f"By staff writer {self.rng.integers(1000)}. " + '. '.join(sentences)
+
+
+def assign_reports(rng, n_incidents, n_reports):
+    """Report numbers per incident: every incident gets at least one; a few reports are shared."""
+    owner = np.concatenate([np.arange(n_incidents), rng.integers(0, n_incidents, size=max(n_reports - n_incidents, 0))])
+    owner = owner[:n_reports]
+    rng.shuffle(owner)
+    reports = [[] for _ in range(n_incidents)]
+    for number, incident in enumerate(owner, start=1):
+        reports[incident].append(number)
+    shared = rng.choice(n_reports, size=int(n_reports * SHARED_RATE), replace=False) + 1
+    for number in shared:
+        reports[rng.integers(0, n_incidents)].append(int(number))
+    return owner, reports
+
+
+def write_snapshot(out_dir, n_incidents, n_reports, words, dup_rate, rng):
+    os.makedirs(out_dir, exist_ok=True)
+    gen = TextGen(rng)
+    owner, reports = assign_reports(rng, n_incidents, n_reports)
+    days = np.datetime64('2015-01-01') + rng.integers(0, 3650, size=n_incidents)
+
+    with open(os.path.join(out_dir, 'incidents.csv'), 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['_id', 'incident_id', 'date', 'reports', 'Alleged deployer of AI system',
+                    'Alleged developer of AI system', 'Alleged harmed or nearly harmed parties',
+                    'description', 'title', 'editors'])
+        for i in range(n_incidents):
+            iid = i + 1
+            deployer = json.dumps(list(rng.choice(ORGS, size=rng.integers(1, 3), replace=False)))
+            w.writerow([f"inc{iid}", iid, str(days[i]), json.dumps(reports[i]), deployer,
+                        json.dumps([str(rng.choice(ORGS))]), '["people"]', gen.text(30),
+                        f"Incident {iid}: " + gen.sentences[rng.integers(0, SENTENCE_POOL)][:80], 'synthetic'])
+
+    # Reports are generated in chunks; the last text per incident is kept for near-copies
+    last_text = {}
+    lengths = np.maximum(20, rng.lognormal(np.log(words), 0.6, size=n_reports)).astype(int)
+    dup = rng.random(n_reports) < dup_rate
+    with open(os.path.join(out_dir, 'reports.csv'), 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['_id', 'report_number', 'title', 'text', 'url'])
+        for start in range(0, n_reports, CHUNK):
+            rows = []
+            for n in range(start, min(start + CHUNK, n_reports)):
+                incident = owner[n]
+                prev = last_text.get(incident)
+                text = gen.near_copy(prev) if dup[n] and prev else gen.text(lengths[n])
+                last_text[incident] = text
+                rows.append([f"rep{n + 1}", n + 1, text[:60], text, f"https://example.org/{n + 1}"])
+            w.writerows(rows)
+
+    domains = list(MIT_DOMAINS)
+    with open(os.path.join(out_dir, 'classifications_MIT.csv'), 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(['_id', 'Incident ID', 'Risk Domain', 'Risk Subdomain', 'Other'])
+        for i in range(n_incidents):
+            for d in rng.choice(len(domains), size=rng.integers(0, 3), replace=False):
+                subs = MIT_DOMAINS[domains[d]]
+                w.writerow([f"mit{i + 1}-{d}", i + 1, domains[d], subs[rng.integers(0, len(subs))], ''])
+
+
+def write_tactics(out_dir, per_tactic, rng):
+    """Tactic JS files in the layout defendlist.py parses (bare and quoted keys, template literals, comments)."""
+    os.makedirs(out_dir, exist_ok=True)
+    gen = TextGen(rng)
+    for file_name, tactic, prefix in TACTICS:
+        lines = [f"// {file_name}.js tactic definition (synthetic)", f"export const {file_name}Tactic = {{",
+                 f'    "name": "{tactic}",', f'    "purpose": "The \\"{tactic}\\" tactic.",', '    "techniques": [']
+        for t in range(1, per_tactic + 1):
+            tid = f"AID-{prefix}-{t:03d}"
+            lines += ['        {', f'            "id": "{tid}",',
+                      f'            name: "{gen.text(6)[:60].rstrip(".")}",',
+                      f'            "description": "{gen.text(60)}",',
+                      '            "implementationStrategies": [',
+                      '                { "strategy": "Example", "howTo": `<pre><code>def f(x):\n    return {"id": x}\n</code></pre>` },',
+                      '            ],', '            /* comment with { braces } */', '            "subTechniques": [']
+            for s in range(1, int(rng.integers(0, 4)) + 1):
+                lines += ['                {', f'                    "id": "{tid}.{s:03d}",',
+                          f'                    "name": "{gen.text(6)[:60].rstrip(".")}",',
+                          f'                    "description": "{gen.text(40)}",', '                },']
+            lines += ['            ],', '        },']
+        lines += ['    ]', '};', '']
+        with open(os.path.join(out_dir, f"{file_name}.js"), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate a synthetic AIID snapshot and AIDEFEND tactic files.")
+    ap.add_argument("--out", default="../synthetic", help="writes <out>/snapshot/ and <out>/tactics/")
+    ap.add_argument("--incidents", type=int, default=INCIDENTS)
+    ap.add_argument("--reports", type=int, default=REPORTS)
+    ap.add_argument("--words", type=int, default=WORDS_PER_REPORT, help="mean words per report")
+    ap.add_argument("--dup-rate", type=float, default=DUP_RATE, help="share of near-duplicate reports")
+    ap.add_argument("--techniques", type=int, default=TECHNIQUES_PER_TACTIC, help="techniques per tactic file")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    rng = np.random.default_rng(args.seed)
+    snapshot = os.path.join(args.out, 'snapshot')
+    write_snapshot(snapshot, args.incidents, max(args.reports, args.incidents), args.words, args.dup_rate, rng)
+    write_tactics(os.path.join(args.out, 'tactics'), args.techniques, rng)
+    size = sum(os.path.getsize(os.path.join(snapshot, n)) for n in os.listdir(snapshot))
+    print(f"[OK] {args.incidents:,} incidents, {max(args.reports, args.incidents):,} reports "
+          f"({size / 1e6:,.1f} MB), {len(TACTICS)} tactic files -> {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,21 @@
-import pandas as pd
+import argparse
+import gzip
 import json
 import os
+import time
+
+import pandas as pd
+
+from defense_index import build_defense_index
+from instrumentation import start_run
+from mapping_matrix import MATRIX_FILE, build_matrix, save_matrix
+from search_index import build_search_index, index_stats
+from sqlite_export import build_sqlite
+
+try:
+    import brotli  # Optional: only needed for .br siblings
+except ImportError:
+    brotli = None
 
 # --- Original CSV file names ---
 INCIDENTS_CSV = 'merged_incident_data.csv'
@@ -12,56 +27,232 @@ INCIDENTS_JSON = 'incidents.json'
 DEFENSES_JSON = 'defenses.json'
 MAPPING_JSON = 'mapping.json'
 
-print("--- Starting final CSV → JSON conversion (with column renaming) ---")
+# --- Sharded export (--sharded) ---
+INCIDENT_INDEX_JSON = 'incidents_index.json'   # Small list for the incident list / search
+INCIDENT_SHARD_DIR = 'incidents'               # incidents/<id>.json, fetched on demand
+INDEX_FIELDS = ['incident_id', 'incident_title', 'incident_date', 'mitre_classification']
+SEARCH_INDEX_JSON = 'search_index.json'        # Inverted index used by Web/search.js
+DEFENSE_INDEX_JSON = 'defense_index.json'      # Defense -> incidents reverse index + tactic counts
+SQLITE_DB = 'aiid.db'                          # --sqlite: all three tables + FTS5 in one file
+COMPACT = (',', ':')
+GZIP_LEVEL = 6                                 # Level 9 took 2.3x the CPU here for 0.5% smaller output
+BROTLI_QUALITY = 11
+
+def dump_json(records, json_file, compact=False):
+    """Serialize records and return the bytes written."""
+    if compact:
+        data = json.dumps(records, ensure_ascii=False, separators=COMPACT)
+    else:
+        data = json.dumps(records, ensure_ascii=False, indent=4)
+    raw = data.encode('utf-8')
+    with open(json_file, 'wb') as f:
+        f.write(raw)
+    return raw
 
-def safe_convert_to_json(df, json_file):
+def write_compressed(path, raw):
+    """Pre-built .gz (and .br when brotli is installed) siblings; returns their sizes and compression time."""
+    sizes = {'raw': len(raw)}
+    start = time.perf_counter()
+    gz = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    sizes['gzip_s'] = time.perf_counter() - start
+    with open(path + '.gz', 'wb') as f:
+        f.write(gz)
+    sizes['gzip'] = len(gz)
+    if brotli is not None:
+        start = time.perf_counter()
+        br = brotli.compress(raw, quality=BROTLI_QUALITY)
+        sizes['brotli_s'] = time.perf_counter() - start
+        with open(path + '.br', 'wb') as f:
+            f.write(br)
+        sizes['brotli'] = len(br)
+    return sizes
+
+def safe_convert_to_json(df, json_file, compact=False, compress=False):
     """
     Safely convert a DataFrame into a JSON file using Python's json module.
     """
     try:
         # Convert DataFrame into a list of Python dictionaries
         records = df.to_dict(orient='records')
-        
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(records, f, ensure_ascii=False, indent=4)
+        raw = dump_json(records, json_file, compact)
+        sizes = write_compressed(json_file, raw) if compress else {'raw': len(raw)}
 
         print(f"✅ Successfully converted and saved: {json_file}")
+        return sizes
     except Exception as e:
         print(f"❌ Critical error while converting {json_file}: {e}")
 
-# --- 1. Process incidents data (incidents.json) ---
-try:
-    incident_df = pd.read_csv(INCIDENTS_CSV).fillna('')
-    safe_convert_to_json(incident_df, INCIDENTS_JSON)
-except FileNotFoundError:
-    print(f"❌ Error: Cannot find {INCIDENTS_CSV}")
+def write_incident_shards(incident_df, out_dir):
+    """Summary index plus one detail file per incident; returns size stats for the report."""
+    index_path = os.path.join(out_dir, INCIDENT_INDEX_JSON)
+    report = {INCIDENT_INDEX_JSON: safe_convert_to_json(
+        incident_df[[c for c in INDEX_FIELDS if c in incident_df.columns]], index_path, True, True)}
 
-# --- 2. Process defense list (defenses.json) ---
-# This is the key fix!
-try:
-    defense_df = pd.read_csv(DEFENSES_CSV)
-    
-    # Important fix: rename columns to match what app.js expects
-    defense_df.rename(columns={
-        'Technique ID': 'defense_id',
-        'Technique Name': 'name',
-        'Description': 'description',
-        'Tactic': 'tactic'
-    }, inplace=True)
-    
-    # Keep only the fields required by the website and fill missing values
-    defense_df_clean = defense_df[['defense_id', 'name', 'description', 'tactic']].fillna('')
-    
-    safe_convert_to_json(defense_df_clean, DEFENSES_JSON)
-except FileNotFoundError:
-    print(f"❌ Error: Cannot find {DEFENSES_CSV}")
-
-# --- 3. Process mapping results (mapping.json) ---
-try:
-    mapping_df = pd.read_csv(MAPPING_CSV).fillna('')
-    safe_convert_to_json(mapping_df, MAPPING_JSON)
-except FileNotFoundError:
-    print(f"❌ Error: Cannot find {MAPPING_CSV}")
+    shard_dir = os.path.join(out_dir, INCIDENT_SHARD_DIR)
+    os.makedirs(shard_dir, exist_ok=True)
+    totals = {'files': 0, 'raw': 0, 'gzip': 0, 'brotli': 0, 'max_raw': 0}
+    for record in incident_df.to_dict(orient='records'):
+        path = os.path.join(shard_dir, f"{record['incident_id']}.json")
+        sizes = write_compressed(path, dump_json(record, path, compact=True))
+        totals['files'] += 1
+        totals['max_raw'] = max(totals['max_raw'], sizes['raw'])
+        for k in ('raw', 'gzip', 'brotli'):
+            totals[k] += sizes.get(k, 0)
+        for k in ('gzip_s', 'brotli_s'):
+            if k in sizes:
+                totals[k] = totals.get(k, 0.0) + sizes[k]
+    report[f"{INCIDENT_SHARD_DIR}/*.json"] = totals
+    print(f"✅ Wrote {totals['files']} incident detail shards to {shard_dir}/")
+    return report
+
+def write_search_index(incident_df, out_dir):
+    """Tokenized inverted index (term -> incident postings) as a compact, precompressed artifact."""
+    index = build_search_index(incident_df.to_dict(orient='records'))
+    path = os.path.join(out_dir, SEARCH_INDEX_JSON)
+    sizes = write_compressed(path, dump_json(index, path, compact=True))
+    stats = index_stats(index)
+    print(f"✅ Search index: {stats['documents']} incidents, {stats['terms']:,} terms, "
+          f"{stats['postings']:,} postings -> {path}")
+    return sizes
+
+def write_defense_index(mapping_df, defense_df, out_dir, compact=False):
+    """Precomputed defense -> incidents lookups (with parent rollup) and per-tactic counts."""
+    index = build_defense_index(mapping_df.to_dict(orient='records'), defense_df.to_dict(orient='records'))
+    path = os.path.join(out_dir, DEFENSE_INDEX_JSON)
+    raw = dump_json(index, path, compact)
+    sizes = write_compressed(path, raw) if compact else {'raw': len(raw)}
+    mapped = sum(1 for d in index['defenses'].values() if d['incident_count'])
+    print(f"✅ Defense index: {mapped}/{len(index['defenses'])} defenses mapped, "
+          f"{len(index['tactics'])} tactics -> {path}")
+    if index['unknown_ids']:
+        print(f"⚠️  {len(index['unknown_ids'])} mapped IDs not in the catalog: {', '.join(index['unknown_ids'][:10])}")
+    return sizes
+
+def print_size_report(report):
+    def kb(n):
+        return f"{n / 1024:,.1f} KB" if n else "-"
+    def ms(sizes, key):
+        return f"{sizes[key] * 1000:,.1f} ms" if key in sizes else "-"
+    print("\n--- Artifact size report ---")
+    print(f"{'artifact':<28}{'raw':>14}{'gzip':>14}{'brotli':>14}{f'gzip -{GZIP_LEVEL} time':>16}{'brotli time':>14}")
+    total = {'gzip_s': 0.0, 'brotli_s': 0.0}
+    for name, sizes in report.items():
+        if sizes:
+            print(f"{name:<28}{kb(sizes['raw']):>14}{kb(sizes.get('gzip', 0)):>14}{kb(sizes.get('brotli', 0)):>14}"
+                  f"{ms(sizes, 'gzip_s'):>16}{ms(sizes, 'brotli_s'):>14}")
+            for k in total:
+                total[k] += sizes.get(k, 0.0)
+        if sizes and 'files' in sizes:
+            print(f"{'':<28}{sizes['files']} files, largest {kb(sizes['max_raw'])}, "
+                  f"mean {kb(sizes['raw'] / max(sizes['files'], 1))}")
+    if any(total.values()):
+        print(f"Compression time: gzip {total['gzip_s']:.2f}s"
+              + (f", brotli {total['brotli_s']:.2f}s" if brotli is not None else ""))
+    if brotli is None:
+        print("(brotli not installed: .br siblings skipped — pip install brotli)")
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Convert the pipeline CSVs into JSON for the web frontend.")
+    ap.add_argument("--out-dir", default=".", help="directory for the JSON artifacts")
+    ap.add_argument("--sharded", action="store_true",
+                    help="compact summary index + per-incident detail shards, with .gz/.br siblings")
+    ap.add_argument("--search-index", action="store_true",
+                    help=f"also write {SEARCH_INDEX_JSON} (always on with --sharded)")
+    ap.add_argument("--sqlite", action="store_true",
+                    help=f"also write {SQLITE_DB} (incidents, defenses, incident_defense, FTS5 search)")
+    ap.add_argument("--matrix", action="store_true",
+                    help=f"also write {MATRIX_FILE} (memory-mappable incident x defense matrix)")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    metrics = start_run('tojson')
+    os.makedirs(args.out_dir, exist_ok=True)
+    out = lambda name: os.path.join(args.out_dir, name)
+    report = {}
+    incident_df = defense_df_clean = mapping_df = None
+
+    print("--- Starting final CSV → JSON conversion (with column renaming) ---")
+
+    # --- 1. Process incidents data (incidents.json or index + shards) ---
+    with metrics.phase('incidents'):
+        try:
+            incident_df = pd.read_csv(INCIDENTS_CSV).fillna('')
+            if args.sharded:
+                report.update(write_incident_shards(incident_df, args.out_dir))
+            else:
+                report[INCIDENTS_JSON] = safe_convert_to_json(incident_df, out(INCIDENTS_JSON))
+            if args.sharded or args.search_index:
+                report[SEARCH_INDEX_JSON] = write_search_index(incident_df, args.out_dir)
+        except FileNotFoundError:
+            print(f"❌ Error: Cannot find {INCIDENTS_CSV}")
+
+    # --- 2. Process defense list (defenses.json) ---
+    # This is the key fix!
+    with metrics.phase('defenses'):
+        try:
+            defense_df = pd.read_csv(DEFENSES_CSV)
+
+            # Important fix: rename columns to match what app.js expects
+            defense_df.rename(columns={
+                'Technique ID': 'defense_id',
+                'Technique Name': 'name',
+                'Description': 'description',
+                'Tactic': 'tactic',
+                'Parent Technique ID': 'parent_id',
+                'Level': 'level'
+            }, inplace=True)
+
+            # Keep only the fields required by the website and fill missing values
+            columns = [c for c in ['defense_id', 'name', 'description', 'tactic', 'parent_id', 'level']
+                       if c in defense_df.columns]
+            defense_df_clean = defense_df[columns].fillna('')
+
+            report[DEFENSES_JSON] = safe_convert_to_json(defense_df_clean, out(DEFENSES_JSON), args.sharded, args.sharded)
+        except FileNotFoundError:
+            print(f"❌ Error: Cannot find {DEFENSES_CSV}")
+
+    # --- 3. Process mapping results (mapping.json) ---
+    with metrics.phase('mapping'):
+        try:
+            mapping_df = pd.read_csv(MAPPING_CSV).fillna('')
+            report[MAPPING_JSON] = safe_convert_to_json(mapping_df, out(MAPPING_JSON), args.sharded, args.sharded)
+        except FileNotFoundError:
+            print(f"❌ Error: Cannot find {MAPPING_CSV}")
+
+    # --- 4. Defense -> incidents reverse index (defense_index.json) ---
+    if defense_df_clean is not None and mapping_df is not None:
+        with metrics.phase('defense_index'):
+            report[DEFENSE_INDEX_JSON] = write_defense_index(mapping_df, defense_df_clean, args.out_dir, args.sharded)
+
+    # --- 5. Optional SQLite database (aiid.db) ---
+    if args.sqlite and incident_df is not None and defense_df_clean is not None and mapping_df is not None:
+        with metrics.phase('sqlite'):
+            stats = build_sqlite(incident_df, defense_df_clean, mapping_df, out(SQLITE_DB))
+        report[SQLITE_DB] = {'raw': stats['bytes']}
+        fts = "FTS5" if stats['fts5'] else "no FTS5 (sqlite3 built without it)"
+        print(f"✅ SQLite: {stats['incidents']} incidents, {stats['defenses']} defenses, "
+              f"{stats['pairs']} incident/defense pairs, {fts} in {stats['seconds']:.2f}s -> {out(SQLITE_DB)}")
+
+    # --- 6. Optional incident x defense matrix (mapping_matrix.npz) ---
+    if args.matrix and mapping_df is not None:
+        with metrics.phase('matrix'):
+            catalog = defense_df_clean['defense_id'].tolist() if defense_df_clean is not None else []
+            arrays = build_matrix(mapping_df.to_dict(orient='records'), catalog)
+            report[MATRIX_FILE] = {'raw': save_matrix(arrays, out(MATRIX_FILE))}
+        print(f"✅ Matrix: {len(arrays['incident_ids'])} incidents x {len(arrays['defense_ids'])} defenses, "
+              f"{len(arrays['indices'])} pairs -> {out(MATRIX_FILE)}")
+    elif mapping_df is not None and os.path.exists(out(MATRIX_FILE)):
+        os.remove(out(MATRIX_FILE))   # A matrix from an earlier --matrix run would shadow the new mapping.json
+        print(f"⚠️  Removed stale {out(MATRIX_FILE)} (rerun with --matrix to rebuild it)")
+
+    if args.sharded or args.search_index or args.sqlite or args.matrix:
+        print_size_report(report)
+
+    print("\n--- Conversion complete ---")
+    print("All JSON files have been regenerated. Please force-refresh your http://localhost:8000 page.")
+    metrics.add_rows(len(incident_df) if incident_df is not None else 0)
+    metrics.finish(success=incident_df is not None and defense_df_clean is not None and mapping_df is not None)
 
-print("\n--- Conversion complete ---")
-print("All JSON files have been regenerated. Please force-refresh your http://localhost:8000 page.")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+Multi-worker mapping through a lease-based work queue in SQLite.
+
+One generate_mapping.py process is limited to one API key / project and one
+machine. Here the incidents are enqueued once in QUEUE_DB (with the catalog and
+model, so every worker maps against the same prompt), and any number of worker
+processes - each with its own --api-key if needed - claim batches:
+
+  - a claim leases up to --batch pending tasks for --lease seconds
+    (one BEGIN IMMEDIATE transaction, so two workers never get the same task)
+  - a heartbeat extends the leases of a worker's tasks while it is mapping
+  - tasks whose lease expired (crashed or stuck worker) are claimed again;
+    `release` does this explicitly
+  - a result is only accepted from the current lease owner; error rows
+    (LLM_ERROR / JSON_PARSE_ERROR) go back to pending until MAX_ATTEMPTS
+  - `merge` writes llm_defense_mapping.csv from the results table in incident
+    order, so the output does not depend on which worker mapped what
+
+Usage:
+  python work_queue.py enqueue [--limit N] [--reset]
+  python work_queue.py worker --api-key KEY_A &          # on any machine that sees the DB file
+  python work_queue.py worker --api-key KEY_B &
+  python work_queue.py status
+  python work_queue.py merge
+  python work_queue.py run --workers 4 --fake            # local workers + merge (testing)
+
+SQLite locking needs a local filesystem; for several machines put the DB on a
+host they all reach through a filesystem with working POSIX locks.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from typing import List
+
+import pandas as pd
+
+from context_cache import CACHE_TTL, PrefixCache
+from fake_gemini import FakeGeminiClient
+from generate_mapping import (DEFENSES_FILE, INCIDENTS_FILE, MODEL_NAME,
+                              OUTPUT_MAPPING_FILE, call_llm_for_matching, generate_prompt_prefix,
+                              load_defense_catalog, save_mapping)
+from instrumentation import start_run
+from llm_clients import GeminiClient
+from llm_engine import MappingEngine
+from result_cache import PROMPT_FIELDS, is_error
+
+QUEUE_DB = 'mapping_queue.db'
+LEASE_SECONDS = 120       # A crashed worker's tasks are reclaimed after this long
+BATCH_SIZE = 20           # Tasks per claim
+MAX_ATTEMPTS = 3          # Claims per task before an error row is accepted as final
+POLL_SECONDS = 2.0        # Idle wait while other workers still hold leases
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    incident_id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,                 -- prompt fields as JSON
+    status TEXT NOT NULL DEFAULT 'pending', -- pending | leased | done
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (status, incident_id);
+CREATE TABLE IF NOT EXISTS results (
+    incident_id INTEGER PRIMARY KEY,
+    matched_defense_ids TEXT NOT NULL,     -- JSON list
+    worker TEXT,
+    finished_at REAL
+);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)   # Explicit BEGIN below
+    conn.execute('PRAGMA journal_mode=WAL')     # Readers (status, heartbeats) do not block the claimer
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class WorkQueue:
+    """The task/lease/result tables of one queue file."""
+
+    def __init__(self, path: str = QUEUE_DB):
+        self.path = path
+        self.conn = connect(path)
+
+    def meta(self) -> dict:
+        return dict(self.conn.execute('SELECT key, value FROM meta'))
+
+    def enqueue(self, incidents: List[dict], defense_list: str, model: str, reset: bool = False) -> int:
+        """Add incidents not queued yet; the catalog and model are fixed for the life of the queue."""
+        meta = self.meta()
+        if meta and not reset and (meta.get('defense_list') != defense_list or meta.get('model') != model):
+            raise ValueError("queue was created for a different catalog or model; use --reset")
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            if reset:
+                for table in ('tasks', 'results', 'meta'):
+                    self.conn.execute(f'DELETE FROM {table}')
+            self.conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                                  [('defense_list', defense_list), ('model', model)])
+            before = self.conn.total_changes
+            self.conn.executemany('INSERT OR IGNORE INTO tasks (incident_id, payload) VALUES (?, ?)', [
+                (int(i['incident_id']), json.dumps({f: i.get(f, '') for f in PROMPT_FIELDS}, default=str))
+                for i in incidents])
+            added = self.conn.total_changes - before
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return added
+
+    def claim(self, owner: str, n: int, lease: float) -> List[dict]:
+        """Lease up to n pending (or expired) tasks in incident order."""
+        now = time.time()
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = self.conn.execute(
+                "SELECT incident_id, payload FROM tasks WHERE status = 'pending' "
+                "OR (status = 'leased' AND lease_expires < ?) ORDER BY incident_id LIMIT ?", (now, n)).fetchall()
+            self.conn.executemany(
+                "UPDATE tasks SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE incident_id = ?", [(owner, now + lease, r[0]) for r in rows])
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return [dict(json.loads(payload), incident_id=iid) for iid, payload in rows]
+
+    def heartbeat(self, owner: str, lease: float) -> int:
+        """Extend every lease this worker still holds."""
+        return self.conn.execute(
+            "UPDATE tasks SET lease_expires = ? WHERE status = 'leased' AND lease_owner = ?",
+            (time.time() + lease, owner)).rowcount
+
+    def complete(self, owner: str, incident_id: int, ids: List[str]) -> bool:
+        """Store a result if `owner` still holds the lease; error rows are re-queued until MAX_ATTEMPTS."""
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.conn.execute("SELECT attempts FROM tasks WHERE incident_id = ? AND status = 'leased' "
+                                    "AND lease_owner = ?", (incident_id, owner)).fetchone()
+            if row is None:   # Lease expired and another worker took the task over
+                self.conn.execute('ROLLBACK')
+                return False
+            if is_error(ids) and row[0] < MAX_ATTEMPTS:
+                self.conn.execute("UPDATE tasks SET status = 'pending', lease_owner = NULL, lease_expires = NULL "
+                                  "WHERE incident_id = ?", (incident_id,))
+            else:
+                self.conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                  (incident_id, json.dumps(ids), owner, time.time()))
+                self.conn.execute("UPDATE tasks SET status = 'done', lease_owner = NULL, lease_expires = NULL "
+                                  "WHERE incident_id = ?", (incident_id,))
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return True
+
+    def release_expired(self) -> int:
+        return self.conn.execute(
+            "UPDATE tasks SET status = 'pending', lease_owner = NULL, lease_expires = NULL "
+            "WHERE status = 'leased' AND lease_expires < ?", (time.time(),)).rowcount
+
+    def counts(self) -> dict:
+        now = time.time()
+        counts = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0}
+        for status, expired, n in self.conn.execute(
+                "SELECT status, status = 'leased' AND lease_expires < ?, COUNT(*) FROM tasks GROUP BY 1, 2", (now,)):
+            counts['expired' if expired else status] += n
+        counts['errors'] = sum(is_error(json.loads(ids)) for (ids,) in
+                               self.conn.execute('SELECT matched_defense_ids FROM results'))
+        counts['workers'] = self.conn.execute("SELECT COUNT(DISTINCT lease_owner) FROM tasks "
+                                              "WHERE status = 'leased' AND lease_expires >= ?", (now,)).fetchone()[0]
+        return counts
+
+    def results(self) -> List[dict]:
+        return [{'incident_id': iid, 'matched_defense_ids': json.loads(ids)} for iid, ids in self.conn.execute(
+            'SELECT incident_id, matched_defense_ids FROM results ORDER BY incident_id')]
+
+
+# --- Worker ---
+
+def make_client(args):
+    if args.fake:
+        return FakeGeminiClient(latency=args.fake_latency, jitter=args.fake_latency / 4,
+                                error_rate=args.fake_error_rate)
+    return GeminiClient(api_key=args.api_key, base_url=args.base_url)
+
+
+async def run_worker(queue: WorkQueue, args, metrics) -> int:
+    """Claim, map and complete batches until no task is pending or leased; returns tasks completed."""
+    meta = queue.meta()
+    if not meta:
+        sys.exit(f"❌ Queue {queue.path} is empty; run `python work_queue.py enqueue` first")
+    client = make_client(args)
+    engine = MappingEngine(client, meta['model'], concurrency=args.concurrency, requests_per_minute=args.rpm,
+                           max_retries=args.max_retries, metrics=metrics)
+    prefix_cache = None if args.no_context_cache else PrefixCache(
+        client, meta['model'], generate_prompt_prefix(meta['defense_list']), args.cache_ttl,
+        state_path=None)   # Each worker process owns its own provider cache
+    owner = args.worker_id
+    done = lost = 0
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(args.lease / 3)
+            queue.heartbeat(owner, args.lease)
+
+    while True:
+        batch = queue.claim(owner, args.batch, args.lease)
+        if not batch:
+            counts = queue.counts()
+            if counts['pending'] == counts['leased'] == counts['expired'] == 0:
+                break
+            await asyncio.sleep(POLL_SECONDS)   # Others still hold leases; take them over if they expire
+            continue
+
+        def record(slot, match):
+            nonlocal done, lost
+            if queue.complete(owner, int(batch[slot]['incident_id']), match['matched_defense_ids']):
+                done += 1
+            else:
+                lost += 1
+
+        beat = asyncio.ensure_future(heartbeat())
+        try:
+            with metrics.phase('llm'):
+                await engine.map(batch, lambda incident: call_llm_for_matching(
+                    engine, incident, meta['defense_list'], prefix_cache), on_result=record)
+        finally:
+            beat.cancel()
+        print(f"-> [{owner}] {done} tasks completed ({queue.counts()['pending']} pending)")
+
+    metrics.count('tasks_completed', done)
+    metrics.count('results_discarded_lost_lease', lost)
+    if prefix_cache is not None:
+        print(f"🧊 [{owner}] {prefix_cache.summary()}")
+    return done
+
+
+# --- CLI ---
+
+def cmd_enqueue(args):
+    defense_df = load_defense_catalog(args.defenses)
+    incidents = pd.read_csv(args.incidents).fillna('')
+    if args.limit:
+        incidents = incidents.head(args.limit)
+    queue = WorkQueue(args.db)
+    try:
+        added = queue.enqueue(incidents.to_dict(orient='records'),
+                              "\n".join(defense_df['LLM_Entry'].tolist()), args.model, args.reset)
+    except ValueError as e:
+        sys.exit(f"❌ {e}")
+    print(f"✅ Enqueued {added} new incidents in {args.db} ({queue.counts()})")
+
+
+def cmd_worker(args):
+    metrics = start_run(f"mapping_worker-{args.worker_id}")
+    queue = WorkQueue(args.db)
+    done = asyncio.run(run_worker(queue, args, metrics))
+    metrics.add_rows(done)
+    print(f"✅ [{args.worker_id}] finished: {done} tasks")
+    metrics.finish()
+
+
+def cmd_status(args):
+    print(json.dumps(WorkQueue(args.db).counts(), indent=2))
+
+
+def cmd_release(args):
+    print(f"🔁 Released {WorkQueue(args.db).release_expired()} expired leases")
+
+
+def cmd_merge(args):
+    queue = WorkQueue(args.db)
+    counts = queue.counts()
+    unfinished = counts['pending'] + counts['leased'] + counts['expired']
+    if unfinished and not args.partial:
+        sys.exit(f"❌ {unfinished} tasks are not done yet ({counts}); wait for the workers or pass --partial")
+    results = queue.results()
+    save_mapping(results, args.out, {r['incident_id'] for r in results} if args.update else None)
+    print(f"✅ Merged {len(results)} results ({counts['errors']} error rows) -> {args.out}")
+
+
+def cmd_run(args):
+    """Local test harness: N worker processes on this machine, then merge."""
+    options = ['--batch', args.batch, '--lease', args.lease, '--concurrency', args.concurrency, '--rpm', args.rpm,
+               '--max-retries', args.max_retries, '--fake-latency', args.fake_latency,
+               '--fake-error-rate', args.fake_error_rate, '--cache-ttl', args.cache_ttl]
+    for flag, value in (('--api-key', args.api_key), ('--base-url', args.base_url)):
+        if value:
+            options += [flag, value]
+    options += [flag for flag, on in (('--fake', args.fake), ('--no-context-cache', args.no_context_cache)) if on]
+    start = time.perf_counter()
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--db', args.db, 'worker',
+                               '--worker-id', f"w{i}"] + [str(o) for o in options]) for i in range(args.workers)]
+    codes = [p.wait() for p in procs]
+    if any(codes):
+        sys.exit(f"❌ Worker exit codes: {codes}")
+    print(f"⏱️  {args.workers} workers finished in {time.perf_counter() - start:.1f}s")
+    cmd_merge(args)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=QUEUE_DB)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("enqueue", help="queue incidents (only ones not queued yet)")
+    p.add_argument("--incidents", default=INCIDENTS_FILE)
+    p.add_argument("--defenses", default=DEFENSES_FILE)
+    p.add_argument("--model", default=MODEL_NAME)
+    p.add_argument("--limit", type=int, default=None)
+    p.add_argument("--reset", action="store_true", help="drop all tasks and results first")
+    p.set_defaults(fn=cmd_enqueue)
+
+    for name, fn in (("worker", cmd_worker), ("run", cmd_run)):
+        p = sub.add_parser(name, help="claim and map batches until the queue is drained" if name == "worker"
+                           else "start --workers local worker processes, then merge")
+        if name == "worker":
+            p.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+        else:
+            p.add_argument("--workers", type=int, default=4)
+            p.add_argument("--out", default=OUTPUT_MAPPING_FILE)
+            p.add_argument("--partial", action="store_true")
+            p.add_argument("--update", action="store_true")
+        p.add_argument("--batch", type=int, default=BATCH_SIZE, help="tasks per claim")
+        p.add_argument("--lease", type=float, default=LEASE_SECONDS, help="lease length in seconds")
+        p.add_argument("--concurrency", type=int, default=8)
+        p.add_argument("--rpm", type=float, default=60, help="requests per minute for this worker (0 = unlimited)")
+        p.add_argument("--max-retries", type=int, default=5)
+        p.add_argument("--api-key", default=None, help="defaults to GEMINI_API_KEY; give each worker its own")
+        p.add_argument("--base-url", default=None)
+        p.add_argument("--fake", action="store_true", help="in-process FakeGeminiClient")
+        p.add_argument("--fake-latency", type=float, default=0.5)
+        p.add_argument("--fake-error-rate", type=float, default=0.0)
+        p.add_argument("--no-context-cache", action="store_true")
+        p.add_argument("--cache-ttl", type=float, default=CACHE_TTL)
+        p.set_defaults(fn=fn)
+
+    sub.add_parser("status", help="task counts").set_defaults(fn=cmd_status)
+    sub.add_parser("release", help="return expired leases to pending").set_defaults(fn=cmd_release)
+    p = sub.add_parser("merge", help=f"write {OUTPUT_MAPPING_FILE} from the results, in incident order")
+    p.add_argument("--out", default=OUTPUT_MAPPING_FILE)
+    p.add_argument("--partial", action="store_true", help="merge even if tasks are still pending")
+    p.add_argument("--update", action="store_true", help="keep rows of --out for incidents not in the queue")
+    p.set_defaults(fn=cmd_merge)
+
+    args = ap.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
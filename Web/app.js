@@ -3,18 +3,39 @@
 let allIncidents = [];
 let allDefenses = {}; 
 let incidentMapping = {}; 
+// true when tojson.py --sharded output is present: details are fetched per incident
+let shardedMode = false;
+const incidentDetails = new Map();
+let detailRequest = 0;
+// Inverted index (search.js): queried in search_worker.js, or on this thread without Worker support
+let searchIndex = null;
+let searchWorker = null;
+let searchSeq = 0;
+let searchTimer = null;
+const SEARCH_DEBOUNCE_MS = 150;
+const incidentById = new Map();
+// Windowed incident list (virtual_list.js): only the visible rows are in the DOM
+const ROW_HEIGHT = 40;
+let incidentList = null;
+let selectedId = null;
+// defense_index.json (tojson.py): defense -> incidents with parent rollup, per-tactic counts
+let defenseIndex = null;
 
 
 async function loadData() {
   try {
 
-    const [incidentsRes, defensesRes, mappingRes] = await Promise.all([
-      fetch("incidents.json"),
+    const [indexRes, defensesRes, mappingRes] = await Promise.all([
+      fetch("incidents_index.json"),
       fetch("defenses.json"),
       fetch("mapping.json"),
     ]);
 
-    const incidentsRaw = await incidentsRes.json();
+    // Prefer the small summary index; fall back to the monolithic incidents.json
+    shardedMode = indexRes.ok;
+    const incidentsRaw = shardedMode
+      ? await indexRes.json()
+      : await (await fetch("incidents.json")).json();
     const defensesArray = await defensesRes.json();
     const mappingArray = await mappingRes.json();
 
@@ -58,8 +79,14 @@ async function loadData() {
 
 
     allIncidents.sort((a, b) => a.incident_id - b.incident_id);
+    allIncidents.forEach((incident) => incidentById.set(incident.incident_id, incident));
 
     renderIncidentList(allIncidents);
+    if (allIncidents.length > 0) selectIncident(allIncidents[0]);
+    startSearchWorker();
+
+    const defenseIndexRes = await fetch("defense_index.json");
+    if (defenseIndexRes.ok) defenseIndex = await defenseIndexRes.json();
   } catch (error) {
     console.error("loading error:", error);
     document.getElementById("incident-list-container").innerHTML =
@@ -69,57 +96,126 @@ async function loadData() {
 
 
 function renderIncidentList(incidentsToRender) {
-  const listContainer = document.getElementById("incident-list");
-  listContainer.innerHTML = ""; 
+  if (!incidentList) {
+    incidentList = new VirtualList(
+      document.getElementById("incident-list-container"),
+      document.getElementById("incident-list"),
+      { rowHeight: ROW_HEIGHT, renderRow: renderIncidentRow, emptyText: "沒有找到符合條件的事故。" }
+    );
+  }
+  incidentList.setItems(incidentsToRender);
+}
+
+
+// Fills a recycled row element; called only for rows scrolled into view
+function renderIncidentRow(incident, item) {
+  item.className =
+    incident.incident_id === selectedId ? "incident-item active" : "incident-item";
+  item.textContent = "";
+  const label = document.createElement("strong");
+  label.textContent = `ID ${incident.incident_id}:`;
+  item.appendChild(label);
+  item.appendChild(document.createTextNode(` ${incident.incident_title}`));
+  item.onclick = () => selectIncident(incident);
+}
+
+
+function selectIncident(incident) {
+  selectedId = incident.incident_id;
+  incidentList.refresh();
+  showIncidentDetail(incident);
+}
 
-  if (incidentsToRender.length === 0) {
-    listContainer.innerHTML = "<p>沒有找到符合條件的事故。</p>";
+
+// Queries run in a Web Worker that loads the index itself; without Worker
+// support (or if it fails) the same SearchIndex runs on this thread
+function startSearchWorker() {
+  if (typeof Worker === "undefined") return;
+  try {
+    searchWorker = new Worker("search_worker.js");
+  } catch (error) {
+    console.warn("search worker unavailable:", error);
     return;
   }
-
-  incidentsToRender.forEach((incident) => {
-    const item = document.createElement("div");
-    item.className = "incident-item";
- 
-    item.innerHTML = `<strong>ID ${incident.incident_id}:</strong> ${incident.incident_title}`;
-    item.onclick = () => showIncidentDetail(incident);
-    listContainer.appendChild(item);
+  searchWorker.onmessage = (event) => {
+    const msg = event.data;
+    if (msg.type === "error") {
+      console.warn("search worker failed:", msg.message);
+      searchWorker.terminate();
+      searchWorker = null;
+      // Answer the query that may have been waiting on the worker
+      runSearch(document.getElementById("search-input").value.toLowerCase());
+    } else if (msg.type === "result" && msg.seq === searchSeq) {
+      // Older queries still in flight are dropped
+      showSearchResults(msg.ids);
+    }
+  };
+  searchWorker.postMessage({
+    type: "init",
+    indexUrl: shardedMode ? "search_index.json" : null,
+    incidentsUrl: shardedMode ? "incidents_index.json" : "incidents.json",
   });
+}
 
 
-  if (
-    incidentsToRender.length > 0 &&
-    !document.getElementById("detail-title").textContent.includes("請選擇")
-  ) {
-    showIncidentDetail(incidentsToRender[0]);
+async function localSearchIndex() {
+  if (!searchIndex && shardedMode) {
+    const indexRes = await fetch("search_index.json");
+    if (indexRes.ok) searchIndex = new SearchIndex(await indexRes.json());
   }
+  if (!searchIndex) searchIndex = SearchIndex.build(allIncidents);
+  return searchIndex;
 }
 
 
+// Debounced: a burst of keystrokes sends one query
 function handleSearch(event) {
   const query = event.target.value.toLowerCase();
+  clearTimeout(searchTimer);
+  searchTimer = setTimeout(() => runSearch(query), SEARCH_DEBOUNCE_MS);
+}
 
-  // mapping to mitre
-  const filteredIncidents = allIncidents.filter((incident) => {
-    const titleMatch =
-      incident.incident_title &&
-      incident.incident_title.toLowerCase().includes(query);
-    const reportMatch =
-      incident.full_report_text &&
-      incident.full_report_text.toLowerCase().includes(query);
-    const mitreMatch =
-      incident.mitre_classification &&
-      incident.mitre_classification.toLowerCase().includes(query);
-
-    return titleMatch || reportMatch || mitreMatch;
-  });
 
-  renderIncidentList(filteredIncidents);
+// Posting-list intersection: every query word must prefix-match a word in the
+// title, report text or MITRE classification
+async function runSearch(query) {
+  const seq = ++searchSeq;
+  if (searchWorker) {
+    searchWorker.postMessage({ type: "query", seq, query });
+    return;
+  }
+  const ids = (await localSearchIndex()).search(query).sort((a, b) => a - b);
+  if (seq === searchSeq) showSearchResults(ids);
+}
+
+
+function showSearchResults(ids) {
+  const filtered = [];
+  for (const id of ids) {
+    const incident = incidentById.get(id);
+    if (incident) filtered.push(incident);
+  }
+  renderIncidentList(filtered);
 }
 
 
-function showIncidentDetail(incident) {
+async function loadIncidentDetail(incident) {
+  if (!shardedMode) return incident;
+  const id = incident.incident_id;
+  if (!incidentDetails.has(id)) {
+    const res = await fetch(`incidents/${id}.json`);
+    incidentDetails.set(id, res.ok ? await res.json() : {});
+  }
+  return { ...incident, ...incidentDetails.get(id) };
+}
+
+
+async function showIncidentDetail(summary) {
   const detailContainer = document.getElementById("incident-detail");
+  const requestId = ++detailRequest;
+  const incident = await loadIncidentDetail(summary);
+  // A later click already replaced this one
+  if (requestId !== detailRequest) return;
 
 
   document.getElementById(
@@ -179,6 +275,7 @@ function showDefenseModal(defense) {
   document.getElementById("modal-title").textContent = defense.name;
   document.getElementById("modal-id").textContent = defense.id;
   document.getElementById("modal-tactic").textContent = defense.tactic || "N/A";
+  document.getElementById("modal-incidents").textContent = defenseIncidentCount(defense.id);
   document.getElementById("modal-description").textContent =
     defense.description;
 
@@ -186,6 +283,20 @@ function showDefenseModal(defense) {
 }
 
 
+// O(1) lookup in the precomputed reverse index, e.g. "8 (11 incl. sub-techniques)"
+function defenseIncidentCount(defenseId) {
+  const entry = defenseIndex && defenseIndex.defenses[defenseId];
+  if (!entry) return "N/A";
+  const tactic = defenseIndex.tactics[entry.tactic];
+  let text = String(entry.incident_count);
+  if (entry.rollup_count !== entry.incident_count) {
+    text += ` (${entry.rollup_count} incl. sub-techniques)`;
+  }
+  if (tactic) text += ` · ${tactic.incidents} across ${entry.tactic}`;
+  return text;
+}
+
+
 function setupListeners() {
 
   document
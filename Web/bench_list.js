@@ -0,0 +1,284 @@
+// bench_list.js
+// Incident-list rendering and typing latency: the old full re-render on every
+// keystroke against the windowed list (virtual_list.js) with debounced queries
+// answered by search_worker.js on a worker thread.
+//
+// Runs headless under Node with a minimal DOM stand-in (element tree, text,
+// style, scroll position, node-creation counter). It measures main-thread
+// JavaScript and DOM-operation counts, not browser layout or paint, which grow
+// with the node counts reported here.
+//
+// Usage: node bench_list.js [sizes...]      e.g. node bench_list.js 10000 50000
+
+const path = require("path");
+const { performance } = require("perf_hooks");
+const { Worker } = require("worker_threads");
+const SearchIndex = require("./search.js");
+const VirtualList = require("./virtual_list.js");
+const { makeCorpus } = require("./bench_search.js");
+
+const ROW_HEIGHT = 40; // app.js
+const SEARCH_DEBOUNCE_MS = 150; // app.js
+const VIEWPORT = 800; // List height in px
+const KEY_INTERVAL_MS = 80; // A fast typist
+const TYPED = "facial recog";
+
+// --- DOM stand-in ---
+class FakeNode {
+  constructor(doc, tag) {
+    this.ownerDocument = doc;
+    this.tagName = tag;
+    this.children = [];
+    this.parentNode = null;
+    this.style = {};
+    this.className = "";
+    this.text = "";
+    this.scrollTop = 0;
+    this.clientHeight = 0;
+    this.listeners = {};
+    doc.created++;
+  }
+  appendChild(child) {
+    if (child.parentNode) child.parentNode.removeChild(child);
+    child.parentNode = this;
+    this.children.push(child);
+    return child;
+  }
+  removeChild(child) {
+    const i = this.children.indexOf(child);
+    if (i >= 0) this.children.splice(i, 1);
+    child.parentNode = null;
+    return child;
+  }
+  set textContent(value) {
+    this.children.forEach((c) => (c.parentNode = null));
+    this.children = [];
+    this.text = String(value);
+  }
+  get textContent() {
+    return this.text + this.children.map((c) => c.textContent).join("");
+  }
+  // Markup such as `<strong>ID 1:</strong> title` becomes an element plus a text node
+  set innerHTML(html) {
+    this.textContent = "";
+    if (html) {
+      this.appendChild(this.ownerDocument.createElement("strong"));
+      this.appendChild(this.ownerDocument.createTextNode(html));
+    }
+  }
+  addEventListener(type, fn) {
+    (this.listeners[type] = this.listeners[type] || []).push(fn);
+  }
+  dispatch(type) {
+    (this.listeners[type] || []).forEach((fn) => fn({ target: this }));
+  }
+}
+
+class FakeDocument {
+  constructor() {
+    this.created = 0;
+  }
+  createElement(tag) {
+    return new FakeNode(this, tag);
+  }
+  createTextNode(text) {
+    const node = new FakeNode(this, "#text");
+    node.text = String(text);
+    return node;
+  }
+}
+
+// --- The old renderIncidentList: clear, one node per incident, then open the first one ---
+function renderAll(doc, container, incidents, stats) {
+  container.innerHTML = "";
+  incidents.forEach((incident) => {
+    const item = doc.createElement("div");
+    item.className = "incident-item";
+    item.innerHTML = `<strong>ID ${incident.incident_id}:</strong> ${incident.incident_title}`;
+    item.onclick = () => {};
+    container.appendChild(item);
+  });
+  if (incidents.length > 0) stats.detailLoads++; // showIncidentDetail(incidentsToRender[0])
+}
+
+// --- The new list: app.js renderIncidentRow ---
+function makeList(doc) {
+  const scroller = doc.createElement("div");
+  scroller.clientHeight = VIEWPORT;
+  const content = scroller.appendChild(doc.createElement("div"));
+  const list = new VirtualList(scroller, content, {
+    rowHeight: ROW_HEIGHT,
+    emptyText: "no incidents",
+    renderRow: (incident, item) => {
+      item.className = "incident-item";
+      item.textContent = "";
+      const label = doc.createElement("strong");
+      label.textContent = `ID ${incident.incident_id}:`;
+      item.appendChild(label);
+      item.appendChild(doc.createTextNode(` ${incident.incident_title}`));
+      item.onclick = () => {};
+    },
+  });
+  return { scroller, list };
+}
+
+function startWorker(incidents) {
+  const worker = new Worker(
+    `const { parentPort } = require("worker_threads");
+     const { createHandler } = require(${JSON.stringify(path.join(__dirname, "search_worker.js"))});
+     const handle = createHandler((msg, transfer) => parentPort.postMessage(msg, transfer));
+     parentPort.on("message", handle);`,
+    { eval: true }
+  );
+  const waiting = new Map();
+  worker.on("message", (msg) => {
+    const key = msg.type === "result" ? msg.seq : msg.type;
+    const resolve = waiting.get(key);
+    waiting.delete(key);
+    if (resolve) resolve(msg);
+  });
+  const reply = (key) => new Promise((resolve) => waiting.set(key, resolve));
+  const t0 = performance.now();
+  const ready = reply("ready").then(() => performance.now() - t0);
+  worker.postMessage({ type: "init", incidents });
+  let seq = 0;
+  return {
+    ready,
+    query(q) {
+      const s = ++seq;
+      const done = reply(s);
+      worker.postMessage({ type: "query", seq: s, query: q });
+      return done;
+    },
+    close: () => worker.terminate(),
+  };
+}
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+const pct = (values, p) => {
+  const sorted = [...values].sort((a, b) => a - b);
+  return sorted[Math.min(sorted.length - 1, Math.floor(p * sorted.length))];
+};
+const fmt = (ms) => `${ms.toFixed(2)} ms`;
+
+async function benchSize(n) {
+  const incidents = makeCorpus(n).map((incident) => ({ ...incident, matched_defense_ids: [] }));
+  const byId = new Map(incidents.map((incident) => [incident.incident_id, incident]));
+  const prefixes = Array.from(TYPED, (_, i) => TYPED.slice(0, i + 1));
+  const lookup = (ids) => {
+    const out = [];
+    for (const id of ids) {
+      const incident = byId.get(id);
+      if (incident) out.push(incident);
+    }
+    return out;
+  };
+
+  // Old: index built and every row rendered on the main thread before anything shows
+  const oldDoc = new FakeDocument();
+  const oldContainer = oldDoc.createElement("div");
+  const oldStats = { detailLoads: 0 };
+  let t0 = performance.now();
+  const index = SearchIndex.build(incidents);
+  const oldBuild = performance.now() - t0;
+  renderAll(oldDoc, oldContainer, incidents, oldStats);
+  const oldFirst = performance.now() - t0;
+  const oldNodesFirst = oldDoc.created;
+
+  // Old: every keystroke searches and re-renders synchronously
+  const oldKeys = [];
+  const before = oldDoc.created;
+  for (const q of prefixes) {
+    t0 = performance.now();
+    const ids = index.search(q).sort((a, b) => a - b);
+    renderAll(oldDoc, oldContainer, lookup(ids), oldStats);
+    oldKeys.push(performance.now() - t0);
+  }
+  const oldNodesPerKey = (oldDoc.created - before) / prefixes.length;
+
+  // New: first window only; the worker builds its index in parallel
+  const newDoc = new FakeDocument();
+  const worker = startWorker(incidents);
+  t0 = performance.now();
+  const { scroller, list } = makeList(newDoc);
+  list.setItems(incidents);
+  const newFirst = performance.now() - t0;
+  const newNodesFirst = newDoc.created;
+  const workerReady = await worker.ready;
+
+  // New, per query: worker round trip, then the main-thread part (ids -> window)
+  const roundTrips = [];
+  const mainThread = [];
+  let nodesBefore = newDoc.created;
+  for (const q of prefixes) {
+    t0 = performance.now();
+    const { ids } = await worker.query(q);
+    const t1 = performance.now();
+    list.setItems(lookup(ids));
+    const t2 = performance.now();
+    roundTrips.push(t2 - t0);
+    mainThread.push(t2 - t1);
+  }
+  const newNodesPerQuery = (newDoc.created - nodesBefore) / prefixes.length;
+
+  // New, as typed: keystrokes KEY_INTERVAL_MS apart, debounced, one query at the end
+  let queries = 0;
+  let timer = null;
+  let handlerMs = 0;
+  let rendered = null;
+  const typedAt = [];
+  for (const q of prefixes) {
+    t0 = performance.now();
+    clearTimeout(timer);
+    timer = setTimeout(async () => {
+      queries++;
+      const { ids } = await worker.query(q);
+      list.setItems(lookup(ids));
+      rendered = performance.now();
+    }, SEARCH_DEBOUNCE_MS);
+    handlerMs = Math.max(handlerMs, performance.now() - t0);
+    typedAt.push(performance.now());
+    await sleep(KEY_INTERVAL_MS);
+  }
+  while (rendered === null) await sleep(5);
+  const typedLatency = rendered - typedAt[typedAt.length - 1];
+
+  // Scrolling the full list: one window per step
+  list.setItems(incidents);
+  nodesBefore = newDoc.created;
+  const scrollSteps = [];
+  for (let top = 0; top < Math.min(n * ROW_HEIGHT, 2000 * ROW_HEIGHT); top += VIEWPORT / 2) {
+    scroller.scrollTop = top;
+    t0 = performance.now();
+    list.render();
+    scrollSteps.push(performance.now() - t0);
+  }
+  worker.close();
+
+  console.log(`\n--- ${n.toLocaleString()} incidents ---`);
+  console.log(`${"".padEnd(34)}${"old (full render)".padStart(22)}${"new (window + worker)".padStart(28)}`);
+  const line = (label, a, b) => console.log(`${label.padEnd(34)}${a.padStart(22)}${b.padStart(28)}`);
+  line("time to first render", fmt(oldFirst), fmt(newFirst));
+  line("DOM nodes at first render", String(oldNodesFirst), String(newNodesFirst));
+  line("  of which search index build", fmt(oldBuild), "0 (worker)");
+  line("search index ready", fmt(oldBuild), `${fmt(workerReady)} (off main)`);
+  line("keystroke, main thread p50", fmt(pct(oldKeys, 0.5)), fmt(pct(mainThread, 0.5)));
+  line("keystroke, main thread max", fmt(Math.max(...oldKeys)), fmt(Math.max(...mainThread)));
+  line("query -> rows shown p50", fmt(pct(oldKeys, 0.5)), fmt(pct(roundTrips, 0.5)));
+  line("DOM nodes created per keystroke", oldNodesPerKey.toFixed(0), newNodesPerQuery.toFixed(0));
+  line("detail loads while typing", String(oldStats.detailLoads - 1), "0");
+  line(
+    `typing "${TYPED}" (${KEY_INTERVAL_MS} ms/key)`,
+    `${prefixes.length} renders`,
+    `${queries} query, +${typedLatency.toFixed(0)} ms`
+  );
+  line("input handler, main thread max", "= keystroke", fmt(handlerMs));
+  line("scroll step p50 (half a viewport)", "-", fmt(pct(scrollSteps, 0.5)));
+}
+
+async function main() {
+  const sizes = process.argv.slice(2).map(Number).filter(Boolean);
+  for (const n of sizes.length ? sizes : [10000, 20000]) await benchSize(n);
+}
+
+main();
@@ -0,0 +1,82 @@
+// bench_search.js
+// Query latency vs corpus size: the old per-keystroke substring scan against
+// the inverted index in search.js, on synthetic incident corpora.
+//
+// Usage: node bench_search.js [sizes...]      e.g. node bench_search.js 1000 10000 50000
+
+const { performance } = require("perf_hooks");
+const SearchIndex = require("./search.js");
+
+const VOCAB_SIZE = 20000;
+const WORDS_PER_REPORT = 600;
+const QUERIES = ["f", "fa", "fac", "facial", "facial recog", "deepfake", "privacy leak chatbot", "zzzz"];
+
+// Deterministic PRNG so runs are comparable
+function rng(seed) {
+  return () => {
+    seed = (seed * 1664525 + 1013904223) >>> 0;
+    return seed / 4294967296;
+  };
+}
+
+function makeCorpus(n) {
+  const rand = rng(42);
+  const base = ["facial", "recognition", "deepfake", "privacy", "leak", "chatbot", "autonomous", "vehicle"];
+  const vocab = base.concat(Array.from({ length: VOCAB_SIZE }, (_, i) => "w" + i.toString(36)));
+  // Zipf-like: low indices are much more frequent
+  const word = () => vocab[Math.floor(Math.pow(rand(), 3) * vocab.length)];
+  const incidents = [];
+  for (let id = 1; id <= n; id++) {
+    const words = Array.from({ length: WORDS_PER_REPORT }, word);
+    incidents.push({
+      incident_id: id,
+      incident_title: words.slice(0, 8).join(" "),
+      full_report_text: words.join(" "),
+      mitre_classification: "Privacy & Security: Compromise of privacy",
+    });
+  }
+  return incidents;
+}
+
+// The original handleSearch filter
+function linearScan(incidents, query) {
+  return incidents.filter(
+    (i) =>
+      i.incident_title.toLowerCase().includes(query) ||
+      i.full_report_text.toLowerCase().includes(query) ||
+      i.mitre_classification.toLowerCase().includes(query)
+  );
+}
+
+function median(fn, reps = 5) {
+  const times = [];
+  for (let r = 0; r < reps; r++) {
+    const t0 = performance.now();
+    fn();
+    times.push(performance.now() - t0);
+  }
+  times.sort((a, b) => a - b);
+  return times[Math.floor(times.length / 2)];
+}
+
+function main() {
+  const sizes = process.argv.slice(2).map(Number).filter(Boolean);
+  const corpusSizes = sizes.length ? sizes : [1000, 5000, 20000];
+
+  console.log("incidents  build ms  scan ms/query  index ms/query  speedup");
+  for (const n of corpusSizes) {
+    const incidents = makeCorpus(n);
+    let index;
+    const buildMs = median(() => (index = SearchIndex.build(incidents)), 1);
+    const scanMs = QUERIES.reduce((s, q) => s + median(() => linearScan(incidents, q)), 0) / QUERIES.length;
+    const indexMs = QUERIES.reduce((s, q) => s + median(() => index.search(q)), 0) / QUERIES.length;
+    console.log(
+      `${String(n).padStart(9)}  ${buildMs.toFixed(0).padStart(8)}  ${scanMs.toFixed(2).padStart(13)}` +
+        `  ${indexMs.toFixed(3).padStart(14)}  ${(scanMs / indexMs).toFixed(0).padStart(6)}x`
+    );
+  }
+}
+
+// bench_list.js reuses the corpus generator
+module.exports = { makeCorpus, median };
+if (require.main === module) main();
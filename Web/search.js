@@ -0,0 +1,119 @@
+// search.js
+// Inverted-index search over incidents. Reads search_index.json from tojson.py
+// (or builds the same structure in the browser from incidents.json).
+// Works as a browser global (SearchIndex) and as a Node module for the benchmark.
+
+(function (root, factory) {
+  if (typeof module === "object" && module.exports) {
+    module.exports = factory();
+  } else {
+    root.SearchIndex = factory();
+  }
+})(typeof self !== "undefined" ? self : this, function () {
+  const SEARCH_FIELDS = ["incident_title", "full_report_text", "mitre_classification"];
+  const MAX_TERM_LEN = 30;
+  const TOKEN_RE = /[\p{L}\p{N}]+/gu;
+
+  // Same rule as search_index.py: lowercase runs of letters/digits
+  function tokenize(text) {
+    const m = String(text || "").toLowerCase().match(TOKEN_RE);
+    return m ? m.filter((t) => t.length <= MAX_TERM_LEN) : [];
+  }
+
+  function lowerBound(arr, key) {
+    let lo = 0;
+    let hi = arr.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >>> 1;
+      if (arr[mid] < key) lo = mid + 1;
+      else hi = mid;
+    }
+    return lo;
+  }
+
+  class SearchIndex {
+    // raw: {ids, terms, postings} with delta-encoded posting lists
+    constructor(raw) {
+      this.ids = raw.ids;
+      this.terms = raw.terms;
+      this.postings = raw.postings.map((deltas) => {
+        const docs = new Int32Array(deltas.length);
+        let acc = 0;
+        for (let i = 0; i < deltas.length; i++) {
+          acc += deltas[i];
+          docs[i] = acc;
+        }
+        return docs;
+      });
+      this.mark = new Uint32Array(this.ids.length);
+      this.stamp = 0;
+    }
+
+    static build(incidents, fields = SEARCH_FIELDS) {
+      const postings = new Map();
+      const ids = [];
+      incidents.forEach((incident, doc) => {
+        ids.push(incident.incident_id);
+        const seen = new Set();
+        fields.forEach((f) => tokenize(incident[f]).forEach((t) => seen.add(t)));
+        seen.forEach((t) => {
+          if (!postings.has(t)) postings.set(t, []);
+          postings.get(t).push(doc);
+        });
+      });
+      const terms = [...postings.keys()].sort();
+      const encoded = terms.map((t) => {
+        const docs = postings.get(t);
+        return docs.map((d, i) => (i === 0 ? d : d - docs[i - 1]));
+      });
+      return new SearchIndex({ ids, terms, postings: encoded });
+    }
+
+    // Document numbers containing a term that starts with `prefix`, ascending
+    prefixDocs(prefix) {
+      const lo = lowerBound(this.terms, prefix);
+      const hi = lowerBound(this.terms, prefix + "\uffff");
+      if (hi - lo === 1) return this.postings[lo];
+      const stamp = ++this.stamp;
+      for (let i = lo; i < hi; i++) {
+        const p = this.postings[i];
+        for (let j = 0; j < p.length; j++) this.mark[p[j]] = stamp;
+      }
+      const out = [];
+      for (let d = 0; d < this.mark.length; d++) if (this.mark[d] === stamp) out.push(d);
+      return out;
+    }
+
+    // Incident ids whose text contains every query token as a word prefix
+    search(query) {
+      const tokens = [...new Set(tokenize(query))].sort((a, b) => b.length - a.length);
+      if (tokens.length === 0) return this.ids.slice();
+      let docs = null;
+      for (const token of tokens) {
+        const found = this.prefixDocs(token);
+        docs = docs === null ? Array.from(found) : intersect(docs, found);
+        if (docs.length === 0) return [];
+      }
+      return docs.map((d) => this.ids[d]);
+    }
+  }
+
+  // Both inputs ascending
+  function intersect(a, b) {
+    const out = [];
+    let i = 0;
+    let j = 0;
+    while (i < a.length && j < b.length) {
+      if (a[i] === b[j]) {
+        out.push(a[i]);
+        i++;
+        j++;
+      } else if (a[i] < b[j]) i++;
+      else j++;
+    }
+    return out;
+  }
+
+  SearchIndex.tokenize = tokenize;
+  return SearchIndex;
+});
@@ -0,0 +1,61 @@
+// search_worker.js
+// Runs SearchIndex (search.js) queries off the main thread for app.js, so
+// typing never waits on index loading or posting-list intersections.
+//
+// Messages in:  {type: "init", indexUrl, incidentsUrl}  fetch search_index.json,
+//                                                       else build from incidents.json
+//               {type: "init", raw} / {type: "init", incidents}   data passed directly
+//               {type: "query", seq, query}
+// Messages out: {type: "ready", size} | {type: "error", message}
+//               {type: "result", seq, ids}   ids: Int32Array of incident ids, ascending
+//
+// As a Node module it exports createHandler() for the benchmark.
+
+(function (root, factory) {
+  if (typeof module === "object" && module.exports) {
+    module.exports = factory(require("./search.js"));
+  } else {
+    importScripts("search.js");
+    const handle = factory(root.SearchIndex).createHandler((msg, transfer) => root.postMessage(msg, transfer));
+    root.onmessage = (event) => handle(event.data);
+  }
+})(typeof self !== "undefined" ? self : this, function (SearchIndex) {
+  async function loadIndex(msg) {
+    if (msg.raw) return new SearchIndex(msg.raw);
+    if (msg.incidents) return SearchIndex.build(msg.incidents);
+    if (msg.indexUrl) {
+      const res = await fetch(msg.indexUrl);
+      if (res.ok) return new SearchIndex(await res.json());
+    }
+    const res = await fetch(msg.incidentsUrl);
+    return SearchIndex.build(await res.json());
+  }
+
+  // post(message, transferList) sends one reply
+  function createHandler(post) {
+    let index = null;
+    let ready = null;
+    return async function handle(msg) {
+      if (msg.type === "init") {
+        ready = loadIndex(msg);
+        try {
+          index = await ready;
+          post({ type: "ready", size: index.ids.length });
+        } catch (error) {
+          post({ type: "error", message: String(error) });
+        }
+        return;
+      }
+      if (msg.type === "query") {
+        if (!index) {
+          if (!ready) return; // No init yet
+          index = await ready;
+        }
+        const ids = Int32Array.from(index.search(msg.query)).sort();
+        post({ type: "result", seq: msg.seq, ids }, [ids.buffer]);
+      }
+    };
+  }
+
+  return { createHandler };
+});
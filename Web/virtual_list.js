@@ -0,0 +1,110 @@
+// virtual_list.js
+// Windowed list for the incident panel: only the rows in (or near) the
+// viewport exist in the DOM, recycled as the list scrolls, so a 10k-incident
+// result set costs the same to show as a 30-incident one.
+// Works as a browser global (VirtualList) and as a Node module for the benchmark.
+
+(function (root, factory) {
+  if (typeof module === "object" && module.exports) {
+    module.exports = factory(root);
+  } else {
+    root.VirtualList = factory(root);
+  }
+})(typeof self !== "undefined" ? self : this, function (root) {
+  const OVERSCAN = 6; // Extra rows above and below the viewport
+
+  class VirtualList {
+    // scroller: the overflow:auto element; content: a child that gets the full height.
+    // renderRow(item, element, index) fills a (possibly recycled) row element.
+    constructor(scroller, content, { rowHeight, renderRow, emptyText = "", overscan = OVERSCAN }) {
+      this.scroller = scroller;
+      this.content = content;
+      this.doc = content.ownerDocument || root.document;
+      this.rowHeight = rowHeight;
+      this.renderRow = renderRow;
+      this.emptyText = emptyText;
+      this.overscan = overscan;
+      this.items = [];
+      this.rows = new Map(); // item index -> row element currently shown
+      this.pool = []; // detached rows ready for reuse
+      this.empty = null;
+      this.frame = null;
+      this.content.style.position = "relative";
+      this.scroller.addEventListener("scroll", () => this.scheduleRender());
+    }
+
+    setItems(items) {
+      this.items = items;
+      for (const row of this.rows.values()) this.recycle(row);
+      this.rows.clear();
+      this.scroller.scrollTop = 0;
+      this.content.style.height = `${items.length * this.rowHeight}px`;
+      if (items.length === 0 && this.emptyText) {
+        if (!this.empty) {
+          this.empty = this.doc.createElement("p");
+          this.empty.textContent = this.emptyText;
+        }
+        this.content.appendChild(this.empty);
+      } else if (this.empty && this.empty.parentNode) {
+        this.content.removeChild(this.empty);
+      }
+      this.render();
+    }
+
+    // Re-fill the visible rows (e.g. after the selection changed)
+    refresh() {
+      for (const [i, row] of this.rows) this.renderRow(this.items[i], row, i);
+    }
+
+    scheduleRender() {
+      if (this.frame !== null) return;
+      const raf = root.requestAnimationFrame || ((fn) => setTimeout(fn, 0));
+      this.frame = raf(() => {
+        this.frame = null;
+        this.render();
+      });
+    }
+
+    visibleRange() {
+      const height = this.scroller.clientHeight || this.rowHeight * 20;
+      const first = Math.floor(this.scroller.scrollTop / this.rowHeight) - this.overscan;
+      const last = Math.ceil((this.scroller.scrollTop + height) / this.rowHeight) + this.overscan;
+      return [Math.max(0, first), Math.min(this.items.length, last)];
+    }
+
+    render() {
+      const [start, end] = this.visibleRange();
+      for (const [i, row] of this.rows) {
+        if (i < start || i >= end) {
+          this.recycle(row);
+          this.rows.delete(i);
+        }
+      }
+      for (let i = start; i < end; i++) {
+        if (this.rows.has(i)) continue;
+        const row = this.pool.pop() || this.doc.createElement("div");
+        row.style.position = "absolute";
+        row.style.left = "0";
+        row.style.right = "0";
+        row.style.top = `${i * this.rowHeight}px`;
+        row.style.height = `${this.rowHeight}px`;
+        this.renderRow(this.items[i], row, i);
+        this.content.appendChild(row);
+        this.rows.set(i, row);
+      }
+    }
+
+    recycle(row) {
+      if (row.parentNode) row.parentNode.removeChild(row);
+      this.pool.push(row);
+    }
+
+    scrollToIndex(i) {
+      this.scroller.scrollTop = i * this.rowHeight;
+      this.render();
+    }
+  }
+
+  VirtualList.OVERSCAN = OVERSCAN;
+  return VirtualList;
+});
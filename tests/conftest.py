@@ -0,0 +1,58 @@
+"""
+Shared fixtures: the pipeline scripts in 1018/ import each other as siblings,
+so that directory goes on sys.path. Inputs come from synth_data.py (a small
+synthetic snapshot and tactic files) and fake_gemini.FakeGeminiClient.
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '1018')
+sys.path.insert(0, os.path.abspath(SCRIPTS_DIR))
+
+import synth_data  # noqa: E402
+
+INCIDENTS = 60
+REPORTS = 240
+WORDS = 80
+TECHNIQUES = 4
+
+
+@pytest.fixture(autouse=True)
+def _metrics_dir(tmp_path, monkeypatch):
+    """Run reports from instrumentation.py go to the test's tmp dir, not the cwd."""
+    from instrumentation import METRICS_ENV
+    monkeypatch.setenv(METRICS_ENV, str(tmp_path / 'run_metrics'))
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    """incidents.csv / reports.csv / classifications_MIT.csv for INCIDENTS incidents."""
+    path = tmp_path / 'snapshot'
+    synth_data.write_snapshot(str(path), INCIDENTS, REPORTS, WORDS, synth_data.DUP_RATE, np.random.default_rng(0))
+    return path
+
+
+@pytest.fixture(scope='session')
+def tactics(tmp_path_factory):
+    """Synthetic AIDEFEND tactic JS files."""
+    path = tmp_path_factory.mktemp('tactics')
+    synth_data.write_tactics(str(path), TECHNIQUES, np.random.default_rng(0))
+    return path
+
+
+@pytest.fixture
+def incidents():
+    """Prompt-ready incident rows (the columns combine.py writes)."""
+    return [{'incident_id': i, 'incident_title': f'incident {i}', 'deployer': 'openai', 'developer': 'openai',
+             'mitre_classification': '', 'full_report_text': f'report text of incident {i}. ' * 20}
+            for i in range(1, 13)]
+
+
+@pytest.fixture
+def catalog():
+    """LLM_Entry lines for a small defense catalog."""
+    return '\n'.join(f'[AID-H-{k:03d}] Harden {k}: hardening technique number {k}' for k in range(1, 21))
@@ -0,0 +1,66 @@
+"""BatchMapper: packing, demultiplexing answers per incident and splitting partial batches."""
+
+import asyncio
+
+from batching import BatchMapper, pack_batches
+from fake_gemini import ID_RE, FakeGeminiClient, fake_pick
+from llm_clients import LLMReply
+from llm_engine import MappingEngine
+
+
+def run(mapper, incidents):
+    return asyncio.run(mapper.map_batch(incidents))
+
+
+def engine_for(client):
+    return MappingEngine(client, 'gemini-2.5-pro', requests_per_minute=0, max_retries=0)
+
+
+def test_pack_batches():
+    sizes = [10, 10, 10, 50, 10, 200, 10]
+    batches = pack_batches(sizes, budget=100, fixed_tokens=30, max_batch=3)
+    assert [i for b in batches for i in b] == list(range(len(sizes)))   # In order, nothing lost
+    for b in batches:
+        assert len(b) <= 3
+        assert len(b) == 1 or 30 + sum(sizes[i] for i in b) <= 100
+    assert [5] in batches                                                # Oversized item alone
+
+
+def test_partial_answers_are_split_and_demultiplexed(incidents, catalog):
+    # Every multi-incident answer drops its last incident
+    client = FakeGeminiClient(latency=0, partial_rate=1.0, seed=0)
+    seen = []
+    mapper = BatchMapper(engine_for(client), catalog, on_incident=lambda incident, result: seen.append(result))
+    results = run(mapper, incidents)
+
+    ids = list(dict.fromkeys(ID_RE.findall(catalog)))
+    assert sorted(r['incident_id'] for r in results) == [i['incident_id'] for i in incidents]
+    for r in results:   # Each incident got its own answer, not a neighbour's
+        assert r['matched_defense_ids'] == fake_pick(r['incident_id'], ids)['matched_defense_ids']
+    assert mapper.splits > 0 and mapper.calls > 1
+    assert sorted(seen, key=lambda r: r['incident_id']) == sorted(results, key=lambda r: r['incident_id'])
+
+
+def test_whole_batch_answer_needs_one_call(incidents, catalog):
+    mapper = BatchMapper(engine_for(FakeGeminiClient(latency=0, seed=0)), catalog)
+    results = run(mapper, incidents)
+    assert [r['incident_id'] for r in results] == [i['incident_id'] for i in incidents]
+    assert (mapper.calls, mapper.splits) == (1, 0)
+
+
+def test_failed_requests_become_error_rows(incidents, catalog):
+    mapper = BatchMapper(engine_for(FakeGeminiClient(latency=0, error_rate=1.0, seed=0)), catalog)
+    results = run(mapper, incidents[:4])
+    assert [r['matched_defense_ids'] for r in results] == [['LLM_ERROR']] * 4
+
+
+class GarbageClient:
+    async def generate(self, model, prompt, response_schema, **kwargs):
+        return LLMReply(text='[{"incident_id": 1, "matched_defense_ids": "AID-H-001"}')
+
+
+def test_malformed_answers_become_parse_errors(incidents, catalog):
+    mapper = BatchMapper(engine_for(GarbageClient()), catalog)
+    results = run(mapper, incidents[:3])
+    assert [r['matched_defense_ids'] for r in results] == [['JSON_PARSE_ERROR']] * 3
+    assert mapper.calls == 5   # 3 -> 1 + 2 -> 1 + 1
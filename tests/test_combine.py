@@ -0,0 +1,59 @@
+"""In-memory, streaming and delta combine must write byte-identical output."""
+
+import json
+
+import pandas as pd
+import pytest
+
+from combine import combine_delta, combine_in_memory, combine_streaming
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('threshold', [0.0, 0.8])
+def test_streaming_matches_in_memory(snapshot, tmp_path, threshold):
+    combine_in_memory(str(snapshot), str(tmp_path / 'memory.csv'), threshold)
+    # Chunks much smaller than the data, so rows and incidents span several chunks
+    rows = combine_streaming(str(snapshot), str(tmp_path / 'streaming.csv'), chunksize=37,
+                             near_dup_threshold=threshold, incident_chunksize=7)
+    assert read_bytes(tmp_path / 'streaming.csv') == read_bytes(tmp_path / 'memory.csv')
+    assert rows == len(pd.read_csv(tmp_path / 'memory.csv'))
+
+
+def test_delta_matches_full_rebuild(snapshot, tmp_path):
+    out, manifest, changed = (str(tmp_path / n) for n in ('delta.csv', 'manifest.json', 'changed.json'))
+    combine_delta(str(snapshot), out, manifest, changed, chunksize=50)
+    with open(changed) as f:
+        assert json.load(f)['full_rebuild']
+
+    # Edit one report's text and drop one incident
+    reports = pd.read_csv(snapshot / 'reports.csv')
+    reports.loc[reports['report_number'] == 5, 'text'] = 'rewritten report text.'
+    reports.to_csv(snapshot / 'reports.csv', index=False)
+    incidents = pd.read_csv(snapshot / 'incidents.csv')
+    removed = int(incidents['incident_id'].iloc[-1])
+    incidents.iloc[:-1].to_csv(snapshot / 'incidents.csv', index=False)
+
+    rows = combine_delta(str(snapshot), out, manifest, changed, chunksize=50)
+    with open(changed) as f:
+        delta = json.load(f)
+    assert not delta['full_rebuild']
+    assert delta['removed'] == [removed]
+    assert 1 <= len(delta['changed']) < len(incidents) - 1
+
+    combine_in_memory(str(snapshot), str(tmp_path / 'memory.csv'))
+    assert read_bytes(out) == read_bytes(tmp_path / 'memory.csv')
+    assert rows == len(incidents) - 1
+
+
+def test_delta_without_changes_keeps_output(snapshot, tmp_path):
+    out, manifest, changed = (str(tmp_path / n) for n in ('delta.csv', 'manifest.json', 'changed.json'))
+    combine_delta(str(snapshot), out, manifest, changed)
+    before = read_bytes(out)
+    combine_delta(str(snapshot), out, manifest, changed)
+    with open(changed) as f:
+        assert json.load(f) == {'changed': [], 'removed': [], 'full_rebuild': False}
+    assert read_bytes(out) == before
@@ -0,0 +1,32 @@
+"""The single-pass parser (parse_fast) must match the legacy regex parser (--legacy)."""
+
+import os
+
+import pytest
+
+from defendlist import parse_all, parse_fast, parse_legacy, parse_one, read_text
+from synth_data import TACTICS
+
+
+@pytest.mark.parametrize('name', [t[0] for t in TACTICS])
+def test_parse_fast_matches_legacy(tactics, name):
+    text = read_text(str(tactics / f'{name}.js'))
+    fast = parse_fast(text)
+    assert fast == parse_one(text, include_sub=True)
+    assert fast[1], "no techniques parsed"
+
+
+def test_parse_all_matches_legacy_and_reuses_cache(tactics, tmp_path):
+    paths = sorted(str(p) for p in tactics.iterdir())
+    cache_path = str(tmp_path / 'cache.json')
+    first = parse_all(paths, jobs=1, cache_path=cache_path)
+    for path in paths:
+        legacy = parse_legacy(path)
+        assert {k: first[path][k] for k in legacy} == legacy
+
+    # A touch changes the mtime but not the content: served from the cache
+    os.utime(paths[0])
+    second = parse_all(paths, jobs=1, cache_path=cache_path)
+    for path in paths:
+        assert {k: second[path][k] for k in ('tactic', 'techniques', 'subs')} == \
+               {k: first[path][k] for k in ('tactic', 'techniques', 'subs')}
@@ -0,0 +1,63 @@
+"""mapping_matrix: llm_defense_mapping.csv -> npz -> CSV / mapping.json round trip and lookups."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from defense_index import split_ids
+from mapping_matrix import build_matrix, load_matrix, save_matrix
+
+CATALOG = [f'AID-H-{k:03d}' for k in range(1, 21)] + ['AID-H-001.001']
+
+
+@pytest.fixture
+def mapping():
+    rng = np.random.default_rng(0)
+    rows = []
+    for iid in rng.permutation(np.arange(1, 201)).tolist():   # Not sorted, like a concurrent run
+        ids = list(rng.choice(CATALOG, size=int(rng.integers(1, 6)), replace=False))
+        if iid % 50 == 0:
+            ids = ['LLM_ERROR']
+        elif iid % 37 == 0:
+            ids.append('AID-X-999')        # Not in the catalog
+        rows.append({'incident_id': iid, 'matched_defense_ids': ', '.join(ids)})
+    return pd.DataFrame(rows)
+
+
+@pytest.mark.parametrize('mmap', [True, False])
+def test_round_trip(mapping, tmp_path, mmap):
+    path = str(tmp_path / 'mapping_matrix.npz')
+    save_matrix(build_matrix(mapping.to_dict(orient='records'), CATALOG), path)
+    matrix = load_matrix(path, mmap=mmap)
+
+    expected = mapping.sort_values('incident_id').reset_index(drop=True)
+    assert matrix.to_mapping_df().equals(expected)
+    assert matrix.to_records() == expected.to_dict(orient='records')
+    assert matrix.n_catalog == len(CATALOG)
+    assert list(matrix.defense_ids[:len(CATALOG)]) == CATALOG
+
+
+def test_lookups_match_the_lists(mapping, tmp_path):
+    path = str(tmp_path / 'mapping_matrix.npz')
+    save_matrix(build_matrix(mapping.to_dict(orient='records'), CATALOG), path)
+    matrix = load_matrix(path)
+    lists = {int(i): split_ids(v) for i, v in zip(mapping['incident_id'], mapping['matched_defense_ids'])}
+
+    assert matrix.to_lists() == dict(sorted(lists.items()))
+    for did in CATALOG + ['AID-X-999', 'LLM_ERROR']:
+        assert matrix.incidents_for(did).tolist() == sorted(i for i, ids in lists.items() if did in ids)
+    for iid, ids in list(lists.items())[:20]:
+        assert matrix.defenses_for(iid) == ids
+        assert all(matrix.has(iid, did) == (did in ids) for did in CATALOG)
+    csr = matrix.to_csr()
+    assert csr.sum() == sum(len(set(ids)) for ids in lists.values())
+    with pytest.raises(KeyError):
+        matrix.row_of(10_000)
+
+
+def test_empty_mapping(tmp_path):
+    path = str(tmp_path / 'mapping_matrix.npz')
+    save_matrix(build_matrix([], CATALOG), path)
+    matrix = load_matrix(path)
+    assert matrix.shape == (0, len(CATALOG))
+    assert matrix.to_mapping_df().empty
@@ -0,0 +1,46 @@
+"""ResultCache: append-only JSONL with last-write-wins and torn-line recovery."""
+
+import json
+
+from result_cache import ResultCache, cache_key
+
+
+def test_last_write_wins_and_error_rows_are_misses(tmp_path):
+    path = str(tmp_path / 'cache.jsonl')
+    cache = ResultCache(path)
+    cache.put('a', {'incident_id': 1, 'matched_defense_ids': ['AID-H-001']})
+    cache.put('b', {'incident_id': 2, 'matched_defense_ids': ['LLM_ERROR']})
+    cache.put('a', {'incident_id': 1, 'matched_defense_ids': ['AID-H-002']})
+    cache.close()
+
+    cache = ResultCache(path)
+    assert cache.get('a') == {'incident_id': 1, 'matched_defense_ids': ['AID-H-002']}
+    assert cache.get('b') is None          # Error rows are retried, not served
+    assert cache.get('c') is None
+    assert (cache.hits, cache.misses, cache.retried_errors) == (1, 2, 1)
+
+
+def test_torn_last_line(tmp_path):
+    path = tmp_path / 'cache.jsonl'
+    good = json.dumps({'key': 'a', 'incident_id': 1, 'matched_defense_ids': ['AID-H-001']})
+    path.write_text(good + '\n{"key": "b", "incident_id": 2, "matched', encoding='utf-8')
+
+    cache = ResultCache(str(path))
+    assert set(cache.entries) == {'a'}
+    cache.put('c', {'incident_id': 3, 'matched_defense_ids': ['AID-H-003']})
+    cache.close()
+
+    # The first entry after the torn line starts on its own line and survives a reload
+    cache = ResultCache(str(path))
+    assert set(cache.entries) == {'a', 'c'}
+    assert path.read_text(encoding='utf-8').endswith('\n')
+
+
+def test_cache_key_covers_prompt_inputs():
+    incident = {'incident_id': 1, 'incident_title': 't', 'full_report_text': 'r', 'url': 'x'}
+    key = cache_key(incident, 'catalog', 'model', 'template')
+    assert key == cache_key(dict(incident, url='y'), 'catalog', 'model', 'template')   # Not in the prompt
+    assert key != cache_key(dict(incident, full_report_text='r2'), 'catalog', 'model', 'template')
+    assert key != cache_key(incident, 'catalog2', 'model', 'template')
+    assert key != cache_key(incident, 'catalog', 'model2', 'template')
+    assert key != cache_key(incident, 'catalog', 'model', 'template2')
@@ -0,0 +1,64 @@
+"""WorkQueue: exclusive leases, expiry and takeover, owner check on complete, error-row retries."""
+
+import pytest
+
+from work_queue import MAX_ATTEMPTS, WorkQueue
+
+LEASE = 60.0
+
+
+@pytest.fixture
+def queue(tmp_path, incidents, catalog):
+    q = WorkQueue(str(tmp_path / 'queue.db'))
+    assert q.enqueue(incidents, catalog, 'gemini-2.5-pro') == len(incidents)
+    return q
+
+
+def test_enqueue_is_idempotent_and_pinned_to_catalog(queue, incidents, catalog):
+    assert queue.enqueue(incidents, catalog, 'gemini-2.5-pro') == 0
+    with pytest.raises(ValueError):
+        queue.enqueue(incidents, catalog + '\nextra', 'gemini-2.5-pro')
+    assert queue.enqueue(incidents[:3], catalog + '\nextra', 'gemini-2.5-pro', reset=True) == 3
+
+
+def test_claims_do_not_overlap(queue, incidents):
+    a = [t['incident_id'] for t in queue.claim('a', 5, LEASE)]
+    b = [t['incident_id'] for t in queue.claim('b', 100, LEASE)]
+    assert a == [i['incident_id'] for i in incidents[:5]]
+    assert sorted(a + b) == [i['incident_id'] for i in incidents]
+    assert queue.claim('c', 5, LEASE) == []
+    assert queue.counts()['leased'] == len(incidents)
+
+
+def test_expired_lease_is_taken_over(queue):
+    stale = queue.claim('a', 3, lease=-1.0)     # Already expired: worker "a" crashed or stalled
+    assert queue.counts()['expired'] == 3
+    taken = queue.claim('b', 3, LEASE)
+    assert [t['incident_id'] for t in taken] == [t['incident_id'] for t in stale]
+
+    # The old owner's late result is rejected; the new owner's is stored
+    iid = taken[0]['incident_id']
+    assert not queue.complete('a', iid, ['AID-H-001'])
+    assert queue.complete('b', iid, ['AID-H-002'])
+    assert queue.results() == [{'incident_id': iid, 'matched_defense_ids': ['AID-H-002']}]
+
+
+def test_heartbeat_and_release(queue, incidents):
+    queue.claim('a', 2, lease=-1.0)
+    assert queue.heartbeat('a', LEASE) == 2     # Extended before anyone took them over
+    assert queue.release_expired() == 0
+    queue.claim('b', 2, lease=-1.0)
+    assert queue.release_expired() == 2
+    assert queue.counts()['pending'] == len(incidents) - 2     # Only a's two leases remain
+
+
+def test_error_rows_are_retried_until_max_attempts(queue):
+    iid = None
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        task = queue.claim(f'w{attempt}', 1, LEASE)[0]
+        iid = iid or task['incident_id']
+        assert task['incident_id'] == iid
+        assert queue.complete(f'w{attempt}', iid, ['LLM_ERROR'])
+        done = [r['incident_id'] for r in queue.results()]
+        assert (iid in done) == (attempt == MAX_ATTEMPTS)   # Accepted as final only on the last attempt
+    assert queue.counts()['errors'] == 1